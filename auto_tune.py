@@ -0,0 +1,267 @@
+"""自动调参：在亮度/对比度/阈值/抖动（灰度模式为对比度/Gamma/抖动）中搜索最像原图的参数
+
+评分用 quality_metrics.perceptual_score：转换结果和缩放后的原图都按观看距离模糊后
+比较 SSIM。搜索分两步:
+    1. 在缩小的代理图（默认最长边200像素）上并行评估整个参数网格
+    2. 取代理图上最好的几组和每类方法（误差扩散、有序抖动、阈值）最好的一组，
+       连同最优一组的相邻参数，在全分辨率上重新评分，选出最终参数
+400×300 的屏幕每张图约0.2-0.4秒。网格只包含速度快的抖动方式（PIL内置、有序抖动）；
+NumPy实现的误差扩散核逐列处理，慢一个数量级，需要时用 grid 参数自己加入。
+
+用法示例:
+    python auto_tune.py photo.jpg ui.png --profile 2.9
+    python auto_tune.py "photos/*.jpg" --grayscale -o tuned.json
+    python batch_converter.py photos/ -o out --auto-tune    # 批量转换时逐张调参
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dithering import ORDERED_MAPS
+from image_processor import ImageProcessor
+from pipeline import Pipeline
+from quality_metrics import VIEWING_BLUR, PerceptualScorer
+from tone_curve import ToneCurve, histogram, otsu_threshold, remap_histogram
+
+# 黑白抖动: 参数 → 候选值（全部组合）
+BW_GRID = {
+    'brightness': (0.6, 0.7, 0.8, 0.9, 1.0),
+    'contrast': (1.0, 1.15, 1.3, 1.45, 1.6),
+    'dither_kernel': (None, 'blue_noise'),
+}
+
+# 黑白阈值化: 相对 Otsu 阈值的偏移
+THRESHOLD_OFFSETS = (-48, -32, -16, 0, 16, 32, 48)
+
+# 灰度
+GRAY_GRID = {
+    'gray_contrast': (0.7, 0.8, 0.9, 1.0, 1.1),
+    'gamma': (0.8, 0.9, 1.0, 1.15, 1.3),
+    'gray_dither': (None, 'bayer4', 'blue_noise'),
+}
+
+# 全分辨率细化时相邻参数的步长，以及取值范围（与界面滑块一致）
+REFINE_STEPS = {'brightness': 0.05, 'contrast': 0.075, 'threshold': 8,
+                'gray_contrast': 0.05, 'gamma': 0.075}
+LIMITS = {'brightness': (0.5, 1.0), 'contrast': (1.0, 2.0), 'threshold': (1, 254),
+          'gray_contrast': (0.5, 1.5), 'gamma': (0.5, 2.0)}
+
+
+def _grid(table, **fixed):
+    """参数表的全部组合，每个组合为 {参数: 值}"""
+    combos = [dict(fixed)]
+    for name, values in table.items():
+        combos = [dict(c, **{name: v}) for c in combos for v in values]
+    return combos
+
+
+def candidates(settings, gray, grid=None):
+    """候选参数列表
+
+    gray 为缩放后的灰度图，用于确定阈值化候选的中心（Otsu 阈值）
+    """
+    if settings['grayscale']:
+        return _grid(grid or GRAY_GRID)
+    result = _grid(grid or BW_GRID, dithering=True)
+    curve = ToneCurve.from_settings(dict(settings, dithering=False))
+    hist = histogram(gray)
+    center = otsu_threshold(remap_histogram(hist, curve.lut(hist)))
+    low, high = LIMITS['threshold']
+    thresholds = sorted({min(max(center + d, low), high) for d in THRESHOLD_OFFSETS})
+    return result + [{'dithering': False, 'threshold': t} for t in thresholds]
+
+
+def neighbours(params):
+    """最优参数在连续参数上的相邻取值（每次只改一个参数）"""
+    result = []
+    for name, value in params.items():
+        if name not in REFINE_STEPS:
+            continue
+        low, high = LIMITS[name]
+        for sign in (-1, 1):
+            moved = value + sign * REFINE_STEPS[name]
+            moved = round(min(max(moved, low), high), 3) if name != 'threshold' else int(moved)
+            if low <= moved <= high and moved != value:
+                result.append(dict(params, **{name: moved}))
+    return result
+
+
+def _family(params):
+    """候选参数属于哪一类方法: 'diffusion' 误差扩散、'ordered' 有序抖动、'threshold' 阈值/量化"""
+    if 'gray_dither' in params:
+        method = params['gray_dither']
+        if method is None:
+            return 'threshold'
+    elif not params.get('dithering'):
+        return 'threshold'
+    else:
+        method = params.get('dither_kernel')
+    return 'ordered' if method in ORDERED_MAPS else 'diffusion'
+
+
+def _proxy(img, max_side):
+    """缩小的代理图（整数倍缩小），返回 (图像, 倍数)"""
+    factor = max(1, -(-max(img.size) // max_side))
+    if factor == 1:
+        return img, 1
+    return img.reduce(factor), factor
+
+
+class _Evaluator:
+    """在固定尺寸上对候选参数评分（可以在多个线程中同时调用）"""
+
+    def __init__(self, gray, settings, blur):
+        self.gray = gray
+        self.settings = dict(settings, width=gray.size[0], height=gray.size[1])
+        self.scorer = PerceptualScorer(gray, blur)
+
+    def __call__(self, params):
+        # 每个候选用自己的缓冲，线程之间互不干扰
+        pipeline = Pipeline.from_settings(dict(self.settings, **params))
+        pipeline.load(self.gray)
+        pipeline.process()
+        return self.scorer(pipeline.buffer)
+
+
+def tune(img, settings, workers=None, proxy_size=200, top=3, grid=None, blur=VIEWING_BLUR,
+         executor=None):
+    """搜索使转换结果最像原图的参数
+
+    参数:
+        img: 源图（尺寸不是 settings 的屏幕尺寸时先缩放）
+        settings: 转换参数（见 batch_converter.default_settings），决定屏幕尺寸和黑白/灰度
+        workers: 评估代理图的线程数（默认CPU核数，最多8）
+        proxy_size: 代理图的最长边
+        top: 代理图上最好的几组参数进入全分辨率评分（另外每类方法最好的一组也会进入）
+        grid: 自定义参数网格（格式同 BW_GRID / GRAY_GRID）
+        blur: 评分时模拟观看距离的模糊半径（全分辨率像素）
+        executor: 共用的线程池（不给时临时创建）
+    返回:
+        {'settings': 最优参数下的完整转换参数, 'params': 选中的参数, 'score': 全分辨率得分,
+         'candidates': 代理图候选数, 'refined': 全分辨率评估数, 'seconds': 耗时}
+    """
+    start = time.perf_counter()
+    width, height = settings['width'], settings['height']
+    if img.size != (width, height):
+        img = ImageProcessor(width, height, resample=settings['resample']).resize(img)
+    gray = img.convert('L') if img.mode != 'L' else img
+
+    options = candidates(settings, gray, grid)
+    proxy, factor = _proxy(gray, proxy_size)
+    # 代理图上抖动的网点是一个代理像素，模糊半径太小时网点没被平均掉，
+    # 抖动候选都只有约0.01分；所以代理图的模糊至少保持观看距离的模糊
+    evaluate_proxy = _Evaluator(proxy, settings, max(blur / factor, min(blur, VIEWING_BLUR)))
+    own_executor = executor is None
+    if own_executor:
+        executor = ThreadPoolExecutor(max_workers=workers or min(os.cpu_count() or 1, 8))
+    try:
+        proxy_scores = list(executor.map(evaluate_proxy, options))
+        ranked = sorted(range(len(options)), key=lambda i: -proxy_scores[i])
+        finalists = [options[i] for i in ranked[:top]]
+        # 每类方法（误差扩散、有序抖动、阈值/量化）最好的一组都进入全分辨率评分，
+        # 代理图对某一类评分偏差时不至于整类被淘汰
+        best_of_family = {}
+        for i in ranked:
+            best_of_family.setdefault(_family(options[i]), options[i])
+        finalists += [p for p in best_of_family.values() if p not in finalists]
+        finalists += [p for p in neighbours(finalists[0]) if p not in finalists]
+        evaluate_full = _Evaluator(gray, settings, blur)
+        full_scores = list(executor.map(evaluate_full, finalists))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    best = max(range(len(finalists)), key=lambda i: full_scores[i])
+    params = finalists[best]
+    return {
+        'settings': dict(settings, **params),
+        'params': params,
+        'score': round(full_scores[best], 5),
+        'candidates': len(options),
+        'refined': len(finalists),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def describe_params(params):
+    """参数的简短说明"""
+    if 'gray_contrast' in params:
+        return (f"对比度 {params['gray_contrast']:.2f}, Gamma {params['gamma']:.2f}, "
+                f"抖动 {params['gray_dither'] or '无'}")
+    if params['dithering']:
+        return (f"抖动 {params['dither_kernel'] or 'PIL内置'}, 亮度 {params['brightness']:.2f}, "
+                f"对比度 {params['contrast']:.2f}")
+    return f"阈值 {params['threshold']}"
+
+
+def tune_file(path, settings):
+    """打开并调参一个文件（可在工作进程中执行），出错时记录在 'error' 中"""
+    try:
+        processor = ImageProcessor(settings['width'], settings['height'],
+                                   resample=settings['resample'])
+        img = processor.open_image(path, shrink=settings['fast_load'])
+        result = tune(processor.resize(img), settings, workers=1)
+        result['path'] = path
+        result['error'] = None
+        return result
+    except Exception as e:
+        return {'path': path, 'error': f"{type(e).__name__}: {e}"}
+
+
+def main(argv=None):
+    from batch_converter import collect_inputs, default_settings
+    from panel_profiles import get_profile, profile_settings
+
+    parser = argparse.ArgumentParser(description="E-Paper 转换参数自动搜索")
+    parser.add_argument('inputs', nargs='+', help="图片文件、目录或通配符")
+    parser.add_argument('--profile', help="屏幕型号（默认按 config.py 的尺寸）")
+    parser.add_argument('--grayscale', action='store_true', help="搜索灰度模式参数")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="工作进程数（默认CPU核数），每个进程处理一张图")
+    parser.add_argument('-o', '--output', help="结果写入JSON文件（每张图的最优参数）")
+    args = parser.parse_args(argv)
+
+    settings = default_settings()
+    try:
+        if args.profile:
+            settings = profile_settings(get_profile(args.profile), settings)
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+    if args.grayscale:
+        settings['grayscale'] = True
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        print("✗ 没有找到图片")
+        return 1
+
+    print("="*50)
+    print(f"自动调参 {len(paths)} 张图片 ({settings['width']}×{settings['height']}, "
+          f"{'灰度' if settings['grayscale'] else '黑白'})")
+    print("="*50)
+    start = time.perf_counter()
+    if len(paths) == 1 or args.workers == 1:
+        results = [tune_file(path, settings) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            results = list(pool.map(tune_file, paths, [settings] * len(paths)))
+    for r in results:
+        name = os.path.basename(r['path'])
+        if r['error']:
+            print(f"  ✗ {name}: {r['error']}")
+        else:
+            print(f"  {name}: {describe_params(r['params'])}  "
+                  f"(得分 {r['score']:.4f}, {r['seconds'] * 1000:.0f} ms)")
+    print(f"\n共耗时 {time.perf_counter() - start:.2f} s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({r['path']: r.get('params') for r in results}, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+    return 0 if all(r['error'] is None for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,416 @@
+"""批量转换：把目录/通配符匹配到的图片并行转换为点阵数据
+
+用法示例:
+    python batch_converter.py assets/ -o build/epaper
+    python batch_converter.py "photos/*.jpg" logo.png -o out -j 8 --format both
+    python batch_converter.py assets/ -o out --profiles 2.9,4.2,7.5   # 每个型号一个子目录
+    python batch_converter.py assets/ -o out --stage-summary --stage-log stages.jsonl
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import config
+from image_processor import ImageProcessor
+from matrix_converter import Layout
+from pipeline import Pipeline
+from tiled import TiledPipeline
+from output_generator import OutputGenerator
+from conversion_cache import ConversionCache
+from panel_profiles import PANEL_PROFILES, parse_profiles, profile_settings
+import auto_tune
+import compression
+import instrumentation
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+
+
+def default_settings():
+    """从 config.py 读取转换参数"""
+    return {
+        'width': config.EPAPER_WIDTH,
+        'height': config.EPAPER_HEIGHT,
+        'fast_load': config.FAST_LOAD,
+        'resample': config.RESAMPLE,
+        'grayscale': config.USE_GRAYSCALE,
+        'levels': config.GRAYSCALE_LEVELS,
+        'gray_dither': config.GRAYSCALE_DITHER,
+        'dither_kernel': config.DITHER_KERNEL,
+        'threshold': config.THRESHOLD,
+        'dithering': config.DITHERING,
+        'brightness': config.BRIGHTNESS_FACTOR,
+        'contrast': config.CONTRAST_FACTOR,
+        'gray_brightness': config.GRAY_BRIGHTNESS,
+        'gray_contrast': config.GRAY_CONTRAST,
+        'gamma': config.GAMMA,
+        'auto_levels': config.AUTO_LEVELS,
+        'equalize': config.EQUALIZE,
+        'layout': Layout().to_dict(),
+        'band_height': config.BAND_HEIGHT,
+    }
+
+
+def process_image(img, settings, processor=None, pipeline=None):
+    """缩放→二值化/灰度→打包
+
+    缩放之后在 pipeline.Pipeline 的缓冲中原地处理，结果与
+    ImageProcessor.convert_to_bw / convert_to_grayscale + MatrixConverter 逐位一致
+
+    settings['band_height'] 不为空时改为分条带处理（见 tiled.TiledPipeline，
+    结果相同，中间结果的内存只与条带大小有关），此时 processor、pipeline 不使用
+
+    返回 (处理后的预览图, 点阵数据bytes, 模式)
+    """
+    if settings.get('band_height'):
+        tiled = TiledPipeline.from_settings(settings)
+        data = tiled.run(img)
+        return tiled.preview(), data, tiled.mode
+
+    width, height = settings['width'], settings['height']
+    processor = processor or ImageProcessor(width, height, resample=settings['resample'])
+    pipeline = pipeline or Pipeline.from_settings(settings)
+
+    pipeline.load(processor.resize(img))
+    pipeline.process()
+    img_processed = pipeline.preview()
+    data = pipeline.pack()
+    return img_processed, data, pipeline.mode
+
+
+def c_identifier(name):
+    """把文件名变成合法的C变量名"""
+    ident = re.sub(r'\W', '_', name, flags=re.ASCII)
+    if not ident or ident[0].isdigit():
+        ident = 'image_' + ident
+    return ident
+
+
+def collect_inputs(patterns, recursive=False):
+    """展开目录和通配符，返回去重排序后的图片路径列表"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            sub = '**' if recursive else ''
+            found = glob.glob(os.path.join(pattern, sub, '*'), recursive=recursive)
+            paths.extend(p for p in found
+                         if os.path.isfile(p) and p.lower().endswith(IMAGE_EXTENSIONS))
+        elif any(c in pattern for c in '*?['):
+            paths.extend(p for p in glob.glob(pattern, recursive=recursive)
+                         if os.path.isfile(p))
+        else:
+            # 明确给出的文件直接加入，不存在时在转换阶段报告失败
+            paths.append(pattern)
+    return sorted(set(os.path.normpath(p) for p in paths))
+
+
+def output_names(paths):
+    """为每个输入分配输出文件名（不含扩展名），重名时加序号"""
+    names = {}
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 1
+        while name.lower() in used:
+            n += 1
+            name = f"{stem}_{n}"
+        used.add(name.lower())
+        names[path] = name
+    return names
+
+
+def write_outputs(data, out_base, output_format='h', codec=None):
+    """写出 .h / .bin 数据文件
+
+    codec 为压缩方式（'auto' 表示选最小的），不压缩时为None。
+    返回压缩统计（见 compression.report），不压缩时返回None
+    """
+    generator = OutputGenerator()
+    var_name = c_identifier(os.path.basename(out_base))
+    if codec is None:
+        if output_format in ('h', 'both'):
+            generator.save_c_array(data, out_base + '.h', var_name)
+        if output_format in ('bin', 'both'):
+            generator.generate_binary(data, out_base + '.bin')
+        return None
+
+    if codec == 'auto':
+        codec, packed = compression.best_codec(data)
+        if codec is None:
+            # 压缩后反而更大，保持原始数据
+            return write_outputs(data, out_base, output_format)
+    else:
+        packed = compression.compress(data, codec)
+    if output_format in ('h', 'both'):
+        with open(out_base + '.h', 'w', encoding='utf-8') as f:
+            generator.write_compressed_c_array(packed, f, var_name, codec, len(data))
+    if output_format in ('bin', 'both'):
+        generator.generate_binary(packed, out_base + '.bin')
+    return compression.report(data, packed, codec)
+
+
+def convert_file(path, targets, output_format='h', cache=None, codec=None):
+    """把单个文件转换到一个或多个目标（在工作进程中执行）
+
+    targets 为 [(型号名或None, 转换参数, 输出路径前缀), ...]。
+    源图按各目标自己需要的缩小倍数解码（倍数相同的目标共用一次解码，不缩小解码时
+    只解码一次），再分别缩放、抖动、打包，每个目标的结果与单独转换时相同；
+    给出 cache 时先按源文件哈希和参数逐个查缓存，全部命中时完全不用解码。
+    返回结果字典，每个目标的结果在 'outputs' 中；出错时不抛异常，而是记录在 'error' 中
+    """
+    result = {'path': path, 'ok': False, 'error': None, 'outputs': [],
+              'in_bytes': 0, 'out_bytes': 0, 'seconds': 0.0}
+    start = time.perf_counter()
+    try:
+        result['in_bytes'] = os.path.getsize(path)
+        source_hash = cache.file_hash(path) if cache is not None else None
+        decoded = {}
+
+        for profile, settings, out_base in targets:
+            processor = ImageProcessor(settings['width'], settings['height'],
+                                       resample=settings['resample'])
+            output = {'profile': profile, 'cache': None}
+            cached = None
+            if cache is not None:
+                key = cache.make_key(source_hash, settings)
+                cached = cache.get(key)
+                output['cache'] = 'hit' if cached else 'miss'
+
+            if cached:
+                data, preview_path, mode = cached
+                output['packing'] = write_outputs(data, out_base, output_format, codec)
+                cache.copy_preview(preview_path, out_base + '_preview.png')
+            else:
+                # 第一次需要时解码；缩小解码的倍数按各目标自己的尺寸选，倍数相同的目标共用一次解码
+                img = processor.open_image(path, shrink=settings['fast_load'], decoded=decoded)
+                result['decode_time'] = (result.get('decode_time', 0.0)
+                                         + processor.last_load['decode_time'])
+                if settings.get('auto_tune'):
+                    tuned = auto_tune.tune(processor.resize(img), settings, workers=1)
+                    settings = tuned['settings']
+                    output['tuned'] = tuned['params']
+                img_processed, data, mode = process_image(img, settings, processor)
+                output['packing'] = write_outputs(data, out_base, output_format, codec)
+                img_processed.save(out_base + '_preview.png')
+                if cache is not None:
+                    cache.put(key, data, img_processed, mode)
+
+            output['mode'] = mode
+            output['out_bytes'] = len(data)
+            result['outputs'].append(output)
+
+        result['ok'] = True
+        result['out_bytes'] = sum(o['out_bytes'] for o in result['outputs'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def convert_file_instrumented(path, targets, output_format='h', cache=None, codec=None,
+                              memory=False):
+    """convert_file 并记录各阶段的耗时（memory=True 时还有内存峰值），记录列表放在结果的 'stages' 中"""
+    with instrumentation.recording(memory) as recorder:
+        with recorder.context(image=path):
+            result = convert_file(path, targets, output_format, cache, codec)
+    result['stages'] = recorder.records
+    return result
+
+
+def batch_targets(path, name, out_dir, settings, profiles=None):
+    """单个文件的输出目标列表（见 convert_file）；给出 profiles 时每个型号输出到同名子目录"""
+    if not profiles:
+        return [(None, settings, os.path.join(out_dir, name))]
+    return [(profile.name, profile_settings(profile, settings),
+             os.path.join(out_dir, profile.name, name))
+            for profile in profiles]
+
+
+def describe_output(output):
+    """一个输出目标的结果说明"""
+    text = f"{output['out_bytes']} 字节"
+    if output['profile']:
+        text = f"{output['profile']}: {text}"
+    if output['cache'] == 'hit':
+        text += " (缓存)"
+    if output.get('tuned'):
+        text += f" [{auto_tune.describe_params(output['tuned'])}]"
+    packing = output['packing']
+    if packing:
+        text += (f", {packing['codec']} {packing['packed_bytes']} 字节"
+                 f" ({packing['ratio']:.1f}:1, 解码约 {packing['decode_ops']} 次操作)")
+    return text
+
+
+def run_batch(paths, out_dir, settings, workers=None, output_format='h', cache=None,
+              codec=None, profiles=None, instrument=False):
+    """用进程池并行转换，逐个打印结果，返回 (结果列表, 总耗时)
+
+    给出 profiles（PanelProfile 列表）时每张图转换到每个型号，缩小解码倍数相同的型号共用一次解码；
+    instrument 为 'time' 或 'memory' 时记录每张图各阶段的耗时（和内存峰值），见结果中的 'stages'；
+    给出 cache 时，结束后按LRU淘汰超出容量的条目；
+    给出 codec 时，在输出目录中附上用到的参考C解码器
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for profile in profiles or ():
+        os.makedirs(os.path.join(out_dir, profile.name), exist_ok=True)
+    names = output_names(paths)
+    results = []
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for path in paths:
+            args = (path, batch_targets(path, names[path], out_dir, settings, profiles),
+                    output_format, cache, codec)
+            if instrument:
+                future = pool.submit(convert_file_instrumented, *args, instrument == 'memory')
+            else:
+                future = pool.submit(convert_file, *args)
+            futures[future] = path
+        for i, future in enumerate(as_completed(futures), 1):
+            result = future.result()
+            results.append(result)
+            if result['ok']:
+                outputs = ', '.join(describe_output(o) for o in result['outputs'])
+                print(f"[{i}/{len(paths)}] ✓ {result['path']} → {outputs}")
+            else:
+                print(f"[{i}/{len(paths)}] ✗ {result['path']}: {result['error']}")
+
+    outputs = [o for r in results if r['ok'] for o in r['outputs']]
+    generator = OutputGenerator()
+    for used in sorted({o['packing']['codec'] for o in outputs if o['packing']}):
+        generator.save_decoder_source(used, out_dir)
+
+    if cache is not None:
+        # 各进程的命中统计汇总到主进程的缓存对象
+        cache.hits += sum(o['cache'] == 'hit' for o in outputs)
+        cache.misses += sum(o['cache'] == 'miss' for o in outputs)
+        cache.evict()
+
+    return results, time.perf_counter() - start
+
+
+def print_summary(results, elapsed, cache=None, show_stages=False):
+    """打印汇总和吞吐量；show_stages=True 时附上各阶段的耗时统计"""
+    ok = [r for r in results if r['ok']]
+    failed = [r for r in results if not r['ok']]
+    in_mb = sum(r['in_bytes'] for r in ok) / (1024 * 1024)
+    out_kb = sum(r['out_bytes'] for r in ok) / 1024
+    elapsed = max(elapsed, 1e-9)
+
+    print("\n" + "="*50)
+    print(f"成功: {len(ok)}  失败: {len(failed)}  耗时: {elapsed:.2f} s")
+    print(f"吞吐量: {len(ok) / elapsed:.1f} 张/s, {in_mb / elapsed:.2f} MB/s (源文件 {in_mb:.1f} MB)")
+    outputs = [o for r in ok for o in r['outputs']]
+    if len(outputs) > len(ok):
+        print(f"输出数据: {out_kb:.1f} KB（{len(outputs)} 个目标）")
+    else:
+        print(f"输出数据: {out_kb:.1f} KB")
+    packed = [o['packing'] for o in outputs if o['packing']]
+    if packed:
+        raw = sum(p['raw_bytes'] for p in packed)
+        size = sum(p['packed_bytes'] for p in packed)
+        print(f"压缩后: {size / 1024:.1f} KB ({raw / size:.1f}:1)")
+    decoded = [r['decode_time'] for r in ok if 'decode_time' in r]
+    if decoded:
+        print(f"平均解码耗时: {sum(decoded) / len(decoded) * 1000:.1f} ms")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"缓存: 命中 {stats['hits']}  未命中 {stats['misses']}  "
+              f"命中率 {stats['hit_rate']:.0%}  "
+              f"占用 {stats['bytes'] / (1024 * 1024):.1f} MB ({stats['entries']} 条)")
+    stages = [record for r in results for record in r.get('stages', ())]
+    if show_stages and stages:
+        print("\n各阶段耗时（所有工作进程合计）:")
+        print(instrumentation.format_summary(instrumentation.summarize(stages)))
+    if failed:
+        print("\n失败列表:")
+        for r in failed:
+            print(f"  {r['path']}: {r['error']}")
+    print("="*50)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-Paper 图片批量转点阵工具")
+    parser.add_argument('inputs', nargs='+', help="图片文件、目录或通配符")
+    parser.add_argument('-o', '--output-dir', required=True, help="输出目录")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="工作进程数（默认CPU核数）")
+    parser.add_argument('-r', '--recursive', action='store_true', help="递归搜索子目录")
+    parser.add_argument('--format', choices=('h', 'bin', 'both'), default='h',
+                        help="输出格式（默认C头文件）")
+    parser.add_argument('--cache-dir', help="转换缓存目录（不指定则不使用缓存）")
+    parser.add_argument('--cache-size', type=float, default=256,
+                        help="缓存容量上限，单位MB（默认256）")
+    parser.add_argument('--codec', choices=('none', 'auto') + tuple(compression.CODECS),
+                        default='none', help="压缩方式（auto=每个文件选最小的）")
+    parser.add_argument('--profiles',
+                        help="屏幕型号，逗号分隔，每张图解码后分别输出到各型号子目录"
+                             f"（可选: {', '.join(PANEL_PROFILES)}；不指定时使用 config.py 的尺寸）")
+    parser.add_argument('--auto-tune', action='store_true',
+                        help="每张图自动搜索亮度/对比度/阈值/抖动参数（见 auto_tune.py）")
+    parser.add_argument('--band-height', type=int, default=None,
+                        help="分条带处理，每个条带的行数（超大屏幕/超大图片时限制内存，结果不变）")
+    parser.add_argument('--stage-summary', action='store_true',
+                        help="统计各阶段（解码、缩放、抖动、打包、输出）的耗时、CPU时间和内存峰值")
+    parser.add_argument('--stage-log', help="把每张图各阶段的记录写成JSON Lines文件")
+    parser.add_argument('--stage-memory', action='store_true',
+                        help="同时统计各阶段的内存峰值（tracemalloc，会拖慢纯Python阶段）")
+    args = parser.parse_args(argv)
+
+    profiles = None
+    if args.profiles:
+        try:
+            profiles = parse_profiles(args.profiles)
+        except ValueError as e:
+            print(f"✗ {e}")
+            return 1
+
+    paths = collect_inputs(args.inputs, args.recursive)
+    if not paths:
+        print("✗ 没有找到图片")
+        return 1
+
+    settings = default_settings()
+    if args.band_height:
+        settings['band_height'] = args.band_height
+    if args.auto_tune:
+        # 调参结果由源图决定，放进参数中也使缓存键与不调参时区分开
+        settings['auto_tune'] = True
+    mode_str = f"{settings['levels']}级灰度" if settings['grayscale'] else "黑白"
+    print("="*50)
+    if profiles:
+        print(f"批量转换 {len(paths)} 张图片 → {len(profiles)} 个型号")
+        for profile in profiles:
+            print(f"  {profile.name}: {profile.width}×{profile.height} {profile.mode}"
+                  f"{'' if profile.layout == Layout() else ' ' + repr(profile.layout)}  {profile.description}")
+    else:
+        print(f"批量转换 {len(paths)} 张图片 ({settings['width']}×{settings['height']}, {mode_str})")
+    print("="*50)
+
+    cache = None
+    if args.cache_dir:
+        cache = ConversionCache(args.cache_dir, int(args.cache_size * 1024 * 1024))
+
+    stage_mode = None
+    if args.stage_summary or args.stage_log or args.stage_memory:
+        stage_mode = 'memory' if args.stage_memory else 'time'
+    results, elapsed = run_batch(paths, args.output_dir, settings,
+                                 args.workers, args.format, cache,
+                                 None if args.codec == 'none' else args.codec, profiles,
+                                 instrument=stage_mode)
+    if args.stage_log:
+        with open(args.stage_log, 'w', encoding='utf-8') as f:
+            for r in results:
+                for record in r.get('stages', ()):
+                    f.write(json.dumps(record, ensure_ascii=False) + '\n')
+    print_summary(results, elapsed, cache, show_stages=args.stage_summary)
+    return 0 if all(r['ok'] for r in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+"""性能基准：逐阶段计时（加载、缩放、色调/抖动、打包、输出、回读），并与基线比较
+
+JPEG 输入另外在新进程中实测全尺寸解码和缩小解码（FAST_LOAD）的内存峰值。
+
+输入图片由程序生成（照片类噪声、渐变、扁平界面），不依赖外部文件。
+每个阶段重复若干次取中位数，结果写成JSON；给出基线时，任一阶段
+比基线慢超过容差就返回非0，可以直接放进CI。
+
+用法示例:
+    python benchmark.py                                  # 运行并打印结果
+    python benchmark.py --save-baseline bench_base.json  # 保存为基线
+    python benchmark.py --baseline bench_base.json -o bench.json
+    python benchmark.py --sizes small --repeat 3 --grayscale
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw
+from batch_converter import default_settings
+from c_array_reader import read_c_array
+from image_processor import ImageProcessor, measure_decode
+from matrix_decoder import MatrixDecoder
+from output_generator import OutputGenerator
+from pipeline import Pipeline
+
+# 输入尺寸
+SIZES = {
+    'small': (800, 600),
+    'medium': (1920, 1080),
+    'large': (4000, 3000),
+}
+
+# 输入内容 → 保存格式
+KINDS = {
+    'photo': 'JPEG',      # 照片类：大块明暗 + 细噪声
+    'gradient': 'PNG',    # 平滑渐变（最容易出色带）
+    'ui': 'PNG',          # 扁平界面：纯色块、细线、文字
+}
+
+STAGES = ('load', 'resize', 'tone', 'pack', 'emit', 'decode')
+
+
+def make_image(kind, size, seed=0):
+    """生成一张合成测试图"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    if kind == 'photo':
+        # 低分辨率随机块放大成柔和的明暗，再叠加细噪声
+        coarse = rng.integers(0, 256, (9, 12, 3), dtype=np.uint8)
+        base = np.asarray(Image.fromarray(coarse).resize(size, Image.BICUBIC), dtype=np.int16)
+        noise = rng.normal(0, 18, (height, width, 1)).astype(np.int16)
+        return Image.fromarray(np.clip(base + noise, 0, 255).astype(np.uint8))
+    if kind == 'gradient':
+        x = np.linspace(0, 255, width, dtype=np.float32)[None, :]
+        y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+        rgb = np.stack([np.broadcast_to(x, (height, width)),
+                        np.broadcast_to(y, (height, width)),
+                        (x + y) / 2 * np.ones((height, 1), dtype=np.float32)], axis=2)
+        return Image.fromarray(rgb.astype(np.uint8))
+    if kind == 'ui':
+        img = Image.new('RGB', size, 'white')
+        draw = ImageDraw.Draw(img)
+        scale = max(1, width // 400)
+        for _ in range(40):
+            x0, y0 = int(rng.integers(0, width)), int(rng.integers(0, height))
+            x1, y1 = x0 + int(rng.integers(20, width // 3)), y0 + int(rng.integers(10, height // 6))
+            shade = int(rng.choice([0, 64, 128, 200, 230]))
+            draw.rectangle((x0, y0, x1, y1), fill=(shade,) * 3, outline='black', width=scale)
+        for row in range(0, height, 12 * scale):
+            draw.text((8 * scale, row), "E-Paper 0123456789 ABCDEFG", fill='black')
+        return img
+    raise ValueError(f"不支持的测试图类型: {kind}，请使用 {' / '.join(KINDS)}")
+
+
+def make_inputs(directory, sizes, kinds):
+    """生成测试图片文件，返回 [(用例名, 路径), ...]"""
+    cases = []
+    for size_name in sizes:
+        size = SIZES[size_name]
+        for kind in kinds:
+            fmt = KINDS[kind]
+            ext = '.jpg' if fmt == 'JPEG' else '.png'
+            path = os.path.join(directory, f"{kind}_{size_name}{ext}")
+            make_image(kind, size).save(path, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+            cases.append((f"{kind}_{size[0]}x{size[1]}", path))
+    return cases
+
+
+def _median_time(fn, repeat, setup=None):
+    """重复执行取中位耗时（秒），并返回最后一次的结果
+
+    setup 在每次计时之前调用（不计时），用于恢复被原地修改的输入
+    """
+    times = []
+    result = None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def bench_case(path, settings, repeat=5, workdir=None):
+    """对一张图片逐阶段计时，返回 {阶段: 毫秒}（含 'total' 端到端）
+
+    每个阶段的输入是上一阶段的结果，只计本阶段的耗时；色调/抖动和打包走
+    pipeline.Pipeline（与 process_image、转换服务、自动调参相同的路径）
+    """
+    width, height = settings['width'], settings['height']
+    processor = ImageProcessor(width, height, resample=settings['resample'])
+    pipeline = Pipeline.from_settings(settings)
+    decoder = MatrixDecoder(width, height)
+    generator = OutputGenerator()
+    mode = pipeline.mode
+    out_path = os.path.join(workdir or tempfile.gettempdir(), 'benchmark_output.h')
+
+    def tone(img):
+        pipeline.load(img)
+        pipeline.process()
+        return pipeline.buffer.copy()
+
+    def emit(data):
+        with open(out_path, 'w', encoding='utf-8') as f:
+            generator.write_c_array(data, f, 'benchmark_image')
+
+    def decode():
+        return decoder.decode(read_c_array(out_path, 'benchmark_image'), mode)
+
+    def end_to_end():
+        img = processor.open_image(path, shrink=settings['fast_load'])
+        emit(pipeline.run(processor.resize(img)))
+        return decode()
+
+    timings = {}
+    timings['load'], img = _median_time(
+        lambda: processor.open_image(path, shrink=settings['fast_load']), repeat)
+    timings['resize'], img_resized = _median_time(lambda: processor.resize(img), repeat)
+    timings['tone'], processed = _median_time(lambda: tone(img_resized), repeat)
+    # 打包会把缓冲原地换成编码，每次计时前放回处理后的灰度
+    timings['pack'], data = _median_time(pipeline.pack, repeat,
+                                         setup=lambda: np.copyto(pipeline.buffer, processed))
+    timings['emit'], _ = _median_time(lambda: emit(data), repeat)
+    timings['decode'], restored = _median_time(decode, repeat)
+    timings['total'], _ = _median_time(end_to_end, repeat)
+
+    if restored.shape != (height, width):
+        raise ValueError(f"回读尺寸不对: {restored.shape}")
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+def decode_memory_case(path, settings):
+    """全尺寸解码和缩小解码（FAST_LOAD）各在一个新进程中的内存峰值，以及按像素数的估算（MB）"""
+    mb = 1024 * 1024
+    result = {}
+    for label, shrink in (('full', False), ('shrink', True)):
+        load = measure_decode(path, settings['width'], settings['height'], shrink)
+        peak = load['peak_bytes']
+        result[f'{label}_mb'] = round(peak / mb, 1) if peak is not None else float('nan')
+        result[f'{label}_estimate_mb'] = round(load['decoded_bytes'] / mb, 1)
+    return result
+
+
+def environment():
+    """运行环境（比较不同机器上的结果时用来提示）"""
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'system': platform.system(),
+    }
+
+
+def run(sizes=('small', 'medium', 'large'), kinds=tuple(KINDS), repeat=5, settings=None):
+    """生成输入并逐个用例计时，返回结果字典"""
+    settings = settings or default_settings()
+    results = {}
+    decode_memory = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        inputs = make_inputs(workdir, sizes, kinds)
+        for name, path in inputs:
+            results[name] = bench_case(path, settings, repeat, workdir)
+            row = '  '.join(f"{stage} {results[name][stage]:8.2f}" for stage in STAGES + ('total',))
+            print(f"  {name:<18} {row}")
+        jpegs = [(name, path) for name, path in inputs if path.endswith('.jpg')]
+        if jpegs:
+            print("\n解码内存峰值（新进程中实测 / 按像素数估算，MB）:")
+        for name, path in jpegs:
+            decode_memory[name] = decode_memory_case(path, settings)
+            print("  {:<18} 全尺寸解码 {full_mb:8.1f} / {full_estimate_mb:8.1f}   "
+                  "缩小解码 {shrink_mb:8.1f} / {shrink_estimate_mb:8.1f}".format(
+                      name, **decode_memory[name]))
+    return {
+        'environment': environment(),
+        'settings': settings,
+        'repeat': repeat,
+        'results': results,
+        'decode_memory': decode_memory,
+    }
+
+
+def compare(current, baseline, tolerance=0.25, min_ms=1.0):
+    """与基线比较，返回退步列表 [(用例, 阶段, 基线ms, 当前ms), ...]
+
+    比基线慢超过 tolerance（比例）且超过 min_ms（毫秒，过滤计时抖动）才算退步
+    """
+    regressions = []
+    for name, stages in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        for stage, ms in stages.items():
+            if stage not in base:
+                continue
+            if ms > base[stage] * (1 + tolerance) and ms - base[stage] > min_ms:
+                regressions.append((name, stage, base[stage], ms))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-Paper 转换各阶段性能基准")
+    parser.add_argument('--sizes', default=','.join(SIZES),
+                        help=f"输入尺寸，逗号分隔（可选: {', '.join(SIZES)}）")
+    parser.add_argument('--kinds', default=','.join(KINDS),
+                        help=f"输入内容，逗号分隔（可选: {', '.join(KINDS)}）")
+    parser.add_argument('--repeat', type=int, default=5, help="每个阶段重复次数，取中位数（默认5）")
+    parser.add_argument('--grayscale', action='store_true', help="测灰度模式（默认按 config.py）")
+    parser.add_argument('-o', '--output', help="结果写入JSON文件")
+    parser.add_argument('--baseline', help="与该基线JSON比较，有退步时返回1")
+    parser.add_argument('--save-baseline', help="把本次结果保存为基线")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="允许比基线慢的比例（默认0.25，即25%%）")
+    parser.add_argument('--min-ms', type=float, default=1.0,
+                        help="差值小于该毫秒数时不算退步（默认1.0）")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    kinds = [k.strip() for k in args.kinds.split(',') if k.strip()]
+    for value, table in [(s, SIZES) for s in sizes] + [(k, KINDS) for k in kinds]:
+        if value not in table:
+            print(f"✗ 未知的选项: {value}，可选 {' / '.join(table)}")
+            return 1
+    settings = default_settings()
+    if args.grayscale:
+        settings['grayscale'] = True
+
+    mode_str = f"{settings['levels']}级灰度" if settings['grayscale'] else "黑白"
+    print("="*50)
+    print(f"性能基准 ({settings['width']}×{settings['height']}, {mode_str}, "
+          f"重复 {args.repeat} 次取中位数, 单位 ms)")
+    print("="*50)
+    report = run(sizes, kinds, args.repeat, settings)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"\n结果已写入 {path}")
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != report['environment']:
+        print("\n注意: 基线来自不同的运行环境，比较结果仅供参考")
+    if baseline.get('settings') != report['settings']:
+        print("注意: 基线的转换参数与本次不同")
+    regressions = compare(report, baseline, args.tolerance, args.min_ms)
+    if not regressions:
+        print(f"\n✓ 没有阶段比基线慢超过 {args.tolerance:.0%}")
+        return 0
+    print(f"\n✗ {len(regressions)} 个阶段比基线慢超过 {args.tolerance:.0%}:")
+    for name, stage, base, ms in regressions:
+        print(f"  {name} {stage}: {base:.2f} → {ms:.2f} ms (+{(ms / base - 1):.0%})")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
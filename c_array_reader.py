@@ -0,0 +1,114 @@
+"""从 .h 文件读取C数组（导出结果的反向解析）"""
+import mmap
+import re
+
+# 数组声明: name[15000] = {  /  name[][15000] = {
+ARRAY_RE = re.compile(rb'(\w+)\s*((?:\[\s*\w*\s*\])+)\s*=\s*\{')
+DIM_RE = re.compile(rb'\[\s*(\w*)\s*\]')
+COMMENT_RE = re.compile(rb'//[^\n]*|/\*.*?\*/', re.DOTALL)
+HEX_RE = re.compile(rb'0[xX]([0-9A-Fa-f]{1,2})\b')
+# 数组体中的花括号（多维数组的嵌套初始化）和注释，用于找到与开头配对的 '}'
+BRACE_RE = re.compile(rb'[{}]|//[^\n]*|/\*.*?\*/', re.DOTALL)
+# 快速路径中要删掉的分隔符（含嵌套初始化的花括号）
+SEPARATORS = b', \t\r\n{}'
+
+
+def _declared_size(dims):
+    """由 [a][b] 计算声明的元素总数，含空维度或宏时返回None"""
+    size = 1
+    for dim in DIM_RE.findall(dims):
+        if not dim.isdigit():
+            return None
+        size *= int(dim)
+    return size
+
+
+def _decode_hex(body):
+    """把数组体中的十六进制字面量解码为bytes"""
+    if b'/' in body:
+        body = COMMENT_RE.sub(b'', body)
+
+    # 快速路径：全部是两位的 0xNN，去掉前缀和分隔符后整体 fromhex
+    count = body.count(b'0x') + body.count(b'0X')
+    compact = body.replace(b'0x', b'').replace(b'0X', b'').translate(None, SEPARATORS)
+    if len(compact) == 2 * count:
+        try:
+            return bytes.fromhex(compact.decode('ascii'))
+        except ValueError:
+            pass
+
+    # 慢速路径：逐个匹配（兼容 0x0 这类一位写法）
+    return bytes(int(h, 16) for h in HEX_RE.findall(body))
+
+
+def _body_end(mm, start):
+    """与数组开头 '{' 配对的 '}' 的位置（按花括号层数计数，跳过注释），没有时返回-1"""
+    # 常见情况：一维数组、数组体中没有注释，第一个 '}' 就是结尾
+    end = mm.find(b'}', start)
+    if end >= 0 and mm.find(b'{', start, end) < 0 and mm.find(b'/', start, end) < 0:
+        return end
+    depth = 1
+    for match in BRACE_RE.finditer(mm, start):
+        token = match.group()
+        if token == b'{':
+            depth += 1
+        elif token == b'}':
+            depth -= 1
+            if depth == 0:
+                return match.start()
+    return -1
+
+
+def _scan(mm):
+    """遍历文件中的数组声明，产生 (变量名, 声明大小, 数组体起止位置)"""
+    pos = 0
+    while True:
+        match = ARRAY_RE.search(mm, pos)
+        if match is None:
+            return
+        start = match.end()
+        end = _body_end(mm, start)
+        if end < 0:
+            raise ValueError(f"数组 {match.group(1).decode()} 缺少结尾的 '}}'")
+        yield match.group(1).decode(), _declared_size(match.group(2)), start, end
+        pos = end + 1
+
+
+def _open_mmap(filename):
+    with open(filename, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def find_c_arrays(filename):
+    """列出文件中的所有数组，返回 [(变量名, 声明大小), ...]"""
+    mm = _open_mmap(filename)
+    if mm is None:
+        return []
+    with mm:
+        return [(name, size) for name, size, _, _ in _scan(mm)]
+
+
+def read_c_array(filename, var_name=None):
+    """读取指定名称的数组（默认第一个），返回bytes
+
+    需要NumPy数组时用 np.frombuffer(data, dtype=np.uint8)，不会复制。
+    声明了大小时会与实际解析到的字节数比对，不一致则抛出 ValueError。
+    """
+    mm = _open_mmap(filename)
+    if mm is None:
+        raise ValueError(f"{filename} 是空文件")
+
+    with mm:
+        for name, size, start, end in _scan(mm):
+            if var_name is None or name == var_name:
+                data = _decode_hex(mm[start:end])
+                if size is not None and size != len(data):
+                    raise ValueError(
+                        f"数组 {name} 声明为 {size} 字节，实际解析到 {len(data)} 字节")
+                return data
+
+    if var_name is None:
+        raise ValueError(f"{filename} 中没有找到C数组")
+    raise ValueError(f"{filename} 中没有找到数组 {var_name}")
@@ -0,0 +1,304 @@
+"""点阵数据压缩：PackBits（游程）和 LZSS（LZ77族）
+
+每种编码都有 Python 解码器（用于导出时的往返校验）
+和一份可以直接放进固件工程的参考C解码器。
+
+PackBits 格式（与 TIFF/Apple 相同）:
+    n = 0..127     后面 n+1 个字节原样复制
+    n = -1..-127   下一个字节重复 1-n 次（2..128次）
+    n = -128       空操作
+
+LZSS 格式（12位窗口，4位长度）:
+    每 8 个记号前有一个标志字节，从低位开始，1=原样字节，0=匹配
+    匹配占2字节: b0 = (距离-1) 低8位, b1 = (距离-1) 高4位 << 4 | (长度-3)
+    距离 1..4096，长度 3..18，允许与输出重叠（用于长游程）
+"""
+import numpy as np
+from instrumentation import stage
+
+LZSS_WINDOW = 4096
+LZSS_MIN_MATCH = 3
+LZSS_MAX_MATCH = 18
+# 每个位置最多尝试的历史候选数（越大压缩率越高、越慢）
+LZSS_MAX_CANDIDATES = 32
+
+
+def packbits_encode(data):
+    """PackBits编码"""
+    data = bytes(data)
+    out = bytearray()
+    literal = bytearray()
+
+    def flush_literal():
+        for i in range(0, len(literal), 128):
+            chunk = literal[i:i + 128]
+            out.append(len(chunk) - 1)
+            out.extend(chunk)
+        literal.clear()
+
+    for start, length, value in _byte_runs(data):
+        if length < 3:
+            # 短游程按原样字节处理更省
+            literal.extend(data[start:start + length])
+            continue
+        flush_literal()
+        while length >= 3:
+            count = min(length, 128)
+            out.append(257 - count)  # -(count-1) 的补码
+            out.append(value)
+            length -= count
+        literal.extend(bytes([value]) * length)
+    flush_literal()
+    return bytes(out)
+
+
+def packbits_decode(data, size=None):
+    """PackBits解码，size 给出时解码到该长度为止"""
+    out = bytearray()
+    i, n = 0, len(data)
+    while i < n and (size is None or len(out) < size):
+        header = data[i]
+        i += 1
+        if header < 128:
+            out += data[i:i + header + 1]
+            i += header + 1
+        elif header != 128:
+            out += bytes([data[i]]) * (257 - header)
+            i += 1
+    return bytes(out if size is None else out[:size])
+
+
+def _byte_runs(data):
+    """连续相同字节的游程 [(起点, 长度, 字节值), ...]"""
+    if not data:
+        return []
+    arr = np.frombuffer(data, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(arr[1:] != arr[:-1]) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(arr)])))
+    return zip(starts.tolist(), lengths.tolist(), arr[starts].tolist())
+
+
+def lzss_encode(data):
+    """LZSS编码（贪心匹配，3字节前缀哈希链）"""
+    data = bytes(data)
+    n = len(data)
+    out = bytearray()
+    chains = {}
+    flags_pos = -1
+    bit = 8
+
+    i = 0
+    while i < n:
+        if bit == 8:
+            flags_pos = len(out)
+            out.append(0)
+            bit = 0
+
+        best_len, best_dist = 0, 0
+        if i + LZSS_MIN_MATCH <= n:
+            key = data[i:i + LZSS_MIN_MATCH]
+            limit = min(LZSS_MAX_MATCH, n - i)
+            for pos in reversed(chains.get(key, ())):
+                dist = i - pos
+                if dist > LZSS_WINDOW:
+                    break
+                length = LZSS_MIN_MATCH
+                while length < limit and data[pos + length] == data[i + length]:
+                    length += 1
+                if length > best_len:
+                    best_len, best_dist = length, dist
+                    if length == limit:
+                        break
+
+        if best_len >= LZSS_MIN_MATCH:
+            d = best_dist - 1
+            out.append(d & 0xFF)
+            out.append(((d >> 8) << 4) | (best_len - LZSS_MIN_MATCH))
+            step = best_len
+        else:
+            out[flags_pos] |= 1 << bit
+            out.append(data[i])
+            step = 1
+        bit += 1
+
+        # 登记本次覆盖的每个位置
+        for j in range(i, min(i + step, n - LZSS_MIN_MATCH + 1)):
+            chain = chains.setdefault(data[j:j + LZSS_MIN_MATCH], [])
+            chain.append(j)
+            if len(chain) > LZSS_MAX_CANDIDATES:
+                del chain[0]
+        i += step
+    return bytes(out)
+
+
+def lzss_decode(data, size=None):
+    """LZSS解码，size 给出时解码到该长度为止"""
+    out = bytearray()
+    i, n = 0, len(data)
+    flags, bit = 0, 8
+    while i < n and (size is None or len(out) < size):
+        if bit == 8:
+            flags = data[i]
+            i += 1
+            bit = 0
+            continue
+        if flags >> bit & 1:
+            out.append(data[i])
+            i += 1
+        else:
+            if i + 1 >= n:
+                break
+            dist = (data[i] | (data[i + 1] >> 4) << 8) + 1
+            length = (data[i + 1] & 0x0F) + LZSS_MIN_MATCH
+            i += 2
+            start = len(out) - dist
+            if dist >= length:
+                out += out[start:start + length]
+            else:
+                for k in range(length):
+                    out.append(out[start + k])
+        bit += 1
+    return bytes(out if size is None else out[:size])
+
+
+def _packbits_tokens(data):
+    tokens, i = 0, 0
+    while i < len(data):
+        header = data[i]
+        i += 1 + (header + 1 if header < 128 else (1 if header != 128 else 0))
+        tokens += 1
+    return tokens
+
+
+def _lzss_tokens(data):
+    tokens, i, flags, bit = 0, 0, 0, 8
+    while i < len(data):
+        if bit == 8:
+            flags, bit = data[i], 0
+            i += 1
+            continue
+        i += 1 if flags >> bit & 1 else 2
+        bit += 1
+        tokens += 1
+    return tokens
+
+
+PACKBITS_C = r'''/* PackBits 参考解码器
+ * src/src_len: 压缩数据; dst/dst_len: 输出缓冲
+ * 返回写入 dst 的字节数
+ */
+unsigned long packbits_decode(const unsigned char *src, unsigned long src_len,
+                              unsigned char *dst, unsigned long dst_len)
+{
+    unsigned long i = 0, o = 0;
+    while (i < src_len && o < dst_len) {
+        signed char n = (signed char)src[i++];
+        if (n >= 0) {
+            unsigned int count = (unsigned int)n + 1;
+            while (count-- && i < src_len && o < dst_len)
+                dst[o++] = src[i++];
+        } else if (n != -128 && i < src_len) {
+            unsigned int count = 1 - n;
+            unsigned char value = src[i++];
+            while (count-- && o < dst_len)
+                dst[o++] = value;
+        }
+    }
+    return o;
+}
+'''
+
+LZSS_C = r'''/* LZSS 参考解码器（12位窗口，4位长度，最短匹配3）
+ * src/src_len: 压缩数据; dst/dst_len: 输出缓冲（同时作为滑动窗口）
+ * 返回写入 dst 的字节数
+ */
+unsigned long lzss_decode(const unsigned char *src, unsigned long src_len,
+                          unsigned char *dst, unsigned long dst_len)
+{
+    unsigned long i = 0, o = 0;
+    unsigned int flags = 0, bit = 8;
+    while (i < src_len && o < dst_len) {
+        if (bit == 8) {
+            flags = src[i++];
+            bit = 0;
+            continue;
+        }
+        if (flags & (1u << bit)) {
+            dst[o++] = src[i++];
+        } else {
+            unsigned long dist, length, from;
+            if (i + 1 >= src_len)
+                break;
+            dist = ((unsigned long)src[i] | ((unsigned long)(src[i + 1] >> 4) << 8)) + 1;
+            length = (src[i + 1] & 0x0F) + 3;
+            i += 2;
+            if (dist > o)
+                break;
+            from = o - dist;
+            while (length-- && o < dst_len)
+                dst[o++] = dst[from++];
+        }
+        bit++;
+    }
+    return o;
+}
+'''
+
+# 编码名 → (编码, 解码, 记号计数, 参考C解码器, 每记号的估算开销)
+CODECS = {
+    'packbits': (packbits_encode, packbits_decode, _packbits_tokens, PACKBITS_C, 4),
+    'lzss': (lzss_encode, lzss_decode, _lzss_tokens, LZSS_C, 6),
+}
+
+
+def _codec(name):
+    if name not in CODECS:
+        raise ValueError(f"不支持的压缩方式: {name}，请使用 {' / '.join(CODECS)}")
+    return CODECS[name]
+
+
+@stage
+def compress(data, codec):
+    """压缩并用Python解码器做往返校验，返回压缩数据"""
+    encode, decode = _codec(codec)[:2]
+    packed = encode(data)
+    if decode(packed, len(data)) != bytes(data):
+        raise ValueError(f"{codec} 往返校验失败")
+    return packed
+
+
+def decompress(data, codec, size=None):
+    """解压"""
+    return _codec(codec)[1](data, size)
+
+
+def c_decoder_source(codec):
+    """参考C解码器源码"""
+    return _codec(codec)[3]
+
+
+def report(raw, packed, codec):
+    """压缩率和估算解码开销
+
+    估算开销 = 输出字节数 + 记号数 × 每记号开销，单位是“基本操作”
+    （一次读/判断/写），可以乘以单片机上每次操作的周期数粗略换算成时间
+    """
+    token_count, token_cost = _codec(codec)[2](packed), _codec(codec)[4]
+    return {
+        'codec': codec,
+        'raw_bytes': len(raw),
+        'packed_bytes': len(packed),
+        'ratio': len(raw) / len(packed) if packed else 0.0,
+        'tokens': token_count,
+        'decode_ops': len(raw) + token_count * token_cost,
+    }
+
+
+def best_codec(data, codecs=None):
+    """逐个尝试，返回 (最小的编码名, 压缩数据)；都不比原始数据小时返回 (None, 原始数据)"""
+    best, best_data = None, bytes(data)
+    for name in codecs or CODECS:
+        packed = compress(data, name)
+        if len(packed) < len(best_data):
+            best, best_data = name, packed
+    return best, best_data
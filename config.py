@@ -2,16 +2,31 @@
 EPAPER_WIDTH = 400
 EPAPER_HEIGHT = 300
 
+# 加载与缩放
+FAST_LOAD = False           # JPEG按目标尺寸缩小解码（大照片快很多、省内存；结果与全尺寸解码略有不同）
+RESAMPLE = 'exact'          # 缩放方式: 'exact'(原始LANCZOS) / 'quality' / 'speed'
+BAND_HEIGHT = None          # 分条带处理的条带高度（行），超大屏幕/超大图片时限制内存；None=整帧处理
+
 # 显示模式
 USE_GRAYSCALE = False       # False=黑白模式, True=灰度模式
-GRAYSCALE_LEVELS = 4        # 灰度级别（仅在USE_GRAYSCALE=True时有效）
+GRAYSCALE_LEVELS = 4        # 灰度级别 4或16（仅在USE_GRAYSCALE=True时有效）
+GRAYSCALE_DITHER = None     # 灰度抖动算法: None=直接量化，可选值同 DITHER_KERNEL
 
 # 黑白模式参数
-THRESHOLD = 128             # 二值化阈值 (0-255)
+THRESHOLD = 128             # 二值化阈值 (0-255)，'auto' 为按直方图自动确定（Otsu）
 DITHERING = True            # 是否使用抖动算法
+DITHER_KERNEL = None        # 抖动算法: None=PIL内置Floyd-Steinberg，误差扩散 'floyd_steinberg'/'atkinson'/'stucki'/'jjn'，
+                            # 或有序抖动 'bayer2'/'bayer4'/'bayer8'/'bayer16'/'blue_noise'（动画不闪烁，速度最快）
 BRIGHTNESS_FACTOR = 0.75    # 亮度调整（0.5-1.0，越小越暗）
 CONTRAST_FACTOR = 1.2       # 对比度调整（1.0-1.5，越大越分明）
 
+# 色调（黑白、灰度模式都有效；亮度/对比度、自动色阶、均衡、Gamma 合成一张查找表）
+GRAY_BRIGHTNESS = 1.0       # 灰度模式亮度
+GRAY_CONTRAST = 1.0         # 灰度模式对比度（小于1降低，灰度图显得太硬时用0.7-0.9）
+GAMMA = 1.0                 # Gamma（大于1提亮中间调）
+AUTO_LEVELS = None          # 自动色阶：两端各裁掉的像素比例，如0.005；None=不做
+EQUALIZE = False            # 直方图均衡（低对比度照片）
+
 # 输出设置
 OUTPUT_FORMAT = 'c_array'
-BYTES_PER_LINE = 16
\ No newline at end of file
+BYTES_PER_LINE = 16          # C数组每行字节数
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""转换结果缓存：源文件内容哈希 + 转换参数 → 点阵数据和预览图
+
+缓存目录结构（按键的前两位分子目录）:
+    <cache_dir>/ab/abcd....bin   点阵数据
+    <cache_dir>/ab/abcd....png   预览图
+    <cache_dir>/ab/abcd....json  元数据（模式、大小），最后写入，存在即表示条目完整
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+# 转换算法变化时加1，使旧缓存全部失效
+CACHE_VERSION = 1
+
+# 只影响处理方式、不影响结果的参数，不计入缓存键（分条带处理与整帧结果逐位相同）
+KEY_IGNORED_SETTINGS = ('band_height',)
+
+class ConversionCache:
+    def __init__(self, cache_dir, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(path, chunk_size=1024 * 1024):
+        """源文件内容的SHA-256"""
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                h.update(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def make_key(source_hash, settings):
+        """由源哈希和参数的规范编码（键排序的JSON）生成缓存键（不含 KEY_IGNORED_SETTINGS）"""
+        settings = {k: v for k, v in settings.items() if k not in KEY_IGNORED_SETTINGS}
+        canonical = json.dumps(
+            {'version': CACHE_VERSION, 'source': source_hash, 'settings': settings},
+            sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _path(self, key, ext):
+        return os.path.join(self.cache_dir, key[:2], key + ext)
+
+    def get(self, key):
+        """查询缓存，命中返回 (点阵数据bytes, 预览图路径, 模式)，否则返回None"""
+        meta_path = self._path(key, '.json')
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(self._path(key, '.bin'), 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+
+        # 更新访问时间，用于LRU淘汰
+        os.utime(meta_path)
+        self.hits += 1
+        return data, self._path(key, '.png'), meta['mode']
+
+    def put(self, key, data, preview_img, mode):
+        """写入缓存（先写临时文件再改名，多进程同时写入也不会读到半个条目）"""
+        os.makedirs(os.path.dirname(self._path(key, '')), exist_ok=True)
+        meta = {'mode': mode, 'size': len(data)}
+
+        self._write_atomic(key, '.bin', lambda f: f.write(data))
+        self._write_atomic(key, '.png', lambda f: preview_img.save(f, format='PNG'))
+        self._write_atomic(key, '.json', lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    def _write_atomic(self, key, ext, write):
+        target = self._path(key, ext)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(tmp, target)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def copy_preview(self, preview_path, target):
+        """把缓存中的预览图复制到输出位置"""
+        shutil.copyfile(preview_path, target)
+
+    def entries(self):
+        """所有完整条目，返回 [(最后访问时间, 占用字节, 键), ...]"""
+        result = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                key = name[:-5]
+                try:
+                    atime = os.path.getmtime(os.path.join(root, name))
+                    size = sum(os.path.getsize(self._path(key, ext))
+                               for ext in ('.bin', '.png', '.json'))
+                except OSError:
+                    continue
+                result.append((atime, size, key))
+        return result
+
+    def evict(self):
+        """按最近最少使用淘汰，直到总大小不超过 max_bytes，返回淘汰的条目数"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            # 先删元数据，条目立即失效
+            for ext in ('.json', '.bin', '.png'):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    def stats(self):
+        """命中统计和缓存占用"""
+        entries = self.entries()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': len(entries),
+            'bytes': sum(size for _, size, _ in entries),
+        }
@@ -0,0 +1,109 @@
+"""局部刷新：比较相邻两帧的点阵数据，只输出变化的矩形区域
+
+矩形在横向上按字节对齐（1bit 时 x 和 w 是8的倍数），
+每个矩形的数据就是新帧在该窗口内逐行的字节。
+"""
+import numpy as np
+from matrix_converter import mode_to_bpp
+
+# 输出的C数组中矩形描述的类型（见 OutputGenerator.write_delta_c_array）：
+# x, y, w, h 为 RECT_FIELD_TYPE，数据偏移单独一个 RECT_OFFSET_TYPE 数组
+RECT_FIELD_TYPE = ('uint16_t', 2)
+RECT_OFFSET_TYPE = ('uint32_t', 4)
+# 每个矩形在固件中的描述开销，合并相邻变化段时用来比较
+RECT_HEADER_BYTES = 4 * RECT_FIELD_TYPE[1] + RECT_OFFSET_TYPE[1]
+
+class DeltaEncoder:
+    def __init__(self, width, height, mode='1bit'):
+        self.width = width
+        self.height = height
+        self.bpp = mode_to_bpp(mode)
+        self.pixels_per_byte = 8 // self.bpp
+        self.row_bytes = (width * self.bpp + 7) // 8
+
+    def _rows(self, data):
+        """帧数据视为 (高, 每行字节数) 的数组（不复制）"""
+        rows = np.frombuffer(data, dtype=np.uint8)
+        if rows.size != self.row_bytes * self.height:
+            raise ValueError(f"帧大小不匹配: {rows.size} 字节，期望 {self.row_bytes * self.height} 字节")
+        return rows.reshape(self.height, self.row_bytes)
+
+    def dirty_rects(self, prev, curr):
+        """找出变化区域，返回字节坐标的矩形列表 [(x字节, y, w字节, h), ...]
+
+        先按连续的变化行分带，带内再按列分段；两段之间的空隙
+        比多描述一个矩形更省时就合并。prev 为 None 时返回整帧。
+        """
+        if prev is None:
+            return [(0, 0, self.row_bytes, self.height)]
+
+        changed = (self._rows(prev) ^ self._rows(curr)) != 0
+        rects = []
+        for y0, y1 in _runs(changed.any(axis=1)):
+            band = changed[y0:y1]
+            height = y1 - y0
+            for x0, x1 in _merge_runs(_runs(band.any(axis=0)), height):
+                # 收紧到该列范围内真正变化的行
+                rows = np.flatnonzero(band[:, x0:x1].any(axis=1))
+                rects.append((int(x0), int(y0 + rows[0]), int(x1 - x0),
+                              int(rows[-1] - rows[0] + 1)))
+        return rects
+
+    def encode(self, prev, curr):
+        """返回 [(像素坐标矩形 (x, y, w, h), 窗口数据bytes), ...]"""
+        rows = self._rows(curr)
+        return [(self.to_pixels((x, y, w, h)), rows[y:y + h, x:x + w].tobytes())
+                for x, y, w, h in self.dirty_rects(prev, curr)]
+
+    def apply(self, prev, deltas):
+        """把局部更新写回上一帧，得到新帧（参考解码，用于校验）"""
+        if prev is None:
+            frame = np.zeros((self.height, self.row_bytes), dtype=np.uint8)
+        else:
+            frame = self._rows(prev).copy()
+        for rect, window in deltas:
+            x, y, w, h = self.to_bytes(rect)
+            frame[y:y + h, x:x + w] = np.frombuffer(window, dtype=np.uint8).reshape(h, w)
+        return frame.tobytes()
+
+    def to_pixels(self, rect):
+        """字节坐标的矩形换算为像素坐标 (x, y, w, h)，宽度不超出屏幕"""
+        x, y, w, h = rect
+        ppb = self.pixels_per_byte
+        return x * ppb, y, min(w * ppb, self.width - x * ppb), h
+
+    def to_bytes(self, rect):
+        """像素坐标的矩形换算回字节坐标"""
+        x, y, w, h = rect
+        ppb = self.pixels_per_byte
+        return x // ppb, y, (w + ppb - 1) // ppb, h
+
+    def delta_frames(self, frames):
+        """逐帧生成局部更新：第一帧是整帧，之后只含变化区域
+
+        参数:
+            frames: 可迭代的 (帧数据, 显示时长ms或None)
+        产生:
+            (更新列表, 显示时长)，更新列表见 encode
+        """
+        prev = None
+        for data, duration in frames:
+            yield self.encode(prev, data), duration
+            prev = data
+
+
+def _runs(mask):
+    """一维布尔数组中连续 True 段的 [起, 止) 列表"""
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view(np.int8), [0]))))
+    return list(zip(edges[::2], edges[1::2]))
+
+
+def _merge_runs(runs, height):
+    """空隙数据量（空隙宽×高）不超过一个矩形描述的开销时合并相邻段"""
+    merged = []
+    for start, end in runs:
+        if merged and (start - merged[-1][1]) * height <= RECT_HEADER_BYTES:
+            merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
@@ -0,0 +1,346 @@
+"""抖动（任意输出级数）：误差扩散和有序抖动
+
+误差扩散本身是串行的：每个像素要等左边和上面的像素把误差传过来。
+这里按“斜波前”并行：把第 y 行向右错开 k*y 列，错开后同一列上的像素
+彼此没有依赖（k 由核的形状决定，Floyd-Steinberg 为2，Stucki/JJN 为3），
+于是每一步用一次NumPy切片处理一整列，400×300 只需约1300步。
+
+有序抖动（Bayer矩阵、蓝噪声）每个像素只和固定阈值比较，完全并行，
+而且画面不变的区域在动画各帧之间完全一致，不会闪烁。
+"""
+import functools
+import os
+import numpy as np
+from PIL import Image
+from instrumentation import stage
+
+# 核: 名称 → (除数, [(dy, dx, 权重), ...])，误差从当前像素扩散到 (y+dy, x+dx)
+KERNELS = {
+    'floyd_steinberg': (16, [
+        (0, 1, 7),
+        (1, -1, 3), (1, 0, 5), (1, 1, 1),
+    ]),
+    'atkinson': (8, [  # 只扩散 6/8 的误差，对比更强
+        (0, 1, 1), (0, 2, 1),
+        (1, -1, 1), (1, 0, 1), (1, 1, 1),
+        (2, 0, 1),
+    ]),
+    'stucki': (42, [
+        (0, 1, 8), (0, 2, 4),
+        (1, -2, 2), (1, -1, 4), (1, 0, 8), (1, 1, 4), (1, 2, 2),
+        (2, -2, 1), (2, -1, 2), (2, 0, 4), (2, 1, 2), (2, 2, 1),
+    ]),
+    'jjn': (48, [  # Jarvis-Judice-Ninke
+        (0, 1, 7), (0, 2, 5),
+        (1, -2, 3), (1, -1, 5), (1, 0, 7), (1, 1, 5), (1, 2, 3),
+        (2, -2, 1), (2, -1, 3), (2, 0, 5), (2, 1, 3), (2, 2, 1),
+    ]),
+}
+
+
+def _skew(entries):
+    """使错开后同一列互不依赖的最小错位 k：每个 (dy, dx) 都要满足 dx + k*dy > 0"""
+    k = 1
+    for dy, dx, _ in entries:
+        if dy > 0 and dx < 0:
+            k = max(k, -dx // dy + 1)
+    return k
+
+
+def error_diffuse(gray, levels=2, kernel='floyd_steinberg'):
+    """误差扩散量化
+
+    参数:
+        gray: (高, 宽) 的 0-255 灰度数组
+        levels: 输出级数（2=黑白，4/16=灰度）
+        kernel: 扩散核，见 KERNELS
+    返回:
+        (高, 宽) uint8 数组，取值为各级对应的显示灰度（如4级: 0/85/170/255）
+    """
+    return _error_diffuse(gray, levels, kernel)[0]
+
+
+def _error_diffuse(gray, levels, kernel, context=None):
+    """误差扩散，返回 (显示灰度, 最后几行的误差)
+
+    context 是上方紧邻的几行（上一个条带最后几行）的误差，(行数, 宽)：这些行作为
+    不再量化的“上下文行”放进同一个错开缓冲，误差按原来的步序扩散下来，
+    浮点加法的顺序与整图一次处理完全相同，所以逐条带处理的结果逐位一致
+    """
+    if kernel not in KERNELS:
+        raise ValueError(f"不支持的抖动算法: {kernel}，请使用 {' / '.join(KERNELS)}")
+    if levels < 2:
+        raise ValueError(f"灰度级别至少为2，不能是{levels}")
+    divisor, entries = KERNELS[kernel]
+    k = _skew(entries)
+    ctx = 0 if context is None else len(context)
+    height, width = gray.shape
+    total = ctx + height
+    max_dy = max(dy for dy, _, _ in entries)
+    reach = max(dx + k * dy for dy, dx, _ in entries)
+    steps = width + k * (total - 1)
+
+    # 转置后的错开缓冲：diag[t, y] 是像素 (y, t - k*y)，一列变成连续的一行
+    rows = np.arange(total)[:, None]
+    cols = np.arange(width)[None, :]
+    skew_t = cols + k * rows
+    diag = np.zeros((steps + reach, total + max_dy), dtype=np.float32)
+    diag[skew_t[ctx:], rows[ctx:]] = gray
+    valid = np.zeros((steps, total), dtype=np.float32)
+    valid[skew_t, rows] = 1.0
+    if ctx:
+        forced = np.zeros((steps, ctx), dtype=np.float32)
+        forced[skew_t[:ctx], rows[:ctx]] = context
+
+    codes = np.zeros((steps, total), dtype=np.float32)
+    step = 255.0 / (levels - 1)
+    # 同一 dy 的各项在错开后落在相邻的几行上，合并成一次广播加法
+    weights = []
+    for dy in sorted({dy for dy, _, _ in entries}):
+        row = {dx: w for d, dx, w in entries if d == dy}
+        lo, hi = min(row), max(row)
+        column = np.array([[row.get(dx, 0) / divisor] for dx in range(lo, hi + 1)],
+                          dtype=np.float32)
+        weights.append((dy, lo + k * dy, column))
+
+    for t in range(steps):
+        value = diag[t, :total]
+        code = np.clip(np.rint(value / step), 0, levels - 1)
+        codes[t] = code
+        # 错开后补出来的空位不参与扩散
+        error = (value - code * step) * valid[t]
+        if ctx:
+            error[:ctx] = forced[t]
+        for dy, dt, column in weights:
+            diag[t + dt:t + dt + len(column), dy:dy + total] += column * error
+
+    # 与 convert_to_grayscale 相同的显示映射
+    band_t, band_rows = skew_t[ctx:], rows[ctx:]
+    band_codes = codes[band_t, band_rows]
+    result = band_codes.astype(np.uint16) * 255 // (levels - 1)
+    # diag[t] 在第 t 步之后不再变化，误差可以事后算出
+    errors = diag[band_t, band_rows] - band_codes * step
+    if ctx:
+        errors = np.concatenate([context, errors])
+    return result.astype(np.uint8), errors[-max_dy:]
+
+
+def pil_floyd_steinberg(gray, carry=None):
+    """与 PIL convert('1', dither=FLOYDSTEINBERG) 逐位一致的 Floyd-Steinberg
+
+    PIL 用整数运算：累计误差 (7左 + 3右上 + 5上 + 1左上) 除以16（向零截断）加到
+    像素上，大于128为白。累计误差是整数和，与相加顺序无关，所以和 error_diffuse 一样
+    按斜波前逐列处理。
+    参数:
+        gray: (高, 宽) 的 0-255 灰度数组
+        carry: 上一个条带传给第一行的累计误差（宽,），None 表示从图像顶端开始
+    返回:
+        (白色为True的布尔数组, 传给下一个条带的累计误差)
+    """
+    height, width = gray.shape
+    k = 2
+    steps = width + k * (height - 1)
+    rows = np.arange(height)[:, None]
+    cols = np.arange(width)[None, :]
+    skew_t = cols + k * rows
+    # 累计误差都是整数，用 float64 保存（精确），除以16再截断即C的整数除法
+    acc = np.zeros((steps + 3, height + 1), dtype=np.float64)
+    if carry is not None:
+        acc[:width, 0] = carry
+    values = np.zeros((steps, height), dtype=np.float64)
+    values[skew_t, rows] = gray
+    valid = np.zeros((steps, height), dtype=np.float64)
+    valid[skew_t, rows] = 1.0
+    white = np.zeros((steps, height), dtype=np.bool_)
+    below = np.array([[3.0], [5.0], [1.0]])   # 下一行 x-1、x、x+1，错开后为 t+1..t+3
+
+    for t in range(steps):
+        value = np.clip(values[t] + np.trunc(acc[t, :height] * 0.0625), 0, 255)
+        out = value > 128
+        white[t] = out
+        error = (value - 255.0 * out) * valid[t]
+        acc[t + 1, :height] += 7.0 * error
+        acc[t + 1:t + 4, 1:] += below * error
+
+    return white[skew_t, rows], acc[np.arange(width) + k * height, height]
+
+
+# 有序抖动的阈值图: 名称 → Bayer矩阵边长（0 表示蓝噪声）
+ORDERED_MAPS = {'bayer2': 2, 'bayer4': 4, 'bayer8': 8, 'bayer16': 16, 'blue_noise': 0}
+
+# 随程序附带的64×64蓝噪声（void-and-cluster生成，见 generate_blue_noise）
+BLUE_NOISE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'blue_noise_64.png')
+
+
+def bayer_matrix(n):
+    """n×n Bayer矩阵（n为2的幂），取值 0 到 n*n-1"""
+    if n < 2 or n & (n - 1):
+        raise ValueError(f"Bayer矩阵边长必须是2的幂，不能是{n}")
+    m = np.array([[0, 2], [3, 1]])
+    while m.shape[0] < n:
+        m = np.block([[4 * m, 4 * m + 2], [4 * m + 3, 4 * m + 1]])
+    return m
+
+
+def generate_blue_noise(size=64, sigma=1.9, seed=1):
+    """用 void-and-cluster 方法生成 size×size 的蓝噪声秩矩阵（取值 0 到 size*size-1）
+
+    计算较慢（64×64 约1秒），程序使用附带的 blue_noise_64.png，
+    本函数用于重新生成该文件
+    """
+    n = size * size
+    rng = np.random.default_rng(seed)
+
+    # 环绕的高斯核，以 (0, 0) 为中心；能量 = 图案与核的循环卷积
+    d = np.minimum(np.arange(size), size - np.arange(size))
+    kernel = np.exp(-(d[:, None] ** 2 + d[None, :] ** 2) / (2 * sigma ** 2))
+
+    def energy_of(pattern):
+        return np.real(np.fft.ifft2(np.fft.fft2(pattern) * np.fft.fft2(kernel)))
+
+    def update(energy, index, sign):
+        y, x = divmod(index, size)
+        energy += sign * np.roll(np.roll(kernel, y, axis=0), x, axis=1)
+
+    # 初始图案：约10%的点，反复把最密集处的点移到最大空隙，直到稳定
+    pattern = np.zeros((size, size))
+    pattern.flat[rng.choice(n, n // 10, replace=False)] = 1
+    energy = energy_of(pattern)
+    while True:
+        cluster = np.argmax(np.where(pattern == 1, energy, -np.inf))
+        pattern.flat[cluster] = 0
+        update(energy, cluster, -1)
+        void = np.argmin(np.where(pattern == 0, energy, np.inf))
+        if void == cluster:
+            pattern.flat[cluster] = 1
+            update(energy, cluster, 1)
+            break
+        pattern.flat[void] = 1
+        update(energy, void, 1)
+
+    ranks = np.zeros(n, dtype=np.int64)
+    initial = pattern.copy()
+    ones = int(initial.sum())
+
+    # 阶段1：从初始图案中逐个移除最密集的点，秩从 ones-1 递减
+    energy = energy_of(pattern)
+    for rank in range(ones - 1, -1, -1):
+        cluster = np.argmax(np.where(pattern == 1, energy, -np.inf))
+        pattern.flat[cluster] = 0
+        update(energy, cluster, -1)
+        ranks[cluster] = rank
+
+    # 阶段2：从初始图案开始逐个填入最大空隙，秩从 ones 递增
+    pattern = initial
+    energy = energy_of(pattern)
+    for rank in range(ones, n):
+        void = np.argmin(np.where(pattern == 0, energy, np.inf))
+        pattern.flat[void] = 1
+        update(energy, void, 1)
+        ranks[void] = rank
+
+    return ranks.reshape(size, size)
+
+
+def save_blue_noise(path=BLUE_NOISE_FILE, size=64):
+    """重新生成附带的蓝噪声文件（8位灰度PNG，值 = 秩 * 256 // 像素数）"""
+    ranks = generate_blue_noise(size)
+    Image.fromarray((ranks * 256 // ranks.size).astype(np.uint8)).save(path)
+
+
+@functools.lru_cache(maxsize=None)
+def _blue_noise_tile():
+    """蓝噪声阈值块，取值在 (0, 1) 内"""
+    if os.path.exists(BLUE_NOISE_FILE):
+        return (np.asarray(Image.open(BLUE_NOISE_FILE), dtype=np.float32) + 0.5) / 256
+    ranks = generate_blue_noise()
+    return (ranks + 0.5) / ranks.size
+
+
+@functools.lru_cache(maxsize=32)
+def threshold_map(name, width, height, row=0):
+    """铺满 width×height 的阈值图，取值在 (0, 1) 内
+
+    row 为第一行在整幅图中的行号（逐条带处理时阈值图要接着上一个条带铺）；
+    每种尺寸只生成一次并缓存；返回的数组只读
+    """
+    if name not in ORDERED_MAPS:
+        raise ValueError(f"不支持的有序抖动: {name}，请使用 {' / '.join(ORDERED_MAPS)}")
+    size = ORDERED_MAPS[name]
+    if size:
+        tile = (bayer_matrix(size) + 0.5) / (size * size)
+    else:
+        tile = _blue_noise_tile()
+    if row % tile.shape[0]:
+        tile = np.roll(tile, -(row % tile.shape[0]), axis=0)
+    reps = (-(-height // tile.shape[0]), -(-width // tile.shape[1]))
+    result = np.tile(tile, reps)[:height, :width].astype(np.float32)
+    result.flags.writeable = False
+    return result
+
+
+def ordered_dither(gray, levels=2, method='bayer8', row=0):
+    """有序抖动量化
+
+    参数:
+        gray: (高, 宽) 的 0-255 灰度数组
+        levels: 输出级数
+        method: 阈值图，见 ORDERED_MAPS
+        row: gray 第一行在整幅图中的行号（逐条带处理时使用）
+    返回:
+        (高, 宽) uint8 数组，取值为各级对应的显示灰度
+    """
+    if levels < 2:
+        raise ValueError(f"灰度级别至少为2，不能是{levels}")
+    height, width = gray.shape
+    thresholds = threshold_map(method, width, height, row)
+
+    # 一次广播运算：把灰度缩放到 0..levels-1，加上阈值后取整
+    codes = np.floor(gray * np.float32((levels - 1) / 255.0) + thresholds)
+    codes = np.clip(codes, 0, levels - 1).astype(np.uint16)
+    return (codes * 255 // (levels - 1)).astype(np.uint8)
+
+
+# 所有抖动方式：误差扩散核 + 有序抖动阈值图
+METHODS = list(KERNELS) + list(ORDERED_MAPS)
+
+
+@stage
+def dither(gray, levels=2, method='floyd_steinberg'):
+    """按名称选择误差扩散或有序抖动"""
+    if method in ORDERED_MAPS:
+        return ordered_dither(gray, levels, method)
+    if method in KERNELS:
+        return error_diffuse(gray, levels, method)
+    raise ValueError(f"不支持的抖动算法: {method}，请使用 {' / '.join(METHODS)}")
+
+
+class BandDither:
+    """逐条带抖动：条带按从上到下的顺序送入，误差扩散在条带之间接续，
+    有序抖动的阈值图接着上一个条带铺，结果与整图一次抖动逐位一致
+
+    method 为 METHODS 中的算法；None 表示与 PIL 内置 Floyd-Steinberg 相同（只支持2级，
+    见 pil_floyd_steinberg）
+    """
+
+    def __init__(self, levels=2, method=None):
+        if method is None and levels != 2:
+            raise ValueError("PIL内置抖动只支持黑白（2级）")
+        if method is not None and method not in METHODS:
+            raise ValueError(f"不支持的抖动算法: {method}，请使用 {' / '.join(METHODS)}")
+        self.levels = levels
+        self.method = method
+        self.row = 0          # 下一个条带第一行的行号
+        self.carry = None     # 传给下一个条带的误差
+
+    def __call__(self, gray):
+        """抖动一个条带，返回各级对应的显示灰度 (高, 宽) uint8"""
+        if self.method is None:
+            white, self.carry = pil_floyd_steinberg(gray, self.carry)
+            result = white.view(np.uint8) * np.uint8(255)
+        elif self.method in ORDERED_MAPS:
+            result = ordered_dither(gray, self.levels, self.method, self.row)
+        else:
+            result, self.carry = _error_diffuse(gray, self.levels, self.method, self.carry)
+        self.row += gray.shape[0]
+        return result
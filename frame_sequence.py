@@ -0,0 +1,156 @@
+"""动画/图片序列转换：逐帧读取、逐帧转换、逐帧写出
+
+支持的输入:
+    anim.gif                    动画GIF（或其他多帧格式，如APNG、WebP、TIFF）
+    frames/                     目录中的图片，按文件名中的数字排序
+    "frames/*.png"              通配符
+    frames/frame_%03d.png       printf风格编号，从0（或1）开始直到缺号
+
+用法示例:
+    python frame_sequence.py anim.gif -o anim.h
+    python frame_sequence.py frames/ -o slides.h --var slides
+    python frame_sequence.py anim.gif -o anim.h --delta     # 局部刷新
+"""
+import argparse
+import glob
+import itertools
+import os
+import re
+import sys
+from PIL import Image, ImageSequence
+from batch_converter import IMAGE_EXTENSIONS, c_identifier, default_settings
+from image_processor import ImageProcessor
+from matrix_converter import mode_for_levels
+from pipeline import Pipeline
+from delta_encoder import DeltaEncoder
+from output_generator import OutputGenerator
+
+
+# printf 风格的编号字段: %d / %3d / %03d
+PRINTF_RE = re.compile(r'%0?\d*d')
+
+
+def natural_key(path):
+    """按文件名中的数字排序（frame2 在 frame10 之前）"""
+    name = os.path.basename(path)
+    return [int(part) if part.isdigit() else part.lower()
+            for part in re.split(r'(\d+)', name)]
+
+
+def sequence_paths(source):
+    """解析图片序列的文件列表；source 不是序列（单个文件）时返回None"""
+    if os.path.isfile(source):
+        return None
+    if os.path.isdir(source):
+        paths = [os.path.join(source, name) for name in os.listdir(source)
+                 if name.lower().endswith(IMAGE_EXTENSIONS)]
+        return sorted(paths, key=natural_key)
+    if any(c in source for c in '*?['):
+        return sorted(glob.glob(source), key=natural_key)
+    if PRINTF_RE.search(source):
+        return _printf_paths(source)
+    return None
+
+
+def _printf_paths(pattern):
+    """frame_%03d.png 形式：从0或1开始，遇到第一个缺号为止（惰性生成）
+
+    只替换第一个 %d / %0Nd，文件名中其他的 % 原样保留
+    """
+    def name(index):
+        return PRINTF_RE.sub(lambda m: m.group() % index, pattern, count=1)
+
+    index = 0 if os.path.exists(name(0)) else 1
+    while os.path.exists(name(index)):
+        yield name(index)
+        index += 1
+
+
+def iter_frames(source):
+    """逐帧读取，产生 (RGB帧, 显示时长ms或None)
+
+    任何时刻只有当前一帧在内存里
+    """
+    paths = sequence_paths(source)
+    if paths is not None:
+        for path in paths:
+            with Image.open(path) as img:
+                yield img.convert('RGB'), None
+        return
+
+    with Image.open(source) as img:
+        for frame in ImageSequence.Iterator(img):
+            yield frame.convert('RGB'), frame.info.get('duration')
+
+
+def convert_frames(frames, settings):
+    """逐帧转换，产生 (点阵数据bytes, 显示时长ms或None)"""
+    width, height = settings['width'], settings['height']
+    processor = ImageProcessor(width, height, resample=settings['resample'])
+    # 每帧复用同一块缓冲，不生成预览图
+    pipeline = Pipeline.from_settings(settings)
+    for frame, duration in frames:
+        yield pipeline.run(processor.resize(frame)), duration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-Paper 动画/图片序列转点阵工具")
+    parser.add_argument('source', help="动画GIF、图片目录、通配符或 frame_%%03d.png 形式的编号序列")
+    parser.add_argument('-o', '--output', required=True, help="输出的 .h 文件")
+    parser.add_argument('--var', help="C数组名（默认取输出文件名）")
+    parser.add_argument('--delta', action='store_true',
+                        help="第一帧完整输出，之后只输出与上一帧相比变化的矩形区域")
+    args = parser.parse_args(argv)
+
+    settings = default_settings()
+    var_name = c_identifier(args.var or os.path.splitext(os.path.basename(args.output))[0])
+    generator = OutputGenerator()
+
+    print("="*50)
+    print(f"序列转换: {args.source} ({settings['width']}×{settings['height']})")
+    print("="*50)
+
+    frame_bytes = []
+
+    def progress(frames):
+        for index, item in enumerate(frames):
+            frame_bytes.append(len(item[0]))
+            if not args.delta:
+                print(f"  帧 {index}: {len(item[0])} 字节")
+            yield item
+
+    def delta_progress(frames):
+        for index, (deltas, duration) in enumerate(frames):
+            size = sum(len(window) for _, window in deltas)
+            print(f"  帧 {index}: {len(deltas)} 个区域, {size} 字节")
+            yield deltas, duration
+
+    try:
+        frames = progress(convert_frames(iter_frames(args.source), settings))
+        # 先取出第一帧，没有帧时不创建输出文件
+        first = next(frames, None)
+        if first is None:
+            raise ValueError("没有读到任何帧")
+        frames = itertools.chain([first], frames)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            if args.delta:
+                mode = mode_for_levels(settings['levels']) if settings['grayscale'] else '1bit'
+                encoder = DeltaEncoder(settings['width'], settings['height'], mode)
+                count, total = generator.write_delta_c_array(
+                    delta_progress(encoder.delta_frames(frames)), f, var_name)
+            else:
+                count = generator.write_frames_c_array(frames, f, var_name)
+                total = sum(frame_bytes)
+    except Exception as e:
+        print(f"✗ 转换失败: {e}")
+        return 1
+
+    print(f"\n✓ 共 {count} 帧，已写入 {args.output}")
+    if args.delta:
+        full = sum(frame_bytes)
+        print(f"  数据量: {total} 字节（整帧存储需 {full} 字节，{total / full:.1%}）")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
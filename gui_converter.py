@@ -3,28 +3,76 @@ from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk, ImageEnhance
 import config
 from image_processor import ImageProcessor
-from matrix_converter import MatrixConverter
+from matrix_converter import MatrixConverter, mode_for_levels
 from output_generator import OutputGenerator
+from matrix_decoder import MatrixDecoder
+from verify_assets import PREVIEW_SUFFIX, preview_codes, read_asset
+from dithering import METHODS
+from panel_profiles import PANEL_PROFILES, PanelProfile, find_profile, profile_settings
+from batch_converter import default_settings
+import auto_tune
+import instrumentation
 import os
+import queue
+import threading
+
+# 实时预览：参数停止变化多久后开始转换、结果轮询间隔（毫秒）
+PREVIEW_DELAY_MS = 150
+PREVIEW_POLL_MS = 30
+
+# 原图/预览画布大小（屏幕分辨率不同时按比例缩放显示）
+CANVAS_WIDTH = 400
+CANVAS_HEIGHT = 300
+
+# 灰度模式对应的灰度级别
+GRAY_LEVELS = {"灰度": 4, "16级灰度": 16}
+
+# 显示模式 → (按钮文字, 数据模式)
+MODE_CHOICES = {"黑白": ("黑白", '1bit'), "灰度": ("4级灰度", '2bit'), "16级灰度": ("16级灰度", '4bit')}
+
+# 抖动算法选项：第一项为PIL内置Floyd-Steinberg，其余见 dithering.METHODS
+DITHER_CHOICES = ["PIL内置"] + METHODS
+# 灰度模式的抖动选项：第一项为不抖动（直接量化）
+GRAY_DITHER_CHOICES = ["无"] + METHODS
+
+# 自动色阶两端各裁掉的像素比例
+AUTO_LEVELS_CLIP = 0.005
 
 class ImageConverterGUI:
     def __init__(self, root):
         self.root = root
-        self.root.title("照片转点阵工具 - 400×300墨水屏")
         self.root.geometry("1200x800")
         
+        # 屏幕型号：config.py 的尺寸在型号表中时默认选中该型号，否则作为自定义型号
+        self.profiles = dict(PANEL_PROFILES)
+        profile = find_profile(config.EPAPER_WIDTH, config.EPAPER_HEIGHT)
+        if profile is None:
+            profile = PanelProfile('config.py', config.EPAPER_WIDTH, config.EPAPER_HEIGHT,
+                                   description='config.py 中的尺寸')
+            self.profiles[profile.name] = profile
+        
         # 初始化处理器
-        self.processor = ImageProcessor(config.EPAPER_WIDTH, config.EPAPER_HEIGHT)
-        self.converter = MatrixConverter(config.EPAPER_WIDTH, config.EPAPER_HEIGHT)
         self.generator = OutputGenerator()
+        self.set_profile(profile)
         
         # 存储图像
         self.original_img = None
         self.processed_img = None
         self.preview_img = None
+        self.preview_params = None
+        self._thumbnails = {}  # 画布 → (源图像, 已生成的PhotoImage)
+        
+        # 后台预览：任务队列、结果队列、任务代数（只有最新一代的结果会显示）
+        self._preview_jobs = queue.Queue()
+        self._preview_results = queue.Queue()
+        self._preview_generation = 0
+        self._preview_after = None
+        self._tune_results = queue.Queue()
+        threading.Thread(target=self._preview_worker, daemon=True).start()
         
         # 创建界面
         self.create_widgets()
+        self.root.after(PREVIEW_POLL_MS, self._poll_preview_results)
         
     def create_widgets(self):
         # ========== 顶部工具栏 ==========
@@ -51,12 +99,12 @@ class ImageConverterGUI:
         
         # 原图
         ttk.Label(left_frame, text="原始图片", font=("Arial", 12, "bold")).pack(pady=5)
-        self.original_canvas = tk.Canvas(left_frame, width=400, height=300, bg="gray90")
+        self.original_canvas = tk.Canvas(left_frame, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, bg="gray90")
         self.original_canvas.pack(pady=5)
         
         # 转换后
         ttk.Label(left_frame, text="转换预览", font=("Arial", 12, "bold")).pack(pady=5)
-        self.preview_canvas = tk.Canvas(left_frame, width=400, height=300, bg="gray90")
+        self.preview_canvas = tk.Canvas(left_frame, width=CANVAS_WIDTH, height=CANVAS_HEIGHT, bg="gray90")
         self.preview_canvas.pack(pady=5)
         
         # 右侧：参数控制
@@ -68,13 +116,22 @@ class ImageConverterGUI:
         params_frame = ttk.LabelFrame(right_frame, text="转换参数", padding=10)
         params_frame.pack(fill=tk.BOTH, expand=True)
         
-        # 显示模式
-        ttk.Label(params_frame, text="显示模式:", font=("Arial", 10, "bold")).pack(anchor=tk.W, pady=(0, 5))
-        self.mode_var = tk.StringVar(value="黑白")
-        ttk.Radiobutton(params_frame, text="黑白 (1-bit, 15KB)", 
-                       variable=self.mode_var, value="黑白").pack(anchor=tk.W)
-        ttk.Radiobutton(params_frame, text="4级灰度 (2-bit, 30KB)", 
-                       variable=self.mode_var, value="灰度").pack(anchor=tk.W)
+        # 屏幕型号
+        ttk.Label(params_frame, text="屏幕型号:", font=("Arial", 10, "bold")).pack(anchor=tk.W, pady=(0, 5))
+        self.profile_var = tk.StringVar(value=self.profile.name)
+        profile_box = ttk.Combobox(params_frame, textvariable=self.profile_var,
+                                   values=list(self.profiles), state='readonly')
+        profile_box.pack(fill=tk.X)
+        profile_box.bind('<<ComboboxSelected>>', self.on_profile_change)
+        
+        # 显示模式（数据大小随屏幕型号变化）
+        ttk.Label(params_frame, text="显示模式:", font=("Arial", 10, "bold")).pack(anchor=tk.W, pady=(10, 5))
+        self.mode_var = tk.StringVar(value=self.profile_mode(self.profile))
+        self.mode_buttons = {}
+        for value in MODE_CHOICES:
+            self.mode_buttons[value] = ttk.Radiobutton(params_frame, variable=self.mode_var, value=value)
+            self.mode_buttons[value].pack(anchor=tk.W)
+        self.update_mode_labels()
         
         ttk.Separator(params_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
         
@@ -84,9 +141,15 @@ class ImageConverterGUI:
         
         # 抖动开关
         self.dither_var = tk.BooleanVar(value=True)
-        ttk.Checkbutton(bw_frame, text="启用Floyd-Steinberg抖动", 
+        ttk.Checkbutton(bw_frame, text="启用抖动", 
                        variable=self.dither_var).pack(anchor=tk.W)
         
+        # 抖动算法
+        ttk.Label(bw_frame, text="抖动算法:").pack(anchor=tk.W, pady=(5, 0))
+        self.kernel_var = tk.StringVar(value=DITHER_CHOICES[0])
+        ttk.Combobox(bw_frame, textvariable=self.kernel_var, values=DITHER_CHOICES,
+                     state='readonly').pack(fill=tk.X)
+        
         # 阈值（仅在不抖动时有效）
         ttk.Label(bw_frame, text="阈值 (不抖动时):").pack(anchor=tk.W, pady=(10, 0))
         self.threshold_var = tk.IntVar(value=128)
@@ -94,6 +157,9 @@ class ImageConverterGUI:
                                    variable=self.threshold_var, orient=tk.HORIZONTAL)
         threshold_scale.pack(fill=tk.X)
         ttk.Label(bw_frame, textvariable=self.threshold_var).pack(anchor=tk.E)
+        self.auto_threshold_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(bw_frame, text="自动阈值 (Otsu)",
+                       variable=self.auto_threshold_var).pack(anchor=tk.W)
         
         # 亮度
         ttk.Label(bw_frame, text="亮度调整:").pack(anchor=tk.W, pady=(10, 0))
@@ -123,6 +189,58 @@ class ImageConverterGUI:
         self.contrast_var.trace('w', update_contrast_label)
         update_contrast_label()
         
+        # 色调（两种模式都有效）
+        tone_frame = ttk.LabelFrame(params_frame, text="色调", padding=5)
+        tone_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(tone_frame, text="Gamma (大于1提亮中间调):").pack(anchor=tk.W)
+        self.gamma_var = tk.DoubleVar(value=1.0)
+        ttk.Scale(tone_frame, from_=0.5, to=2.0, variable=self.gamma_var,
+                  orient=tk.HORIZONTAL).pack(fill=tk.X)
+        gamma_label = ttk.Label(tone_frame, text="")
+        gamma_label.pack(anchor=tk.E)
+        
+        # 灰度模式的对比度（日志中灰度图对比度过高，可以在这里降低）
+        ttk.Label(tone_frame, text="灰度对比度:").pack(anchor=tk.W)
+        self.gray_contrast_var = tk.DoubleVar(value=1.0)
+        ttk.Scale(tone_frame, from_=0.5, to=1.5, variable=self.gray_contrast_var,
+                  orient=tk.HORIZONTAL).pack(fill=tk.X)
+        gray_contrast_label = ttk.Label(tone_frame, text="")
+        gray_contrast_label.pack(anchor=tk.E)
+        
+        # 灰度模式的抖动算法（“无”为直接量化）
+        ttk.Label(tone_frame, text="灰度抖动:").pack(anchor=tk.W)
+        self.gray_kernel_var = tk.StringVar(value=config.GRAYSCALE_DITHER or GRAY_DITHER_CHOICES[0])
+        ttk.Combobox(tone_frame, textvariable=self.gray_kernel_var, values=GRAY_DITHER_CHOICES,
+                     state='readonly').pack(fill=tk.X)
+        
+        def update_tone_labels(*args):
+            gamma_label.config(text=f"{self.gamma_var.get():.2f}")
+            gray_contrast_label.config(text=f"{self.gray_contrast_var.get():.2f}")
+        self.gamma_var.trace('w', update_tone_labels)
+        self.gray_contrast_var.trace('w', update_tone_labels)
+        update_tone_labels()
+        
+        self.auto_levels_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tone_frame, text="自动色阶",
+                       variable=self.auto_levels_var).pack(anchor=tk.W)
+        self.equalize_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(tone_frame, text="直方图均衡",
+                       variable=self.equalize_var).pack(anchor=tk.W)
+        
+        # 实时预览
+        self.live_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(params_frame, text="实时预览（调整参数后自动转换）", 
+                       variable=self.live_var, command=self.on_param_change).pack(anchor=tk.W, pady=(10, 0))
+        self.tune_button = ttk.Button(params_frame, text="自动调参（搜索最像原图的参数）",
+                                      command=self.start_auto_tune)
+        self.tune_button.pack(fill=tk.X, pady=(5, 0))
+        for var in (self.mode_var, self.dither_var, self.kernel_var, self.threshold_var,
+                    self.brightness_var, self.contrast_var, self.auto_threshold_var,
+                    self.gamma_var, self.gray_contrast_var, self.gray_kernel_var,
+                    self.auto_levels_var, self.equalize_var):
+            var.trace('w', self.on_param_change)
+        
         ttk.Separator(params_frame, orient=tk.HORIZONTAL).pack(fill=tk.X, pady=10)
         
         # 信息显示
@@ -157,6 +275,9 @@ class ImageConverterGUI:
         # 填充说明文本（你可以在这里修改内容）
         help_text = """【参数调整建议】
 
+不确定怎么调 → 点“自动调参”，按当前模式
+搜索最像原图的参数并填入上面的选项
+
 黑白模式：
 • 照片偏亮 → 降低亮度 (0.7-0.8)
 • 照片偏暗 → 提高亮度 (0.9-1.0)
@@ -166,6 +287,10 @@ class ImageConverterGUI:
 抖动效果：
 • 抖动开启：细节更好，有噪点
 • 抖动关闭：清晰锐利，细节少
+• atkinson：对比更强，适合线条/界面
+• stucki / jjn：噪点更细，适合照片
+• 灰度模式选择抖动算法可减轻色带
+• bayer / blue_noise：有序抖动，动画不闪烁
 
 阈值法（不抖动）：
 • 阈值越低 → 越多黑色
@@ -175,6 +300,7 @@ class ImageConverterGUI:
 灰度模式：
 • 4级灰度效果更柔和
 • 数据量是黑白的2倍
+• 16级灰度层次更细，数据量是黑白的4倍
 • 适合显示照片
 """
         self.text_display.insert(1.0, help_text)
@@ -182,6 +308,48 @@ class ImageConverterGUI:
         # 设置为只读
         self.text_display.config(state=tk.DISABLED)
         
+    def set_profile(self, profile):
+        """切换屏幕型号：按新的尺寸和极性重建处理器、转换器和解码器"""
+        self.profile = profile
+        self.root.title(f"照片转点阵工具 - {profile.width}×{profile.height}墨水屏")
+        self.processor = ImageProcessor(profile.width, profile.height,
+                                        cache_stages=True, resample=config.RESAMPLE)
+        self.converter = MatrixConverter(profile.width, profile.height, layout=profile.layout)
+        self.decoder = MatrixDecoder(profile.width, profile.height, layout=profile.layout)
+    
+    @staticmethod
+    def profile_mode(profile):
+        """型号对应的显示模式"""
+        for value, (_, mode) in MODE_CHOICES.items():
+            if mode == profile.mode:
+                return value
+        return "黑白"
+    
+    def update_mode_labels(self):
+        """显示模式按钮上标出当前型号的数据大小"""
+        for value, (text, mode) in MODE_CHOICES.items():
+            size = self.decoder.frame_size(mode)
+            self.mode_buttons[value].config(text=f"{text} ({mode[0]}-bit, {size / 1024:.1f}KB)")
+    
+    def on_profile_change(self, *args):
+        """选择了新的屏幕型号：已加载的图片按新尺寸重新缩放并预览"""
+        profile = self.profiles[self.profile_var.get()]
+        if profile is self.profile:
+            return
+        self.set_profile(profile)
+        self.update_mode_labels()
+        self.preview_img = None
+        self.preview_canvas.delete("all")
+        if self.original_img is not None:
+            self.processed_img = self.processor.resize(self.original_img)
+            self.display_image(self.processed_img, self.original_canvas)
+        # 修改 mode_var 会触发实时预览；模式没变时手动触发
+        mode = self.profile_mode(profile)
+        if self.mode_var.get() != mode:
+            self.mode_var.set(mode)
+        else:
+            self.on_param_change()
+    
     def update_info(self, message):
         """更新信息框"""
         self.info_text.delete(1.0, tk.END)
@@ -204,83 +372,257 @@ class ImageConverterGUI:
             self.status_label.config(text=f"状态: 正在加载...")
             self.root.update()
             
-            # 加载图片
-            self.original_img = self.processor.load(file_path)
-            if self.original_img is None:
-                messagebox.showerror("错误", "无法加载图片！")
-                return
-            
-            # 调整尺寸
-            self.processed_img = self.processor.resize(self.original_img)
+            # 加载图片并调整尺寸（记录各阶段耗时）
+            with instrumentation.recording() as recorder:
+                self.original_img = self.processor.load(file_path, shrink=config.FAST_LOAD)
+                if self.original_img is None:
+                    messagebox.showerror("错误", "无法加载图片！")
+                    return
+                self.processed_img = self.processor.resize(self.original_img)
             
             # 显示原图
             self.display_image(self.processed_img, self.original_canvas)
             
             # 更新信息
             info = f"文件: {os.path.basename(file_path)}\n"
-            info += f"原始尺寸: {self.original_img.size[0]}×{self.original_img.size[1]}\n"
-            info += f"目标尺寸: 400×300\n"
+            orig_w, orig_h = self.processor.last_load['original_size']
+            dec_w, dec_h = self.processor.last_load['decoded_size']
+            info += f"原始尺寸: {orig_w}×{orig_h}\n"
+            if (dec_w, dec_h) != (orig_w, orig_h):
+                info += f"解码尺寸: {dec_w}×{dec_h}\n"
+            info += f"解码耗时: {self.processor.last_load['decode_time'] * 1000:.0f} ms\n"
+            peak = self.processor.last_load['peak_bytes']
+            if peak is not None:
+                info += f"解码内存峰值: +{peak / 1024 / 1024:.1f} MB\n"
+            info += f"目标尺寸: {self.profile.width}×{self.profile.height} ({self.profile.name})\n"
             info += f"模式: {self.original_img.mode}\n"
+            info += self.format_stages(recorder.records)
             self.update_info(info)
             
-            self.status_label.config(text=f'状态: 图片已加载，点击"转换"按钮')
+            self.preview_img = None
+            if self.live_var.get():
+                self.request_preview(delay=0)
+            else:
+                self.status_label.config(text=f'状态: 图片已加载，点击"转换"按钮')
 
         except Exception as e:
             messagebox.showerror("错误", f"加载失败: {str(e)}")
             self.status_label.config(text=f"状态: 加载失败")
     
+    def current_params(self):
+        """读取当前界面参数（只能在Tk线程调用）"""
+        return {
+            'mode': self.mode_var.get(),
+            'threshold': 'auto' if self.auto_threshold_var.get() else self.threshold_var.get(),
+            'dithering': self.dither_var.get(),
+            'brightness': self.brightness_var.get(),
+            'contrast': self.contrast_var.get(),
+            'gray_contrast': self.gray_contrast_var.get(),
+            'gamma': self.gamma_var.get(),
+            'auto_levels': AUTO_LEVELS_CLIP if self.auto_levels_var.get() else None,
+            'equalize': self.equalize_var.get(),
+            'kernel': None if self.kernel_var.get() == DITHER_CHOICES[0] else self.kernel_var.get(),
+            'gray_kernel': (None if self.gray_kernel_var.get() == GRAY_DITHER_CHOICES[0]
+                            else self.gray_kernel_var.get()),
+        }
+    
+    def render_preview(self, img, params):
+        """按参数转换图片（不访问界面，可以在后台线程调用）"""
+        tone = dict(gamma=params['gamma'], auto_levels=params['auto_levels'],
+                    equalize=params['equalize'])
+        if params['mode'] == "黑白":
+            result = self.processor.convert_to_bw(
+                img,
+                threshold=params['threshold'],
+                use_dithering=params['dithering'],
+                brightness_factor=params['brightness'],
+                contrast_factor=params['contrast'],
+                dither_kernel=params['kernel'],
+                **tone
+            )
+            # 自动阈值时记下实际使用的阈值，用于显示
+            params['used_threshold'] = self.processor.last_threshold
+            return result
+        return self.processor.convert_to_grayscale(img, levels=GRAY_LEVELS[params['mode']],
+                                                   dither_kernel=params['gray_kernel'],
+                                                   contrast_factor=params['gray_contrast'], **tone)
+    
     def convert_image(self):
-        """转换图片"""
+        """转换图片（在后台线程执行，不阻塞界面）"""
         if self.processed_img is None:
             messagebox.showwarning("警告", "请先加载图片！")
             return
         
-        try:
-            mode = self.mode_var.get()
-            
-            self.status_label.config(text=f"状态: 正在转换...")
-            self.root.update()
-            
-            if mode == "黑白":
-                # 黑白模式
-                self.preview_img = self.processor.convert_to_bw(
-                    self.processed_img,
-                    threshold=self.threshold_var.get(),
-                    use_dithering=self.dither_var.get(),
-                    brightness_factor=self.brightness_var.get(),
-                    contrast_factor=self.contrast_var.get()
-                )
-                data_size = 15000
-            else:
-                # 灰度模式
-                self.preview_img = self.processor.convert_to_grayscale(
-                    self.processed_img,
-                    levels=4
-                )
-                data_size = 30000
+        self.request_preview(delay=0)
+    
+    def on_param_change(self, *args):
+        """参数变化时，实时预览模式下自动重新转换"""
+        if self.live_var.get() and self.processed_img is not None:
+            self.request_preview()
+    
+    def request_preview(self, delay=PREVIEW_DELAY_MS):
+        """安排一次预览转换
+        
+        delay 毫秒内的连续调用只保留最后一次（去抖），
+        已排队但被更新请求取代的任务不会执行。
+        """
+        if self._preview_after is not None:
+            self.root.after_cancel(self._preview_after)
+        self._preview_after = self.root.after(delay, self._submit_preview)
+    
+    def _submit_preview(self):
+        self._preview_after = None
+        self._preview_generation += 1
+        self._preview_jobs.put((self._preview_generation, self.processed_img, self.current_params()))
+        self.status_label.config(text=f"状态: 正在转换...")
+    
+    def _preview_worker(self):
+        """后台转换线程：总是只处理最新的任务"""
+        while True:
+            job = self._preview_jobs.get()
+            while not self._preview_jobs.empty():
+                job = self._preview_jobs.get_nowait()
             
-            # 显示预览
-            self.display_image(self.preview_img, self.preview_canvas)
+            generation, img, params = job
+            if generation != self._preview_generation:
+                continue
+            with instrumentation.recording() as recorder:
+                try:
+                    result = self.render_preview(img, params)
+                    error = None
+                except Exception as e:
+                    result, error = None, str(e)
             
-            # 更新信息
-            info = f"转换模式: {mode}\n"
-            info += f"数据大小: {data_size} 字节 ({data_size/1024:.1f} KB)\n"
-            info += f"\n参数:\n"
-            if mode == "黑白":
-                info += f"  抖动: {'是' if self.dither_var.get() else '否'}\n"
-                if not self.dither_var.get():
-                    info += f"  阈值: {self.threshold_var.get()}\n"
-                info += f"  亮度: {self.brightness_var.get():.2f}\n"
-                info += f"  对比度: {self.contrast_var.get():.2f}\n"
+            # 转换期间参数又变了，结果作废
+            if generation == self._preview_generation:
+                self._preview_results.put((generation, img, params, result, error, recorder.records))
+    
+    def start_auto_tune(self):
+        """在后台线程中搜索当前模式的参数（见 auto_tune），完成后填入界面"""
+        if self.processed_img is None:
+            messagebox.showwarning("警告", "请先加载图片！")
+            return
+        params = self.current_params()
+        settings = profile_settings(self.profile, default_settings())
+        settings['grayscale'] = params['mode'] != "黑白"
+        if settings['grayscale']:
+            settings['levels'] = GRAY_LEVELS[params['mode']]
+        settings.update(gamma=params['gamma'], auto_levels=params['auto_levels'],
+                        equalize=params['equalize'])
+        img = self.processed_img
+        
+        def work():
+            try:
+                result, error = auto_tune.tune(img, settings), None
+            except Exception as e:
+                result, error = None, str(e)
+            self._tune_results.put((img, params['mode'], result, error))
+        
+        self.tune_button.config(state=tk.DISABLED)
+        self.status_label.config(text="状态: 正在自动调参...")
+        threading.Thread(target=work, daemon=True).start()
+    
+    def apply_tuned(self, img, mode, result, error):
+        """把调参结果填入界面（图片或模式已经变了时丢弃）"""
+        self.tune_button.config(state=tk.NORMAL)
+        if error is not None:
+            self.status_label.config(text=f"状态: 自动调参失败 - {error}")
+            return
+        if img is not self.processed_img or mode != self.mode_var.get():
+            self.status_label.config(text="状态: 图片或模式已改变，调参结果已丢弃")
+            return
+        params = result['params']
+        if mode == "黑白":
+            self.dither_var.set(params['dithering'])
+            if params['dithering']:
+                self.kernel_var.set(params['dither_kernel'] or DITHER_CHOICES[0])
+                self.brightness_var.set(params['brightness'])
+                self.contrast_var.set(params['contrast'])
             else:
-                info += f"  灰度级别: 4级\n"
-            
-            self.update_info(info)
-            self.status_label.config(text=f"状态: 转换完成，可以导出")
-            
-        except Exception as e:
-            messagebox.showerror("错误", f"转换失败: {str(e)}")
-            self.status_label.config(text=f"状态: 转换失败")
+                self.auto_threshold_var.set(False)
+                self.threshold_var.set(params['threshold'])
+        else:
+            self.gray_kernel_var.set(params['gray_dither'] or GRAY_DITHER_CHOICES[0])
+            self.gray_contrast_var.set(params['gray_contrast'])
+            self.gamma_var.set(params['gamma'])
+        if not self.live_var.get():
+            self.request_preview(delay=0)
+        self.status_label.config(
+            text=f"状态: 自动调参完成 - {auto_tune.describe_params(params)}"
+                 f"（{result['candidates'] + result['refined']} 组, {result['seconds'] * 1000:.0f} ms）")
+    
+    def _poll_preview_results(self):
+        """在Tk线程中取回后台转换结果（以及自动调参结果）并显示"""
+        try:
+            while True:
+                self.apply_tuned(*self._tune_results.get_nowait())
+        except queue.Empty:
+            pass
+        try:
+            while True:
+                generation, img, params, result, error, stages = self._preview_results.get_nowait()
+                if generation != self._preview_generation or img is not self.processed_img:
+                    continue
+                if error is not None:
+                    self.status_label.config(text=f"状态: 转换失败 - {error}")
+                    continue
+                self.preview_img = result
+                self.preview_params = params
+                self.show_preview(params, stages)
+        except queue.Empty:
+            pass
+        self.root.after(PREVIEW_POLL_MS, self._poll_preview_results)
+    
+    @staticmethod
+    def format_stages(records):
+        """各阶段耗时的说明文字（见 instrumentation）"""
+        if not records:
+            return ""
+        text = "\n耗时:\n"
+        for record in records:
+            name = record['stage'].split('.')[-1]
+            text += f"  {name}: {record['wall_ms']:.1f} ms (CPU {record['cpu_ms']:.1f})\n"
+        return text
+    
+    def show_preview(self, params, stages=()):
+        """显示预览图和转换信息，stages 为本次转换各阶段的记录"""
+        mode = params['mode']
+        self.display_image(self.preview_img, self.preview_canvas)
+        
+        if mode == "黑白":
+            data_size = self.decoder.frame_size('1bit')
+        else:
+            data_size = self.decoder.frame_size(mode_for_levels(GRAY_LEVELS[mode]))
+        
+        # 更新信息
+        info = f"屏幕型号: {self.profile.name} ({self.profile.width}×{self.profile.height})\n"
+        info += f"转换模式: {mode}\n"
+        info += f"数据大小: {data_size} 字节 ({data_size/1024:.1f} KB)\n"
+        info += f"\n参数:\n"
+        if mode == "黑白":
+            info += f"  抖动: {(params['kernel'] or 'PIL内置') if params['dithering'] else '否'}\n"
+            if not params['dithering']:
+                if params['threshold'] == 'auto':
+                    info += f"  阈值: {params.get('used_threshold')} (自动)\n"
+                else:
+                    info += f"  阈值: {params['threshold']}\n"
+            info += f"  亮度: {params['brightness']:.2f}\n"
+            info += f"  对比度: {params['contrast']:.2f}\n"
+        else:
+            info += f"  灰度级别: {GRAY_LEVELS[mode]}级\n"
+            if params['gray_kernel']:
+                info += f"  抖动: {params['gray_kernel']}\n"
+            if params['gray_contrast'] != 1.0:
+                info += f"  对比度: {params['gray_contrast']:.2f}\n"
+        if params['gamma'] != 1.0:
+            info += f"  Gamma: {params['gamma']:.2f}\n"
+        if params['auto_levels'] is not None or params['equalize']:
+            info += f"  {'自动色阶 ' if params['auto_levels'] is not None else ''}" \
+                    f"{'直方图均衡' if params['equalize'] else ''}\n"
+        info += self.format_stages(stages)
+        
+        self.update_info(info)
+        self.status_label.config(text=f"状态: 转换完成，可以导出")
     
     def export_data(self):
         """导出数据"""
@@ -292,13 +634,14 @@ class ImageConverterGUI:
             self.status_label.config(text=f"状态: 正在导出...")
             self.root.update()
             
-            mode = self.mode_var.get()
+            mode = self.preview_params['mode']
             
             # 转换为点阵数据
             if mode == "黑白":
                 data = self.converter.convert(self.preview_img, mode='1bit')
             else:
-                data = self.converter.convert(self.preview_img, mode='2bit')
+                data = self.converter.convert(
+                    self.preview_img, mode=mode_for_levels(GRAY_LEVELS[mode]))
             
             # 选择保存位置
             file_path = filedialog.asksaveasfilename(
@@ -317,13 +660,11 @@ class ImageConverterGUI:
             # 生成并保存
             if file_path.endswith('.bin'):
                 # 二进制格式
-                with open(file_path, 'wb') as f:
-                    f.write(bytes(data))
+                self.generator.generate_binary(data, file_path)
             else:
                 # C数组格式
-                c_code = self.generator.generate_c_array(data, "image_400x300")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(c_code)
+                self.generator.save_c_array(data, file_path,
+                                            f"image_{self.profile.width}x{self.profile.height}")
             
             # 同时保存预览图
             preview_path = file_path.rsplit('.', 1)[0] + '_preview.png'
@@ -359,41 +700,41 @@ class ImageConverterGUI:
             self.status_label.config(text=f"状态: 正在验证...")
             self.root.update()
             
-            # 读取数据
-            if file_path.endswith('.bin'):
-                with open(file_path, 'rb') as f:
-                    data = list(f.read())
-            else:
-                # 从C数组读取
-                import re
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                hex_values = re.findall(r'0x[0-9A-Fa-f]{2}', content)
-                data = [int(h, 16) for h in hex_values]
+            # 读取数据（C数组取第一个数组，压缩的数据先解压）
+            frame_sizes = [self.decoder.frame_size(m) for m in ('1bit', '2bit', '4bit')]
+            data, codec = read_asset(file_path, frame_sizes=frame_sizes)
             
             # 根据数据大小判断模式
-            if len(data) == 15000:
-                mode = '1bit'
-            elif len(data) == 30000:
-                mode = '2bit'
-            else:
-                messagebox.showerror("错误", f"数据大小不匹配！\n期望: 15000或30000字节\n实际: {len(data)}字节")
+            mode = self.decoder.detect_mode(data)
+            if mode is None:
+                expected = "或".join(str(self.decoder.frame_size(m)) for m in ('1bit', '2bit', '4bit'))
+                messagebox.showerror("错误", f"数据大小不匹配！\n期望: {expected}字节\n实际: {len(data)}字节")
                 return
             
             # 还原图像
-            if mode == '1bit':
-                restored = self.restore_1bit(data)
-            else:
-                restored = self.restore_2bit(data)
+            restored = self.decoder.to_image(data, mode)
             
             # 显示
             self.display_image(restored, self.preview_canvas)
             
+            # 有批量转换写出的预览图时逐位比对
+            compared = ""
+            preview_path = os.path.splitext(file_path)[0] + PREVIEW_SUFFIX
+            if os.path.exists(preview_path):
+                preview = Image.open(preview_path)
+                if preview.size == (self.decoder.width, self.decoder.height):
+                    expected = preview_codes(preview, mode, self.decoder.layout)
+                    if expected == data:
+                        compared = "\n与预览图逐位一致"
+                    else:
+                        diff = self.decoder.unpack(data, mode) != self.decoder.unpack(expected, mode)
+                        compared = f"\n与预览图不一致: {int(diff.sum())} 个像素不同"
+            
             messagebox.showinfo("验证成功", 
                               f"数据验证成功！\n\n"
                               f"模式: {mode}\n"
-                              f"数据大小: {len(data)} 字节\n"
-                              f"图像尺寸: 400×300")
+                              f"数据大小: {len(data)} 字节" + (f"（{codec} 解压后）" if codec else "") + "\n"
+                              f"图像尺寸: {self.decoder.width}×{self.decoder.height}" + compared)
             
             self.status_label.config(text=f"状态: 验证完成")
             
@@ -401,65 +742,30 @@ class ImageConverterGUI:
             messagebox.showerror("错误", f"验证失败: {str(e)}")
             self.status_label.config(text=f"状态: 验证失败")
     
-    def restore_1bit(self, data):
-        """还原1-bit黑白图像"""
-        import numpy as np
-        img = Image.new('L', (400, 300), 255)
-        pixels = img.load()
-        
-        byte_idx = 0
-        for y in range(300):
-            for x in range(0, 400, 8):
-                if byte_idx >= len(data):
-                    break
-                byte_val = data[byte_idx]
-                for bit in range(8):
-                    if x + bit < 400:
-                        if (byte_val >> (7 - bit)) & 1:
-                            pixels[x + bit, y] = 0
-                        else:
-                            pixels[x + bit, y] = 255
-                byte_idx += 1
-        
-        return img
-    
-    def restore_2bit(self, data):
-        """还原2-bit灰度图像"""
-        import numpy as np
-        img = Image.new('L', (400, 300), 255)
-        pixels = img.load()
-        
-        byte_idx = 0
-        for y in range(300):
-            for x in range(0, 400, 4):
-                if byte_idx >= len(data):
-                    break
-                byte_val = data[byte_idx]
-                for i in range(4):
-                    if x + i < 400:
-                        shift = 6 - (i * 2)
-                        gray_level = (byte_val >> shift) & 0x03
-                        pixel_value = gray_level * 85
-                        pixels[x + i, y] = pixel_value
-                byte_idx += 1
-        
-        return img
-    
     def display_image(self, pil_image, canvas):
         """在画布上显示图像"""
-        # 创建缩略图
-        display_img = pil_image.copy()
-        display_img.thumbnail((400, 300), Image.LANCZOS)
-        
-        # 转换为Tkinter格式
-        photo = ImageTk.PhotoImage(display_img)
+        # 同一张图再次显示时直接复用上次的缩略图
+        cached = self._thumbnails.get(str(canvas))
+        if cached is not None and cached[0] is pil_image:
+            photo = cached[1]
+        else:
+            # 创建缩略图（已经不超过画布大小时不需要复制和缩放）
+            if pil_image.width > CANVAS_WIDTH or pil_image.height > CANVAS_HEIGHT:
+                display_img = pil_image.copy()
+                display_img.thumbnail((CANVAS_WIDTH, CANVAS_HEIGHT), Image.LANCZOS)
+            else:
+                display_img = pil_image
+            
+            # 转换为Tkinter格式
+            photo = ImageTk.PhotoImage(display_img)
+            self._thumbnails[str(canvas)] = (pil_image, photo)
         
         # 保存引用（防止被垃圾回收）
         canvas.image = photo
         
         # 清空并显示
         canvas.delete("all")
-        canvas.create_image(200, 150, image=photo)
+        canvas.create_image(CANVAS_WIDTH // 2, CANVAS_HEIGHT // 2, image=photo)
 
 def main():
     root = tk.Tk()
@@ -1,29 +1,220 @@
-from PIL import Image, ImageOps, ImageEnhance
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageOps
+from dithering import dither
+from instrumentation import stage
+from tone_curve import ToneCurve, histogram, otsu_threshold, remap_histogram
+
+# 缩放方式: 名称 → (滤波器, reducing_gap)
+# reducing_gap 表示先用整数倍快速缩小到目标尺寸的若干倍，再做精细重采样
+RESAMPLE_MODES = {
+    'exact': (Image.LANCZOS, None),     # 全分辨率LANCZOS（原来的做法）
+    'quality': (Image.LANCZOS, 3.0),    # 与 exact 几乎看不出差别，大图快很多
+    'speed': (Image.BILINEAR, 2.0),     # 最快，细节略软
+}
+
+
+def _pixel_bytes(mode):
+    """PIL 内存中每像素占用的字节（多通道的8位模式按4字节对齐存放）"""
+    if mode in ('1', 'L', 'P'):
+        return 1
+    if mode.startswith('I;16'):
+        return 2
+    return 4
+
+
+try:
+    import resource
+except ImportError:     # Windows 没有 resource 模块，只给出估算值
+    resource = None
+
+
+def _proc_status_bytes(field):
+    """/proc/self/status 中的内存项（字节）"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise OSError(f"/proc/self/status 中没有 {field}")
+
+
+def _peak_start():
+    """开始统计内存峰值，返回给 _peak_since 的起点；不支持的平台返回None
+
+    Linux 上把进程的峰值（VmHWM）重置为当前常驻内存，之后的峰值只反映这段时间；
+    其他平台用 ru_maxrss，只有超过进程以往的峰值才会计入
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return 'VmHWM', _proc_status_bytes('VmRSS')
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    return 'ru_maxrss', _max_rss()
+
+
+def _peak_since(start):
+    """从 _peak_start 起内存峰值比起点增加的字节数"""
+    if start is None:
+        return None
+    source, before = start
+    if source == 'VmHWM':
+        return _proc_status_bytes('VmHWM') - before
+    return _max_rss() - before
+
+
+def _max_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 的单位是KB，macOS 是字节
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _decode_in_worker(image_path, width, height, shrink):
+    processor = ImageProcessor(width, height)
+    processor.open_image(image_path, shrink=shrink)
+    return processor.last_load
+
+
+def measure_decode(image_path, width, height, shrink=False):
+    """在一个新进程中解码一次，返回该次的 last_load（见 ImageProcessor.open_image）
+
+    新进程中没有以前解码留下的缓存和内存峰值，'peak_bytes' 不受调用方已经处理过的图片影响
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(_decode_in_worker, image_path, width, height, shrink).result()
+
 
 class ImageProcessor:
-    def __init__(self, width, height):
+    def __init__(self, width, height, cache_stages=False, resample='exact'):
+        """
+        参数:
+            cache_stages: 记住每个处理阶段（灰度、亮度/对比度）的上一次结果，
+                          输入图像和上游参数不变时直接复用，适合界面中反复调参
+            resample: 缩放方式，见 RESAMPLE_MODES
+        """
+        if resample not in RESAMPLE_MODES:
+            raise ValueError(f"不支持的缩放方式: {resample}，请使用 {' / '.join(RESAMPLE_MODES)}")
         self.width = width
         self.height = height
+        self.cache_stages = cache_stages
+        self.resample = resample
+        self._stages = {}
+        self.last_load = None
+        self.last_threshold = None   # 上一次阈值化实际使用的阈值（自动阈值时由 Otsu 法确定）
+    
+    def _stage(self, name, source, params, compute):
+        """带记忆的处理阶段
+        
+        source 是上游图像（按对象身份比较），params 是本阶段参数；
+        二者都与上次相同时返回上次结果，否则重新计算
+        """
+        if not self.cache_stages:
+            return compute()
+        cached = self._stages.get(name)
+        if cached is not None and cached[0] is source and cached[1] == params:
+            return cached[2]
+        result = compute()
+        self._stages[name] = (source, params, result)
+        return result
+    
+    def clear_stages(self):
+        """清空阶段缓存"""
+        self._stages.clear()
     
-    def load(self, image_path):
-        """加载图片"""
+    def load(self, image_path, shrink=False):
+        """加载图片
+        
+        参数:
+            shrink: 按目标尺寸缩小解码（见 open_image）
+        """
         try:
-            img = Image.open(image_path)
-            print(f"原始尺寸: {img.size[0]}X{img.size[1]}")
+            img = self.open_image(image_path, shrink)
+            print(f"原始尺寸: {self.last_load['original_size'][0]}X{self.last_load['original_size'][1]}")
+            if shrink:
+                print(self.load_report())
             return img
         except Exception as e:
             print(f"错误: 无法加载图片 - {e}")
             return None
     
+    @stage
+    def open_image(self, image_path, shrink=False, decoded=None):
+        """打开并解码图片，出错时抛出异常
+        
+        shrink=True 时，JPEG 利用DCT缩放直接以 1/2、1/4 或 1/8 尺寸解码
+        （仍不小于本处理器缩放后需要的尺寸），大照片的解码时间和内存都大幅减少。
+        缩小的倍数只由本处理器的目标尺寸决定，同一张图转换到哪些其他尺寸不影响结果。
+        decoded 是多个 ImageProcessor（其他屏幕尺寸）共用的字典 {(模式, 解码尺寸): 图像}：
+        解码尺寸相同时直接复用已经解码的图像，不再重复解码。
+        解码信息记录在 self.last_load 中（复用时 'reused' 为 True）。
+        其中 'peak_bytes' 是解码期间进程内存峰值比解码前增加的字节数（实测，Linux 上准确；
+        其他平台用 ru_maxrss，只计超过进程以往峰值的部分，可以用 measure_decode 在新进程中测），
+        Windows 上为 None。
+        """
+        img = Image.open(image_path)
+        original_size = img.size
+        
+        peak = _peak_start()
+        start = time.perf_counter()
+        if shrink and img.format == 'JPEG':
+            mode = img.mode if img.mode in ('L', 'RGB') else 'RGB'
+            img.draft(mode, self.cover_size(img.size))
+        key = (img.mode, img.size)
+        reused = decoded is not None and key in decoded
+        if reused:
+            img.close()
+            img = decoded[key]
+        else:
+            img.load()
+            if decoded is not None:
+                decoded[key] = img
+        decode_time = time.perf_counter() - start
+        
+        pixel_bytes = _pixel_bytes(img.mode)
+        self.last_load = {
+            'original_size': original_size,
+            'decoded_size': img.size,
+            'decode_time': decode_time,
+            'reused': reused,
+            'peak_bytes': _peak_since(peak),
+            # 解码缓冲大小的估算（像素数×PIL每像素占用的字节），实测值见 peak_bytes
+            'decoded_bytes': img.size[0] * img.size[1] * pixel_bytes,
+            'full_bytes': original_size[0] * original_size[1] * pixel_bytes,
+        }
+        return img
+    
+    def load_report(self):
+        """上一次加载的解码尺寸、耗时和内存"""
+        info = self.last_load
+        ow, oh = info['original_size']
+        dw, dh = info['decoded_size']
+        mb = 1024 * 1024
+        report = (f"解码: {ow}×{oh} → {dw}×{dh}, {info['decode_time'] * 1000:.1f} ms, "
+                  f"解码缓冲约 {info['decoded_bytes'] / mb:.1f} MB (全尺寸约 {info['full_bytes'] / mb:.1f} MB，估算)")
+        if info['peak_bytes'] is not None:
+            report += f", 进程内存峰值 +{info['peak_bytes'] / mb:.1f} MB (实测)"
+        return report
+    
+    def cover_size(self, size):
+        """等比缩放到刚好覆盖目标尺寸时的大小"""
+        orig_w, orig_h = size
+        ratio = max(self.width / orig_w, self.height / orig_h)
+        return int(orig_w * ratio), int(orig_h * ratio)
+    
+    @stage
     def resize(self, img):
         """智能缩放到目标尺寸"""
-        orig_w, orig_h = img.size
         target_w, target_h = self.width, self.height
         
-        ratio = max(target_w / orig_w, target_h / orig_h)
-        new_w = int(orig_w * ratio)
-        new_h = int(orig_h * ratio)
-        img_scaled = img.resize((new_w, new_h), Image.LANCZOS)
+        new_w, new_h = self.cover_size(img.size)
+        resample, reducing_gap = RESAMPLE_MODES[self.resample]
+        img_scaled = img.resize((new_w, new_h), resample, reducing_gap=reducing_gap)
         
         left = (new_w - target_w) // 2
         top = (new_h - target_h) // 2
@@ -35,52 +226,95 @@ class ImageProcessor:
         
         return img_cropped
     
-    def convert_to_grayscale(self, img, levels=4):
+    def _tone(self, img_gray, curve):
+        """按色调曲线调整灰度图（一次查表），曲线不做调整时原样返回"""
+        if curve.identity:
+            return img_gray
+        return self._stage('tone', img_gray, curve.params(),
+                           lambda: img_gray.point(curve.lut(histogram(img_gray)).tolist()))
+    
+    @stage
+    def convert_to_grayscale(self, img, levels=4, dither_kernel=None, brightness_factor=1.0,
+                             contrast_factor=1.0, gamma=1.0, auto_levels=None, equalize=False):
         """转换为指定级别的灰度图
         
         参数:
             img: 输入图像
             levels: 灰度级别（2/4/16/256）
+            dither_kernel: 抖动算法（误差扩散核或有序抖动，见 dithering.METHODS），
+                           None 表示直接量化
+            brightness_factor, contrast_factor, gamma, auto_levels, equalize:
+                色调调整（见 tone_curve.ToneCurve），默认不调整
         """
-        import numpy as np
-        
         # 转为灰度图
-        img_gray = img.convert('L')
+        img_gray = self._stage('gray', img, (), lambda: img.convert('L'))
+        curve = ToneCurve(brightness_factor, contrast_factor, gamma, auto_levels, equalize)
         
-        # 量化到指定灰度级别
-        pixels = np.array(img_gray, dtype=np.uint16)  # 使用uint16避免溢出
+        if dither_kernel is not None:
+            img_tone = self._tone(img_gray, curve)
+            return self._stage('levels', img_tone, (levels, dither_kernel),
+                               lambda: Image.fromarray(
+                                   dither(np.asarray(img_tone), levels, dither_kernel)))
         
         # 映射0-255到0-(levels-1)
         # 例如4级: 0-63→0, 64-127→1, 128-191→2, 192-255→3
-        quantized = (pixels * levels // 256).astype(np.uint8)
+        quantized = np.arange(256, dtype=np.uint16) * levels // 256
         
         # 映射回0-255用于显示
         # 例如4级: 0→0, 1→85, 2→170, 3→255
         if levels > 1:
-            display = (quantized.astype(np.uint16) * 255 // (levels - 1)).astype(np.uint8)
+            display = (quantized * 255 // (levels - 1)).astype(np.uint8)
         else:
-            display = quantized
+            display = quantized.astype(np.uint8)
+        
+        # 色调和量化合成一张查找表，一次查表完成
+        def quantize():
+            lut = curve.lut(histogram(img_gray) if curve.needs_histogram else None)
+            return img_gray.point(display[lut].tolist())
         
-        img_result = Image.fromarray(display, mode='L')
-        return img_result
+        return self._stage('levels', img_gray, (levels, curve.params()), quantize)
     
+    @stage
     def convert_to_bw(self, img, threshold=128, use_dithering=True, 
-                      brightness_factor=0.95, contrast_factor=1.5):
-        """转为黑白图（二值化）"""
+                      brightness_factor=0.95, contrast_factor=1.5, dither_kernel=None,
+                      gamma=1.0, auto_levels=None, equalize=False):
+        """转为黑白图（二值化）
+        
+        参数:
+            threshold: 阈值（不抖动时，大于阈值为白），'auto' 表示按直方图用 Otsu 法自动确定
+            dither_kernel: 抖动算法（误差扩散核或有序抖动，见 dithering.METHODS），
+                           None 表示PIL内置的Floyd-Steinberg
+            brightness_factor, contrast_factor: 亮度/对比度（只在抖动时使用，与原来一致）
+            gamma, auto_levels, equalize: 色调调整（见 tone_curve.ToneCurve），默认不调整
+        """
         # 转为灰度图
-        img_gray = img.convert('L')
+        img_gray = self._stage('gray', img, (), lambda: img.convert('L'))
         
         if use_dithering:
-            # 使用Floyd-Steinberg抖动算法
-            contrast = ImageEnhance.Contrast(img_gray)
-            img_gray = contrast.enhance(contrast_factor)
-            
-            brightness = ImageEnhance.Brightness(img_gray)
-            img_gray = brightness.enhance(brightness_factor)
-
-            img_bw = img_gray.convert('1', dither=Image.FLOYDSTEINBERG)
+            # 亮度/对比度等色调调整合成一张查找表，一次查表完成
+            img_tone = self._tone(img_gray, ToneCurve(brightness_factor, contrast_factor,
+                                                      gamma, auto_levels, equalize))
+            if dither_kernel is None:
+                img_bw = self._stage('bw', img_tone, ('dither',),
+                                     lambda: img_tone.convert('1', dither=Image.FLOYDSTEINBERG))
+            else:
+                img_bw = self._stage('bw', img_tone, ('dither', dither_kernel),
+                                     lambda: Image.fromarray(
+                                         dither(np.asarray(img_tone), 2, dither_kernel)
+                                     ).convert('1', dither=Image.NONE))
         else:
-            img_bw = img_gray.point(lambda x: 255 if x > threshold else 0, '1')
+            curve = ToneCurve(gamma=gamma, auto_levels=auto_levels, equalize=equalize)
+            
+            def binarize():
+                # 色调和阈值合成一张查找表；自动阈值用调整后的直方图（由原直方图换算）
+                hist = histogram(img_gray) if curve.needs_histogram or threshold == 'auto' else None
+                lut = curve.lut(hist)
+                level = otsu_threshold(remap_histogram(hist, lut)) if threshold == 'auto' else threshold
+                self.last_threshold = level
+                return img_gray.point(np.where(lut > level, 255, 0).tolist(), '1')
+            
+            img_bw = self._stage('bw', img_gray, ('threshold', threshold, curve.params()),
+                                 binarize)
         
         return img_bw
     
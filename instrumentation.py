@@ -0,0 +1,185 @@
+"""各处理阶段的计时和内存统计
+
+ImageProcessor、MatrixConverter、OutputGenerator 的主要方法都用 @stage 标记。
+没有注册钩子时，每次调用只多一次列表判断，开销可以忽略；
+注册钩子后，每个阶段结束时钩子收到一条记录:
+    {'stage': 'ImageProcessor.resize', 'wall_ms': ..., 'cpu_ms': ..., 'peak_kb': ...}
+wall_ms 为实际耗时，cpu_ms 为当前线程的CPU时间；peak_kb 只在开启内存统计时给出，
+是阶段内相对开始时新增分配的峰值（tracemalloc 统计，包括Python对象和NumPy数组，
+不包括PIL内部的图像缓冲，解码的实测内存峰值见 ImageProcessor.last_load['peak_bytes']）。
+注意 tracemalloc 会明显拖慢大量创建Python对象的阶段（如LZSS压缩慢约30倍），
+同时统计内存时耗时只作参考。
+
+用法示例:
+    with recording(memory=True) as recorder:
+        with recorder.context(image='a.jpg'):
+            ...转换...
+    print(recorder.format_summary())
+"""
+import contextlib
+import functools
+import json
+import threading
+import time
+import tracemalloc
+import unicodedata
+
+_hooks = []
+_local = threading.local()
+# 需要内存统计的钩子数，由本模块开启的 tracemalloc 在降为0时关闭
+_memory_users = 0
+_started_tracing = False
+
+
+def stage(fn=None, name=None):
+    """装饰器：把函数/方法标记为一个处理阶段，名称默认为限定名（如 MatrixConverter.convert）"""
+    if fn is None:
+        return functools.partial(stage, name=name)
+    stage_name = name or fn.__qualname__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _hooks:
+            return fn(*args, **kwargs)
+        return _measure(stage_name, fn, args, kwargs)
+    return wrapper
+
+
+def _measure(name, fn, args, kwargs):
+    stack = _local.__dict__.setdefault('stack', [])
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # 嵌套阶段会重置峰值，先把外层到目前为止的峰值记下
+        if stack:
+            stack[-1] = max(stack[-1], peak)
+        tracemalloc.reset_peak()
+    stack.append(0)
+
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.thread_time() - cpu
+        inner_peak = stack.pop()
+        record = {'stage': name, 'wall_ms': round(wall * 1000, 3), 'cpu_ms': round(cpu * 1000, 3)}
+        if tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], inner_peak)
+            record['peak_kb'] = round(max(peak - current, 0) / 1024, 1)
+            if stack:
+                stack[-1] = max(stack[-1], peak)
+        for hook in list(_hooks):
+            hook(record)
+
+
+def add_hook(hook, memory=False):
+    """注册钩子（接收一条记录的可调用对象）；memory=True 时开启内存统计"""
+    global _memory_users, _started_tracing
+    if memory:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+        _memory_users += 1
+    _hooks.append(hook)
+
+
+def remove_hook(hook, memory=False):
+    """注销钩子，memory 与注册时一致"""
+    global _memory_users, _started_tracing
+    _hooks.remove(hook)
+    if memory:
+        _memory_users -= 1
+        if _memory_users == 0 and _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+class StageRecorder:
+    """收集阶段记录的钩子
+
+    只记录创建它的线程中的阶段（界面的后台线程和主线程互不干扰）。
+    """
+
+    def __init__(self):
+        self.records = []
+        self.thread = threading.get_ident()
+        self._fields = {}
+
+    def __call__(self, record):
+        if threading.get_ident() == self.thread:
+            self.records.append({**self._fields, **record})
+
+    @contextlib.contextmanager
+    def context(self, **fields):
+        """期间的记录都附带这些字段（如 image=路径）"""
+        saved = self._fields
+        self._fields = {**saved, **fields}
+        try:
+            yield self
+        finally:
+            self._fields = saved
+
+    def write_jsonl(self, f):
+        """每条记录一行JSON"""
+        for record in self.records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def summary(self):
+        """按阶段汇总，返回按总耗时从大到小排列的列表"""
+        return summarize(self.records)
+
+    def format_summary(self):
+        return format_summary(self.summary())
+
+
+def summarize(records):
+    """按阶段汇总记录: [{'stage', 'count', 'wall_ms', 'cpu_ms', 'mean_ms', 'peak_kb'}, ...]"""
+    stages = {}
+    for record in records:
+        item = stages.setdefault(record['stage'], {
+            'stage': record['stage'], 'count': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'peak_kb': None})
+        item['count'] += 1
+        item['wall_ms'] += record['wall_ms']
+        item['cpu_ms'] += record['cpu_ms']
+        if 'peak_kb' in record:
+            item['peak_kb'] = max(item['peak_kb'] or 0, record['peak_kb'])
+    for item in stages.values():
+        item['mean_ms'] = item['wall_ms'] / item['count']
+    return sorted(stages.values(), key=lambda item: -item['wall_ms'])
+
+
+def _width(text):
+    """显示宽度（中文字符占两格）"""
+    return sum(2 if unicodedata.east_asian_width(c) in 'WF' else 1 for c in text)
+
+
+def _ljust(text, width):
+    return text + ' ' * max(width - _width(text), 0)
+
+
+def _rjust(text, width):
+    return ' ' * max(width - _width(text), 0) + text
+
+
+def format_summary(summary):
+    """汇总表的文本形式"""
+    name_width = max([len(item['stage']) for item in summary] + [8]) + 2
+    columns = ['次数', '总耗时ms', '平均ms', 'CPU ms', '峰值KB']
+    lines = [_ljust('阶段', name_width) + ''.join(_rjust(c, 10) for c in columns)]
+    for item in summary:
+        peak = '-' if item['peak_kb'] is None else f"{item['peak_kb']:.0f}"
+        values = [str(item['count']), f"{item['wall_ms']:.1f}", f"{item['mean_ms']:.2f}",
+                  f"{item['cpu_ms']:.1f}", peak]
+        lines.append(_ljust(item['stage'], name_width) + ''.join(_rjust(v, 10) for v in values))
+    return '\n'.join(lines)
+
+
+@contextlib.contextmanager
+def recording(memory=False):
+    """在 with 块内收集本线程的阶段记录，产生 StageRecorder"""
+    recorder = StageRecorder()
+    add_hook(recorder, memory)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder, memory)
@@ -1,7 +1,7 @@
 from PIL import Image
 import config
 from image_processor import ImageProcessor
-from matrix_converter import MatrixConverter
+from matrix_converter import MatrixConverter, mode_for_levels
 from output_generator import OutputGenerator
 
 def main():
@@ -10,16 +10,17 @@ def main():
     
     print("="*50)
     mode_str = f"{config.GRAYSCALE_LEVELS}级灰度" if config.USE_GRAYSCALE else "黑白"
-    print(f"E-Paper 图片转点阵工具 (400×300, {mode_str})")
+    print(f"E-Paper 图片转点阵工具 ({config.EPAPER_WIDTH}×{config.EPAPER_HEIGHT}, {mode_str})")
     print("="*50)
     
-    processor = ImageProcessor(config.EPAPER_WIDTH, config.EPAPER_HEIGHT)
+    processor = ImageProcessor(config.EPAPER_WIDTH, config.EPAPER_HEIGHT,
+                               resample=config.RESAMPLE)
     converter = MatrixConverter(config.EPAPER_WIDTH, config.EPAPER_HEIGHT)
     generator = OutputGenerator()
     
     # 1. 加载图片
     print(f"\n[1/5] 加载图片: {input_image}")
-    img = processor.load(input_image)
+    img = processor.load(input_image, shrink=config.FAST_LOAD)
     if img is None:
         return
     
@@ -33,9 +34,15 @@ def main():
         print(f"[3/5] 转换为{config.GRAYSCALE_LEVELS}级灰度")
         img_processed = processor.convert_to_grayscale(
             img_resized, 
-            levels=config.GRAYSCALE_LEVELS
+            levels=config.GRAYSCALE_LEVELS,
+            dither_kernel=config.GRAYSCALE_DITHER,
+            brightness_factor=config.GRAY_BRIGHTNESS,
+            contrast_factor=config.GRAY_CONTRAST,
+            gamma=config.GAMMA,
+            auto_levels=config.AUTO_LEVELS,
+            equalize=config.EQUALIZE
         )
-        mode = '2bit'
+        mode = mode_for_levels(config.GRAYSCALE_LEVELS)
     else:
         # 黑白模式
         dither_str = "启用抖动" if config.DITHERING else f"阈值={config.THRESHOLD}"
@@ -45,9 +52,15 @@ def main():
             threshold=config.THRESHOLD,
             use_dithering=config.DITHERING,
             brightness_factor=config.BRIGHTNESS_FACTOR,
-            contrast_factor=config.CONTRAST_FACTOR
+            contrast_factor=config.CONTRAST_FACTOR,
+            dither_kernel=config.DITHER_KERNEL,
+            gamma=config.GAMMA,
+            auto_levels=config.AUTO_LEVELS,
+            equalize=config.EQUALIZE
         )
         mode = '1bit'
+        if not config.DITHERING and config.THRESHOLD == 'auto':
+            print(f"   自动阈值: {processor.last_threshold}")
     
     # 保存预览
     processor.preview(img_processed, 'preview.png')
@@ -59,10 +72,7 @@ def main():
     
     # 5. 生成输出文件
     print(f"[5/5] 生成输出文件: {output_file}")
-    c_code = generator.generate_c_array(data, "image_400x300")
-    
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(c_code)
+    generator.save_c_array(data, output_file, f"image_{config.EPAPER_WIDTH}x{config.EPAPER_HEIGHT}")
     
     print("\n" + "="*50)
     print("✓ 转换完成！")
@@ -1,9 +1,218 @@
 import numpy as np
+from instrumentation import stage
+
+# 支持的模式及对应的每像素位数
+MODES = {'1bit': 1, '2bit': 2, '4bit': 4, '8bit': 8}
+
+
+def mode_to_bpp(mode):
+    """模式名转每像素位数"""
+    if mode not in MODES:
+        raise ValueError(f"不支持的模式: {mode}，请使用 {' / '.join(MODES)}")
+    return MODES[mode]
+
+
+def mode_for_levels(levels):
+    """按灰度级别选择能容纳它的最小模式（2级→1bit，4级→2bit，16级→4bit）"""
+    for mode, bpp in MODES.items():
+        if levels <= (1 << bpp):
+            return mode
+    raise ValueError(f"灰度级别过多: {levels}，最多支持256级")
+
+
+def level_lut(bpp, levels=None):
+    """生成 0-255 灰度值到 bpp 位编码的查找表
+    
+    参数:
+        bpp: 每像素位数
+        levels: None、灰度级数或256项查找表，见 MatrixConverter.pack_nbit
+    """
+    if bpp not in MODES.values():
+        raise ValueError(f"不支持的位数: {bpp}，必须能整除8")
+    max_code = (1 << bpp) - 1
+    
+    if levels is None:
+        levels = max_code + 1
+    if np.isscalar(levels):
+        if not 2 <= levels <= max_code + 1:
+            raise ValueError(f"{bpp}位最多表示{max_code + 1}级灰度，不能是{levels}级")
+        # 与原来的 pixel * levels // 256 量化一致
+        return (np.arange(256) * levels // 256).astype(np.uint8)
+    
+    lut = np.asarray(levels)
+    if lut.shape != (256,):
+        raise ValueError("灰度查找表必须有256项")
+    if lut.min() < 0 or lut.max() > max_code:
+        raise ValueError(f"灰度查找表的编码必须在0-{max_code}之间")
+    return lut.astype(np.uint8)
+
+
+# 扫描方式和位序
+SCANS = ('row', 'column', 'page')
+BIT_ORDERS = ('msb', 'lsb')
+
+
+class Layout:
+    """显存数据排列：旋转、镜像、扫描方向、位序和极性
+    
+    打包前依次: 镜像（'h' 左右翻转，'v' 上下翻转）→ 顺时针旋转 rotate 度 → 按扫描方式打包
+        row     逐行，一个字节装同一行相邻的 8//bpp 个像素（默认）
+        column  逐列，一个字节装同一列上下相邻的像素，一列写完再写下一列
+        page    分页（SSD1306 等）：每 8//bpp 行为一页，一个字节装一页内同一列的像素，
+                一页从左到右写完再写下一页
+    bit_order: 'msb' 靠前（左/上）的像素在高位，'lsb' 在低位
+    invert: 所有位取反（1bit 变为白=1，灰度编码变为 最大值-编码），补齐的位同样取反，仍表示白色
+    
+    全部是NumPy的视图变换（翻转、转置），不逐像素循环。
+    """
+    
+    def __init__(self, rotate=0, mirror=None, scan='row', bit_order='msb', invert=False):
+        if rotate not in (0, 90, 180, 270):
+            raise ValueError(f"不支持的旋转角度: {rotate}，请使用 0 / 90 / 180 / 270")
+        if mirror not in (None, 'h', 'v'):
+            raise ValueError(f"不支持的镜像方式: {mirror}，请使用 None / 'h' / 'v'")
+        if scan not in SCANS:
+            raise ValueError(f"不支持的扫描方式: {scan}，请使用 {' / '.join(SCANS)}")
+        if bit_order not in BIT_ORDERS:
+            raise ValueError(f"不支持的位序: {bit_order}，请使用 {' / '.join(BIT_ORDERS)}")
+        self.rotate = rotate
+        self.mirror = mirror
+        self.scan = scan
+        self.bit_order = bit_order
+        self.invert = bool(invert)
+    
+    def to_dict(self):
+        """参数字典（可以 Layout(**d) 还原，也可以放进JSON）"""
+        return {'rotate': self.rotate, 'mirror': self.mirror, 'scan': self.scan,
+                'bit_order': self.bit_order, 'invert': self.invert}
+    
+    def __eq__(self, other):
+        return isinstance(other, Layout) and self.to_dict() == other.to_dict()
+    
+    def __hash__(self):
+        return hash(tuple(self.to_dict().values()))
+    
+    def __repr__(self):
+        changed = [f"{k}={v!r}" for k, v in self.to_dict().items()
+                   if v != Layout.DEFAULTS[k]]
+        return f"Layout({', '.join(changed)})"
+    
+    def panel_size(self, width, height):
+        """旋转后（显存中）的 (宽, 高)"""
+        return (height, width) if self.rotate in (90, 270) else (width, height)
+    
+    def frame_size(self, width, height, bpp):
+        """一帧的数据字节数（按扫描方向补齐到整字节）"""
+        w, h = self.panel_size(width, height)
+        if self.scan == 'row':
+            return (w * bpp + 7) // 8 * h
+        return (h * bpp + 7) // 8 * w
+    
+    def orient(self, pixels):
+        """图像方向 → 显存方向（镜像后旋转，返回视图）"""
+        if self.mirror == 'h':
+            pixels = pixels[:, ::-1]
+        elif self.mirror == 'v':
+            pixels = pixels[::-1]
+        return np.rot90(pixels, -(self.rotate // 90))
+    
+    def restore(self, pixels):
+        """显存方向 → 图像方向（orient 的逆）"""
+        pixels = np.rot90(pixels, self.rotate // 90)
+        if self.mirror == 'h':
+            pixels = pixels[:, ::-1]
+        elif self.mirror == 'v':
+            pixels = pixels[::-1]
+        return pixels
+
+
+Layout.DEFAULTS = Layout().to_dict()
+
+
+def pack_rows(codes, bpp, bit_order='msb'):
+    """把 (行数, 像素数) 的编码数组逐行打包，返回 (行数, 每行字节数) 的uint8数组
+    
+    行尾不足一个字节时补0
+    """
+    if bpp == 8:
+        return np.ascontiguousarray(codes, dtype=np.uint8)
+    if bpp == 1:
+        # 旋转/转置后的视图先整理成连续内存，packbits 快得多
+        codes = np.ascontiguousarray(codes)
+        return np.packbits(codes, axis=1, bitorder='big' if bit_order == 'msb' else 'little')
+    
+    per_byte = 8 // bpp
+    height, width = codes.shape
+    pad = (-width) % per_byte
+    if pad:
+        codes = np.pad(codes, ((0, 0), (0, pad)))
+    
+    # 每字节的第i个像素取 codes[:, i::per_byte]，msb 时左移 8 - bpp*(i+1) 位，lsb 时左移 bpp*i 位
+    packed = np.zeros((height, codes.shape[1] // per_byte), dtype=np.uint8)
+    for i in range(per_byte):
+        shift = 8 - bpp * (i + 1) if bit_order == 'msb' else bpp * i
+        packed |= codes[:, i::per_byte].astype(np.uint8) << shift
+    return packed
+
+
+def unpack_rows(rows, bpp, count, bit_order='msb'):
+    """pack_rows 的逆：(行数, 每行字节数) → (行数, count) 的编码数组"""
+    if bpp == 8:
+        return rows[:, :count].copy()
+    if bpp == 1:
+        bits = np.unpackbits(rows, axis=1, bitorder='big' if bit_order == 'msb' else 'little')
+        return bits[:, :count]
+    
+    per_byte = 8 // bpp
+    mask = (1 << bpp) - 1
+    codes = np.empty((rows.shape[0], rows.shape[1] * per_byte), dtype=np.uint8)
+    for i in range(per_byte):
+        shift = 8 - bpp * (i + 1) if bit_order == 'msb' else bpp * i
+        codes[:, i::per_byte] = (rows >> shift) & mask
+    return codes[:, :count]
+
 
 class MatrixConverter:
-    def __init__(self, width, height):
+    def __init__(self, width, height, invert=False, layout=None):
+        """
+        参数:
+            invert: 极性取反，等同于 layout=Layout(invert=True)
+            layout: 数据排列（旋转、镜像、扫描方向、位序、极性），见 Layout；
+                    默认逐行、高位在前、黑=1
+        """
         self.width = width
         self.height = height
+        self.layout = layout if layout is not None else Layout(invert=invert)
+    
+    @property
+    def invert(self):
+        return self.layout.invert
+    
+    def frame_size(self, mode='1bit'):
+        """一帧的数据字节数"""
+        return self.layout.frame_size(self.width, self.height, mode_to_bpp(mode))
+    
+    def _pixels(self, img):
+        """取出图像像素数组，并检查尺寸"""
+        pixels = np.asarray(img)
+        if pixels.shape[:2] != (self.height, self.width):
+            raise ValueError(
+                f"图像尺寸不匹配: {pixels.shape[1]}×{pixels.shape[0]}，"
+                f"期望 {self.width}×{self.height}"
+            )
+        return pixels
+    
+    def pack_1bit(self, img_bw):
+        """打包为1位黑白数据，返回bytes
+        
+        一次完成黑色判定（黑=1）、行尾补齐和打包（默认高位在前），
+        没有逐像素的Python循环。
+        """
+        pixels = self._pixels(img_bw)
+        
+        # 黑色（0）对应位为1；packbits 会把每行补齐到整字节（补0=白）
+        black = pixels == 0
+        return self._pack_codes(black, 1)
     
     def convert_1bit(self, img_bw):
         """转换为1位黑白数据（纯黑白）
@@ -12,26 +221,44 @@ class MatrixConverter:
         8个像素组成1个字节
         
         字节格式：横向8个像素从高位到低位
+        
+        兼容旧接口，返回list；新代码请使用 pack_1bit
         """
-        pixels = np.array(img_bw)
-        buffer = []
+        return list(self.pack_1bit(img_bw))
+
+    def pack_nbit(self, img_gray, bpp, levels=None):
+        """打包为N位灰度数据（bpp = 1/2/4/8），返回bytes
         
-        for y in range(self.height):
-            for x in range(0, self.width, 8):
-                byte_val = 0
-                
-                # 处理8个像素
-                for bit in range(8):
-                    if x + bit < self.width:
-                        pixel = pixels[y, x + bit]
-                        
-                        # 如果是黑色（0），设置对应位为1
-                        if pixel == 0:
-                            byte_val |= (1 << (7 - bit))
-                
-                buffer.append(byte_val)
+        每个像素用bpp位表示，8//bpp 个像素组成1个字节，
+        默认排列下左边的像素在高位（其他排列见 Layout）。行尾不足一个字节时补0。
         
-        return buffer
+        参数:
+            img_gray: 灰度图（0=黑，255=白）
+            bpp: 每像素位数，必须能整除8
+            levels: 灰度映射。None 表示按 2**bpp 级均匀量化；
+                    整数表示按该级数均匀量化（不超过 2**bpp）；
+                    也可以传入256项的查找表，直接给出每个灰度值对应的编码
+        """
+        pixels = self._pixels(img_gray)
+        lut = level_lut(bpp, levels)
+        codes = np.take(lut, pixels)
+        return self._pack_codes(codes, bpp)
+    
+    def _pack_codes(self, codes, bpp):
+        """按 self.layout 把 (高, 宽) 的编码数组排列并打包"""
+        layout = self.layout
+        codes = layout.orient(codes)
+        if layout.scan != 'row':
+            # 按列打包：转置后逐“行”打包即是逐列
+            codes = codes.T
+        packed = pack_rows(codes, bpp, layout.bit_order)
+        if layout.scan == 'page':
+            # 按列打包得到 (列, 页)，转置成逐页输出
+            packed = packed.T
+        packed = np.ascontiguousarray(packed)
+        if layout.invert:
+            np.bitwise_xor(packed, 0xFF, out=packed)
+        return packed.tobytes()
     
     def convert_2bit(self, img_gray):
         """转换为2位灰度数据（4级灰度）
@@ -40,41 +267,109 @@ class MatrixConverter:
         4个像素组成1个字节
         
         字节格式：[像素0(2bit)][像素1(2bit)][像素2(2bit)][像素3(2bit)]
-        """
-        pixels = np.array(img_gray)
-        buffer = []
         
-        for y in range(self.height):
-            for x in range(0, self.width, 4):
-                byte_val = 0
-                
-                # 处理4个像素
-                for i in range(4):
-                    if x + i < self.width:
-                        pixel = pixels[y, x + i]
-                        
-                        # 映射0-255到0-3
-                        gray_level = pixel * 4 // 256
-                        
-                        # 放入字节的对应位置
-                        # 像素0在最高2位，像素3在最低2位
-                        shift = 6 - (i * 2)
-                        byte_val |= (gray_level << shift)
-                
-                buffer.append(byte_val)
-        
-        return buffer
+        兼容旧接口，返回list；新代码请使用 pack_nbit
+        """
+        return list(self.pack_nbit(img_gray, 2))
     
-    def convert(self, img, mode='1bit'):
+    def band_packer(self, mode='1bit', levels=None):
+        """逐条带打包（见 BandPacker）"""
+        return BandPacker(self, mode, levels)
+    
+    @stage
+    def convert(self, img, mode='1bit', levels=None):
         """转换接口
         
         参数:
             img: PIL Image对象
-            mode: '1bit' (黑白) 或 '2bit' (4级灰度)
+            mode: '1bit' (黑白)，'2bit' (4级灰度)，'4bit' (16级灰度)
+                  或 '8bit' (256级灰度)
+            levels: 灰度映射，见 pack_nbit（1bit 模式忽略）
+        
+        返回:
+            bytes 点阵数据
+        """
+        bpp = mode_to_bpp(mode)
+        if bpp == 1:
+            return self.pack_1bit(img)
+        return self.pack_nbit(img, bpp, levels)
+
+class BandPacker:
+    """逐条带打包：图像按水平条带送入，每个条带打包后直接写进整帧数据的对应位置
+    
+    只有打包好的整帧数据（每像素 bpp 位）常驻内存，像素和编码每次只有一个条带。
+    条带的边界在显存方向上对齐到整字节（见 bands），旋转、镜像、按列/分页扫描时
+    条带的数据也不会跨字节；结果与 MatrixConverter.convert 逐位一致。
+    
+    用法示例:
+        packer = converter.band_packer('1bit')
+        for y0, y1 in packer.bands(64):
+            packer.add(y0, pixels[y0:y1])
+        data = packer.result()
+    """
+    
+    def __init__(self, converter, mode='1bit', levels=None):
+        """levels: 灰度映射，见 MatrixConverter.pack_nbit（1bit 模式忽略）"""
+        self.converter = converter
+        self.layout = layout = converter.layout
+        self.bpp = mode_to_bpp(mode)
+        self.lut = None if self.bpp == 1 else level_lut(self.bpp, levels)
+        width, height = converter.width, converter.height
+        # 图像的行在显存中是行（0/180度）还是列（90/270度），以及顺序是否反过来
+        self.across = layout.rotate in (90, 270)
+        self.reverse = layout.orient(np.arange(height)[:, None]).ravel()[0] != 0
+        # 整帧打包结果（分页扫描在 result 中再转置）
+        panel_w, panel_h = layout.panel_size(width, height)
+        if layout.scan == 'row':
+            shape = (panel_h, (panel_w * self.bpp + 7) // 8)
+        else:
+            shape = (panel_w, (panel_h * self.bpp + 7) // 8)
+        self.packed = np.zeros(shape, dtype=np.uint8)
+        # 条带落在整行打包结果上（逐行送入），还是每行中的一段字节
+        self.whole_lines = self.across != (layout.scan == 'row')
+    
+    def bands(self, band_height=64):
+        """从上到下的条带 [(y0, y1), ...]
+        
+        band_height 向上取整到8的倍数；条带边界按显存中的位置对齐，
+        图像顺序反过来（旋转180度、上下镜像等）时第一个条带可能较短
         """
-        if mode == '1bit':
-            return self.convert_1bit(img)
-        elif mode == '2bit':
-            return self.convert_2bit(img)
+        height = self.converter.height
+        band_height = max(8, -(-band_height // 8) * 8)
+        bands = []
+        for p0 in range(0, height, band_height):
+            p1 = min(p0 + band_height, height)
+            bands.append((height - p1, height - p0) if self.reverse else (p0, p1))
+        return sorted(bands)
+    
+    def add(self, y0, pixels):
+        """打包从第 y0 行开始的一个条带（灰度/黑白像素，同 convert 的输入）"""
+        pixels = np.asarray(pixels)
+        height, width = pixels.shape[:2]
+        if width != self.converter.width or not 0 <= y0 <= self.converter.height - height:
+            raise ValueError(
+                f"条带超出图像: 第{y0}行起 {width}×{height}，"
+                f"图像为 {self.converter.width}×{self.converter.height}"
+            )
+        codes = pixels == 0 if self.bpp == 1 else np.take(self.lut, pixels)
+        lines = self.layout.orient(codes)
+        if self.layout.scan != 'row':
+            lines = lines.T
+        packed = pack_rows(lines, self.bpp, self.layout.bit_order)
+        p0 = self.converter.height - y0 - height if self.reverse else y0
+        if self.whole_lines:
+            self.packed[p0:p0 + height] = packed
         else:
-            raise ValueError(f"不支持的模式: {mode}，请使用 '1bit' 或 '2bit'")
\ No newline at end of file
+            per_byte = 8 // self.bpp
+            if p0 % per_byte:
+                raise ValueError(f"条带起点没有对齐到整字节: 第{y0}行（请用 bands() 划分条带）")
+            start = p0 // per_byte
+            self.packed[:, start:start + packed.shape[1]] = packed
+    
+    def result(self):
+        """整帧数据bytes（与 MatrixConverter.convert 相同）"""
+        packed = self.packed.T if self.layout.scan == 'page' else self.packed
+        packed = np.ascontiguousarray(packed)
+        if self.layout.invert:
+            np.bitwise_xor(packed, 0xFF, out=packed)
+        return packed.tobytes()
@@ -0,0 +1,79 @@
+import numpy as np
+from PIL import Image
+from matrix_converter import MODES, Layout, mode_to_bpp, unpack_rows
+
+class MatrixDecoder:
+    """点阵数据还原（MatrixConverter 的逆过程）"""
+
+    def __init__(self, width, height, invert=False, layout=None):
+        """invert / layout: 数据的极性和排列，与 MatrixConverter 的参数一致"""
+        self.width = width
+        self.height = height
+        self.layout = layout if layout is not None else Layout(invert=invert)
+
+    @property
+    def invert(self):
+        return self.layout.invert
+
+    def row_bytes(self, bpp):
+        """每行字节数（行尾补齐到整字节，默认排列）"""
+        return (self.width * bpp + 7) // 8
+
+    def frame_size(self, mode):
+        """一帧的数据字节数"""
+        return self.layout.frame_size(self.width, self.height, mode_to_bpp(mode))
+
+    def unpack(self, data, mode='1bit'):
+        """还原为编码数组 (高, 宽)
+
+        1bit 模式下 1=黑、0=白（与 pack_1bit 一致）；
+        N位模式下为 0 到 2**bpp-1 的灰度编码（0=黑）。
+        数据不足时缺失部分按白色补齐，多余数据被忽略。
+        """
+        bpp = mode_to_bpp(mode)
+        layout = self.layout
+        size = self.frame_size(mode)
+
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+        buf = np.frombuffer(data, dtype=np.uint8)[:size]
+        if layout.invert:
+            buf = buf ^ 0xFF
+        if len(buf) < size:
+            # 1bit 中 0 为白，灰度中全1为白
+            fill = 0x00 if bpp == 1 else 0xFF
+            buf = np.concatenate([buf, np.full(size - len(buf), fill, dtype=np.uint8)])
+
+        # 按 Layout 的逆过程还原：拆包 → 转置回逐行 → 反旋转/镜像
+        width, height = layout.panel_size(self.width, self.height)
+        if layout.scan == 'row':
+            codes = unpack_rows(buf.reshape(height, -1), bpp, width, layout.bit_order)
+        else:
+            if layout.scan == 'page':
+                rows = buf.reshape(-1, width).T
+            else:
+                rows = buf.reshape(width, -1)
+            codes = unpack_rows(rows, bpp, height, layout.bit_order).T
+        return layout.restore(codes)
+
+    def decode(self, data, mode='1bit'):
+        """还原为 0-255 灰度数组 (高, 宽)"""
+        bpp = mode_to_bpp(mode)
+        codes = self.unpack(data, mode)
+        if bpp == 1:
+            # 1为黑色
+            return np.where(codes, 0, 255).astype(np.uint8)
+        # 编码映射回0-255，例如2bit: 0→0, 1→85, 2→170, 3→255
+        scale = 255 // ((1 << bpp) - 1)
+        return (codes * scale).astype(np.uint8)
+
+    def to_image(self, data, mode='1bit'):
+        """还原为PIL灰度图像"""
+        return Image.fromarray(self.decode(data, mode))
+
+    def detect_mode(self, data):
+        """根据数据大小判断模式，无法判断时返回None"""
+        for mode in MODES:
+            if len(data) == self.frame_size(mode):
+                return mode
+        return None
@@ -1,24 +1,198 @@
+import io
+import itertools
+import os
+import config
+import compression
+from delta_encoder import RECT_FIELD_TYPE, RECT_OFFSET_TYPE
+from instrumentation import stage
+
+# 0x00-0xFF 的十六进制文本，避免逐字节格式化
+HEX_TABLE = [f'0x{b:02X}' for b in range(256)]
+
+def _nonempty_frames(frames):
+    """取出第一帧检查序列不为空（空序列会生成长度为0的C数组，不是合法的C），返回原样的迭代器"""
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        raise ValueError("没有任何帧，无法生成多帧C数组")
+    return itertools.chain([first], frames)
+
+
+def _write_durations(f, var_name, durations):
+    """写出每帧显示时长（ms），全部未知时不输出
+
+    GIF的帧时长最长 655350 ms，超出 unsigned short，用 unsigned long（至少32位）
+    """
+    if all(d is None for d in durations):
+        return
+    if max(d or 0 for d in durations) > 0xFFFFFFFF:
+        raise ValueError(f"帧时长 {max(d or 0 for d in durations)} ms 超出 unsigned long 的范围")
+    f.write(f"\nconst unsigned long {var_name}_durations[{len(durations)}] = {{\n")
+    f.write(''.join(f"    {d or 0},\n" for d in durations))
+    f.write("};\n")
+
+
 class OutputGenerator:
+    def __init__(self, bytes_per_line=config.BYTES_PER_LINE):
+        self.bytes_per_line = bytes_per_line
+
+    @stage
+    def write_c_array(self, data, f, var_name="epaper_image", lines_per_chunk=256):
+        """把C语言数组直接写入文件对象
+
+        按块写出（每块 lines_per_chunk 行），内存占用与数据大小无关
+        """
+        size = len(data)
+        f.write(f"// Image size: {size} bytes\n")
+        f.write(f"const unsigned char {var_name}[{size}] = {{\n")
+        self._write_hex_lines(data, f, lines_per_chunk)
+        f.write("};")
+
+    @stage
+    def write_compressed_c_array(self, packed, f, var_name, codec, raw_size):
+        """把压缩后的数据写成C数组，并给出原始大小
+
+        packed 由 compression.compress 得到；固件用 {codec}_decode() 解到
+        {VAR_NAME}_RAW_SIZE 字节的缓冲区
+        """
+        ratio = raw_size / len(packed) if packed else 0.0
+        f.write(f"// Image size: {raw_size} bytes, {codec}: {len(packed)} bytes ({ratio:.1f}:1)\n")
+        f.write(f"#define {var_name.upper()}_RAW_SIZE {raw_size}\n")
+        f.write(f"const unsigned char {var_name}[{len(packed)}] = {{\n")
+        self._write_hex_lines(packed, f)
+        f.write("};")
+
+    def save_decoder_source(self, codec, directory):
+        """在 directory 中写出该压缩方式的参考C解码器，返回文件路径"""
+        path = os.path.join(directory, f"{codec}_decode.c")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(compression.c_decoder_source(codec))
+        return path
+
+    def _write_hex_lines(self, data, f, lines_per_chunk=256):
+        """按行写出数组内容（每行 bytes_per_line 个字节）"""
+        per_line = self.bytes_per_line
+        view = memoryview(data) if not isinstance(data, list) else data
+        chunk = per_line * lines_per_chunk
+        hex_table = HEX_TABLE
+        for start in range(0, len(data), chunk):
+            block = view[start:start + chunk]
+            lines = [
+                "    " + ', '.join([hex_table[b] for b in block[i:i + per_line]]) + ",\n"
+                for i in range(0, len(block), per_line)
+            ]
+            f.write(''.join(lines))
+
+    @stage
+    def write_frames_c_array(self, frames, f, var_name="epaper_frames"):
+        """把多帧数据流式写成一个C数组，后面附帧索引
+
+        参数:
+            frames: 可迭代的 (帧数据, 显示时长ms或None)，逐帧写出，不会全部留在内存里
+        输出:
+            {var_name}[]              所有帧首尾相连
+            {VAR_NAME}_FRAME_COUNT    帧数
+            {var_name}_offsets[N+1]   第i帧位于 offsets[i] 到 offsets[i+1]
+            {var_name}_durations[N]   每帧显示时长（ms，unsigned long），全部未知时不输出
+        返回:
+            帧数
+        没有任何帧时在写出之前抛出 ValueError
+        """
+        frames = _nonempty_frames(frames)
+        offsets = [0]
+        durations = []
+        f.write("// Multi-frame image data\n")
+        f.write(f"const unsigned char {var_name}[] = {{\n")
+        for index, (data, duration) in enumerate(frames):
+            f.write(f"    // frame {index}: {len(data)} bytes\n")
+            self._write_hex_lines(data, f)
+            offsets.append(offsets[-1] + len(data))
+            durations.append(duration)
+        f.write("};\n\n")
+
+        count = len(durations)
+        f.write(f"#define {var_name.upper()}_FRAME_COUNT {count}\n\n")
+        f.write(f"const unsigned long {var_name}_offsets[{count + 1}] = {{\n")
+        f.write(''.join(f"    {offset},\n" for offset in offsets))
+        f.write("};\n")
+        _write_durations(f, var_name, durations)
+        return count
+
+    @stage
+    def write_delta_c_array(self, frames, f, var_name="epaper_delta"):
+        """把局部刷新数据流式写成C数组
+
+        参数:
+            frames: 可迭代的 (更新列表, 显示时长ms或None)，
+                    更新列表为 [((x, y, w, h), 窗口数据), ...]，见 DeltaEncoder
+        输出:
+            {var_name}_data[]            所有窗口数据首尾相连（窗口内逐行）
+            {var_name}_rects[M][4]       每个矩形 {x, y, w, h}（uint16_t）
+            {var_name}_offsets[M]        每个矩形的数据在 data 中的偏移（uint32_t）
+            {var_name}_frames[N+1]       第i帧的矩形为 rects[frames[i]] 到 rects[frames[i+1]]（uint32_t）
+            {var_name}_durations[N]      每帧显示时长（ms，unsigned long），全部未知时不输出
+        返回:
+            (帧数, 数据总字节数)
+        没有任何帧时在写出之前抛出 ValueError；矩形坐标超出 uint16_t 时也抛出 ValueError
+        """
+        frames = _nonempty_frames(frames)
+        field_type, field_bytes = RECT_FIELD_TYPE
+        offset_type = RECT_OFFSET_TYPE[0]
+        field_max = (1 << 8 * field_bytes) - 1
+        rects = []
+        frame_starts = [0]
+        durations = []
+        offset = 0
+        f.write("// Partial refresh data\n")
+        f.write("#include <stdint.h>\n\n")
+        f.write(f"const unsigned char {var_name}_data[] = {{\n")
+        for index, (deltas, duration) in enumerate(frames):
+            f.write(f"    // frame {index}: {len(deltas)} rects\n")
+            for rect, window in deltas:
+                if max(rect) > field_max:
+                    raise ValueError(f"矩形 {rect} 超出 {field_type} 的范围")
+                self._write_hex_lines(window, f)
+                rects.append((*rect, offset))
+                offset += len(window)
+            frame_starts.append(len(rects))
+            durations.append(duration)
+        f.write("};\n\n")
+
+        count = len(durations)
+        f.write(f"#define {var_name.upper()}_FRAME_COUNT {count}\n\n")
+        f.write("// {x, y, w, h}\n")
+        f.write(f"const {field_type} {var_name}_rects[{len(rects)}][4] = {{\n")
+        f.write(''.join("    {%d, %d, %d, %d},\n" % r[:4] for r in rects))
+        f.write("};\n\n")
+        f.write(f"const {offset_type} {var_name}_offsets[{len(rects)}] = {{\n")
+        f.write(''.join(f"    {r[4]},\n" for r in rects))
+        f.write("};\n\n")
+        f.write(f"const uint32_t {var_name}_frames[{count + 1}] = {{\n")
+        f.write(''.join(f"    {start},\n" for start in frame_starts))
+        f.write("};\n")
+        _write_durations(f, var_name, durations)
+        return count, offset
+
     def generate_c_array(self, data, var_name="epaper_image"):
         """生成C语言数组"""
-        output = []
-        output.append(f"// Image size: {len(data)} bytes")
-        output.append(f"const unsigned char {var_name}[{len(data)}] = {{")
-        
-        # 每行16个字节
-        for i in range(0, len(data), 16):
-            line = data[i:i+16]
-            hex_str = ', '.join([f'0x{b:02X}' for b in line])
-            output.append(f"    {hex_str},")
-        
-        output.append("};")
-        return '\n'.join(output)
-    
+        buf = io.StringIO()
+        self.write_c_array(data, buf, var_name)
+        return buf.getvalue()
+
+    def save_c_array(self, data, filename, var_name="epaper_image"):
+        """生成C语言数组文件"""
+        with open(filename, 'w', encoding='utf-8') as f:
+            self.write_c_array(data, f, var_name)
+
+    @stage
     def generate_binary(self, data, filename):
         """生成二进制文件"""
+        # bytes/memoryview 直接写入，旧的list数据才需要转换
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
         with open(filename, 'wb') as f:
-            f.write(bytes(data))
-    
+            f.write(data)
+
     def generate_hex_file(self, data, filename):
         """生成HEX文件（某些墨水屏需要）"""
-        pass
\ No newline at end of file
+        pass
@@ -0,0 +1,106 @@
+"""屏幕型号表：每种墨水屏的尺寸、每像素位数、极性和数据排列
+
+同一张图要发给不同尺寸的屏时，用型号名选择目标，例如:
+    python batch_converter.py photos/ -o out --profiles 2.9,4.2,7.5
+每张源图只解码一次（JPEG 缩小解码时按型号各自的倍数，倍数相同的共用），再分别缩放、抖动、打包到每个型号。
+"""
+from matrix_converter import Layout, mode_to_bpp
+
+
+class PanelProfile:
+    def __init__(self, name, width, height, mode='1bit', layout=None, description=''):
+        """
+        参数:
+            name: 型号名（命令行和界面中使用）
+            width, height: 图像分辨率（按观看方向，横向像素 × 纵向像素）
+            mode: 数据模式 '1bit' / '2bit' / '4bit'
+            layout: 显存排列和极性（见 matrix_converter.Layout），
+                    默认逐行、左边像素在高位、1bit 黑=1 / 灰度 0=黑
+            description: 说明文字
+        """
+        mode_to_bpp(mode)
+        self.name = name
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.layout = layout if layout is not None else Layout()
+        self.description = description
+
+    @property
+    def bpp(self):
+        return mode_to_bpp(self.mode)
+
+    @property
+    def invert(self):
+        """极性是否取反（1bit 白=1，灰度 0=白）"""
+        return self.layout.invert
+
+    @property
+    def levels(self):
+        """灰度级数（1bit 为2）"""
+        return 1 << self.bpp
+
+    @property
+    def frame_size(self):
+        """一帧的数据字节数（按扫描方向补齐到整字节）"""
+        return self.layout.frame_size(self.width, self.height, self.bpp)
+
+    def __repr__(self):
+        layout = '' if self.layout == Layout() else f", layout={self.layout!r}"
+        return f"PanelProfile({self.name!r}, {self.width}, {self.height}, {self.mode!r}{layout})"
+
+
+# 型号名 → PanelProfile
+PANEL_PROFILES = {p.name: p for p in [
+    PanelProfile('1.54', 200, 200, description='1.54寸 黑白'),
+    PanelProfile('2.13', 250, 122, description='2.13寸 黑白'),
+    PanelProfile('2.9', 296, 128, description='2.9寸 黑白'),
+    # 显存为 128×296 竖向（SSD1680 等），横向观看的图顺时针转90°写入
+    PanelProfile('2.9-rot', 296, 128, layout=Layout(rotate=90), description='2.9寸 黑白，竖向显存'),
+    PanelProfile('4.2', 400, 300, description='4.2寸 黑白'),
+    PanelProfile('4.2-gray', 400, 300, '2bit', description='4.2寸 4级灰度'),
+    PanelProfile('7.5', 800, 480, description='7.5寸 黑白'),
+    PanelProfile('13.3', 1600, 1200, description='13.3寸 黑白'),
+    # SSD1306：8行一页、低位在上，点亮=1
+    PanelProfile('oled-128x64', 128, 64,
+                 layout=Layout(scan='page', bit_order='lsb', invert=True),
+                 description='0.96寸 SSD1306 OLED'),
+]}
+
+
+def get_profile(name):
+    """按名称取型号"""
+    if name not in PANEL_PROFILES:
+        raise ValueError(f"未知的屏幕型号: {name}，可选 {' / '.join(PANEL_PROFILES)}")
+    return PANEL_PROFILES[name]
+
+
+def parse_profiles(text):
+    """解析逗号分隔的型号列表，如 '2.9,4.2,7.5'（去重，保持顺序）"""
+    names = [name.strip() for name in text.split(',') if name.strip()]
+    if not names:
+        raise ValueError("没有指定屏幕型号")
+    return [get_profile(name) for name in dict.fromkeys(names)]
+
+
+def find_profile(width, height, mode='1bit'):
+    """按尺寸和模式查找默认排列的型号，找不到时返回None"""
+    for profile in PANEL_PROFILES.values():
+        if (profile.width, profile.height, profile.mode) == (width, height, mode) and profile.layout == Layout():
+            return profile
+    return None
+
+
+def profile_settings(profile, settings):
+    """在转换参数（见 batch_converter.default_settings）上套用型号的尺寸、模式和排列
+
+    返回新的字典，不修改 settings；1bit 型号使用黑白参数，灰度型号使用灰度参数
+    """
+    result = dict(settings)
+    result['width'] = profile.width
+    result['height'] = profile.height
+    result['grayscale'] = profile.bpp > 1
+    if profile.bpp > 1:
+        result['levels'] = profile.levels
+    result['layout'] = profile.layout.to_dict()
+    return result
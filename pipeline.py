@@ -0,0 +1,193 @@
+"""NumPy流水线：缩放后的图像进入一块预分配的 uint8 缓冲，各阶段原地处理直到打包
+
+原来的路径每帧要在 PIL 和 NumPy 之间来回几次（RGB → L → 数组 → 图像 →
+'1'图像 → 再展开成数组），每次都复制、分配。这里每个 Pipeline 持有一块
+(高, 宽) 的缓冲，各阶段用 out= 参数的NumPy运算（比较、移位、查表）原地修改，
+打包前把灰度原地换成编码；只有调用 preview() 时才生成 PIL 图像。
+
+结果与 ImageProcessor + MatrixConverter 逐位一致（色调查找表见 tone_curve，
+复现了 PIL ImageEnhance 的 float32 混合和截断）。缓冲在下一次 run() 时被覆盖。
+
+用法示例:
+    pipeline = Pipeline.from_settings(settings)
+    for frame in frames:
+        data = pipeline.run(processor.resize(frame))
+    pipeline.preview().save('last.png')
+"""
+import numpy as np
+from PIL import Image
+from dithering import dither
+from instrumentation import stage
+from matrix_converter import MatrixConverter, Layout, mode_to_bpp, mode_for_levels
+from tone_curve import ToneCurve, histogram, otsu_threshold
+
+
+def _binarize(buf, mask_fn, *args):
+    """mask_fn(buf, *args) 的布尔结果原地写回缓冲，再换成 0/255"""
+    mask_fn(buf, *args, out=buf.view(np.bool_))
+    np.multiply(buf, 255, out=buf)
+
+
+class Tone:
+    """色调调整（见 tone_curve.ToneCurve），一次查表"""
+
+    def __init__(self, curve):
+        self.curve = curve
+
+    def __call__(self, buf):
+        if not self.curve.identity:
+            self.curve.apply(buf)
+
+
+class Threshold:
+    """二值化：大于阈值为白(255)，否则为黑(0)
+
+    threshold 为 'auto' 时按当前缓冲的直方图用 Otsu 法确定，实际使用的阈值记在 last_threshold
+    """
+
+    def __init__(self, threshold=128):
+        self.threshold = threshold
+        self.last_threshold = None
+
+    def __call__(self, buf):
+        level = otsu_threshold(histogram(buf)) if self.threshold == 'auto' else self.threshold
+        self.last_threshold = level
+        _binarize(buf, np.greater, level)
+
+
+class Quantize:
+    """直接量化到 levels 级，结果为各级的显示灰度（同 convert_to_grayscale）"""
+
+    def __init__(self, levels=4):
+        if not 2 <= levels <= 256:
+            raise ValueError(f"灰度级别必须在2-256之间，不能是{levels}")
+        self.levels = levels
+        codes = np.arange(256) * levels // 256
+        self.lut = (codes * 255 // (levels - 1)).astype(np.uint8)
+
+    def __call__(self, buf):
+        levels = self.levels
+        if levels in (2, 4, 16, 256):
+            # 2的幂级且 levels-1 整除255：量化是右移，显示灰度是乘法，结果与查表相同
+            np.right_shift(buf, 8 - (levels.bit_length() - 1), out=buf)
+            np.multiply(buf, 255 // (levels - 1), out=buf)
+        else:
+            np.take(self.lut, buf, out=buf, mode='wrap')
+
+
+class Dither:
+    """抖动到 levels 级
+
+    method 为 dithering.METHODS 中的算法；None 表示PIL内置的Floyd-Steinberg（只支持2级），
+    此时直接把缓冲包装成PIL图像（不复制）交给PIL处理
+    """
+
+    def __init__(self, levels=2, method=None):
+        if method is None and levels != 2:
+            raise ValueError("PIL内置抖动只支持黑白（2级）")
+        self.levels = levels
+        self.method = method
+
+    def __call__(self, buf):
+        if self.method is None:
+            height, width = buf.shape
+            view = Image.frombuffer('L', (width, height), buf, 'raw', 'L', 0, 1)
+            bw = view.convert('1', dither=Image.FLOYDSTEINBERG)
+            np.multiply(np.asarray(bw), np.uint8(255), out=buf)
+        else:
+            np.copyto(buf, dither(buf, self.levels, self.method))
+
+
+class Pipeline:
+    def __init__(self, width, height, mode='1bit', stages=(), layout=None):
+        """
+        参数:
+            mode: 输出模式，见 matrix_converter.MODES
+            stages: 阶段列表，每个阶段是接收缓冲并原地修改的可调用对象
+            layout: 数据排列，见 matrix_converter.Layout
+        """
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.bpp = mode_to_bpp(mode)
+        self.stages = list(stages)
+        self.converter = MatrixConverter(width, height, layout=layout)
+        self.buffer = np.empty((height, width), dtype=np.uint8)
+        self._packed = False
+
+    @classmethod
+    def from_settings(cls, settings):
+        """按转换参数（见 batch_converter.default_settings）组装，与 process_image 结果一致"""
+        stages = [Tone(ToneCurve.from_settings(settings))]
+        if settings['grayscale']:
+            levels = settings['levels']
+            mode = mode_for_levels(levels)
+            if settings['gray_dither'] is not None:
+                stages.append(Dither(levels, settings['gray_dither']))
+            else:
+                stages.append(Quantize(levels))
+        else:
+            mode = '1bit'
+            if settings['dithering']:
+                stages.append(Dither(2, settings['dither_kernel']))
+            else:
+                stages.append(Threshold(settings['threshold']))
+        return cls(settings['width'], settings['height'], mode, stages,
+                   Layout(**settings['layout']))
+
+    def add(self, stage):
+        """追加一个阶段，返回自身（可以链式调用）"""
+        self.stages.append(stage)
+        return self
+
+    def load(self, img):
+        """把缩放后的图像转成灰度写入缓冲（这是唯一一次 PIL → NumPy 复制）"""
+        if img.size != (self.width, self.height):
+            raise ValueError(f"图像尺寸不匹配: {img.size[0]}×{img.size[1]}，"
+                             f"期望 {self.width}×{self.height}")
+        if img.mode != 'L':
+            img = img.convert('L')
+        np.copyto(self.buffer, np.asarray(img))
+        self._packed = False
+
+    @stage
+    def process(self):
+        """依次执行各阶段（原地修改缓冲）"""
+        for step in self.stages:
+            step(self.buffer)
+
+    @stage
+    def pack(self):
+        """灰度原地换成编码并打包，返回bytes
+
+        编码与 MatrixConverter.convert 相同：1bit 中黑(0)=1，
+        N位为 2**bpp 级均匀量化（即右移 8-bpp 位）
+        """
+        buf = self.buffer
+        if self.bpp == 1:
+            np.equal(buf, 0, out=buf.view(np.bool_))
+        elif self.bpp < 8:
+            np.right_shift(buf, 8 - self.bpp, out=buf)
+        self._packed = True
+        return self.converter._pack_codes(self.buffer, self.bpp)
+
+    def run(self, img):
+        """处理一帧：载入 → 各阶段 → 打包，返回点阵数据bytes"""
+        self.load(img)
+        self.process()
+        return self.pack()
+
+    def preview(self):
+        """当前缓冲的预览图（1bit 为 '1' 模式，灰度为 'L' 模式）
+
+        打包前调用得到各级的显示灰度（与 convert_to_grayscale 相同）；
+        打包后灰度按编码均匀展开，级数不是2的幂时与打包前略有不同
+        """
+        buf = self.buffer
+        if self.bpp == 1:
+            white = buf == 0 if self._packed else buf != 0
+            return Image.fromarray(white)
+        if self._packed:
+            scale = 255 // ((1 << self.bpp) - 1)
+            return Image.fromarray((buf * scale).astype(np.uint8))
+        return Image.fromarray(buf.copy())
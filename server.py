@@ -0,0 +1,474 @@
+"""本地HTTP转换服务：上传图片，返回点阵数据（.bin）、C头文件（.h）或预览图
+
+asyncio 负责收发请求，转换（解码、缩放、抖动、打包）放到固定大小的进程池中执行。
+同时最多有 workers 个转换在运行，另外最多 queue 个在上传或排队等待；
+再多的请求不读请求体，直接返回 503（附 Retry-After），不会无限堆积。默认只监听 127.0.0.1。
+
+接口:
+    POST /convert?format=bin|h|preview&profile=4.2   请求体为图片（原始字节或 multipart 表单）
+        可选参数: profile, levels(灰度级数，1bit 型号也可指定), threshold(0-255 或 auto), dithering(0/1),
+                 dither(抖动算法), brightness, contrast（灰度模式时调整灰度的亮度/对比度）,
+                 gamma, auto_levels(裁剪比例), equalize(0/1), codec(packbits/lzss/auto), var(C变量名)
+        响应头 X-Mode / X-Frame-Bytes / X-Convert-Ms 给出模式、数据大小和转换耗时
+    GET  /metrics    请求数、排队情况、延迟分位数、吞吐量（JSON）
+    GET  /profiles   可用的屏幕型号
+    GET  /health
+
+用法示例:
+    python server.py --port 8750 -j 4 --queue 16
+    curl --data-binary @photo.jpg "http://127.0.0.1:8750/convert?profile=2.9&format=h" -o photo.h
+    curl -F file=@photo.jpg "http://127.0.0.1:8750/convert?format=preview" -o preview.png
+    curl http://127.0.0.1:8750/metrics
+"""
+import argparse
+import asyncio
+import collections
+import email.parser
+import email.policy
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+from PIL import Image
+from batch_converter import c_identifier, default_settings, process_image
+import compression
+from dithering import METHODS
+from image_processor import ImageProcessor
+from output_generator import OutputGenerator
+from panel_profiles import PANEL_PROFILES, get_profile, profile_settings
+from tone_curve import ToneCurve
+
+FORMATS = {
+    'bin': 'application/octet-stream',
+    'h': 'text/x-c; charset=utf-8',
+    'preview': 'image/png',
+}
+
+# 拒绝上传后最多等待多少秒让客户端发完请求体（数据直接丢弃），
+# 以及多久没有新数据就认为已经发完（进程池的子进程可能继承了连接，不一定等得到对方关闭）
+DISCARD_SECONDS = 2.0
+DISCARD_IDLE = 0.1
+
+REASONS = {
+    200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+    408: 'Request Timeout', 411: 'Length Required', 413: 'Payload Too Large',
+    415: 'Unsupported Media Type', 500: 'Internal Server Error',
+    503: 'Service Unavailable', 504: 'Gateway Timeout',
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def request_settings(query, base=None):
+    """按查询参数生成转换参数，参数不合法时抛出 ValueError"""
+    def get(name):
+        values = query.get(name)
+        return values[-1] if values else None
+
+    settings = dict(base or default_settings())
+    if get('profile'):
+        settings = profile_settings(get_profile(get('profile')), settings)
+    if get('levels'):
+        levels = int(get('levels'))
+        if levels not in (2, 4, 16):
+            raise ValueError(f"灰度级别必须是2、4或16，不能是{levels}")
+        settings['grayscale'] = levels > 2
+        settings['levels'] = levels
+    if get('threshold') == 'auto':
+        settings['threshold'] = 'auto'
+    elif get('threshold'):
+        settings['threshold'] = int(get('threshold'))
+        if not 0 <= settings['threshold'] <= 255:
+            raise ValueError("阈值必须在0-255之间")
+    if get('dithering'):
+        settings['dithering'] = get('dithering').lower() in ('1', 'true', 'yes', 'on')
+    if get('dither'):
+        method = None if get('dither') == 'pil' else get('dither')
+        if method is not None and method not in METHODS:
+            raise ValueError(f"不支持的抖动算法: {method}，请使用 pil / {' / '.join(METHODS)}")
+        settings['dither_kernel'] = method
+        if settings['grayscale']:
+            settings['gray_dither'] = method
+    for name in ('brightness', 'contrast', 'gamma'):
+        if get(name):
+            value = float(get(name))
+            if not 0 < value <= 4:
+                raise ValueError(f"{name} 必须在 (0, 4] 之间")
+            key = f'gray_{name}' if settings['grayscale'] and name != 'gamma' else name
+            settings[key] = value
+    if get('auto_levels'):
+        settings['auto_levels'] = float(get('auto_levels'))
+    if get('equalize'):
+        settings['equalize'] = get('equalize').lower() in ('1', 'true', 'yes', 'on')
+    # 检查色调参数（如自动色阶的裁剪比例）
+    ToneCurve.from_settings(settings)
+    return settings
+
+
+def convert_upload(data, settings, output_format='bin', var_name='epaper_image', codec=None):
+    """转换上传的图片字节（在工作进程中执行）
+
+    返回 (响应内容bytes, 信息字典)
+    """
+    start = time.perf_counter()
+    processor = ImageProcessor(settings['width'], settings['height'], resample=settings['resample'])
+    img = processor.open_image(io.BytesIO(data), shrink=settings['fast_load'])
+    img_processed, frame, mode = process_image(img, settings, processor)
+    info = {'mode': mode, 'frame_bytes': len(frame), 'codec': None}
+
+    if output_format == 'preview':
+        buf = io.BytesIO()
+        img_processed.save(buf, 'PNG')
+        body = buf.getvalue()
+    else:
+        packed = frame
+        if codec == 'auto':
+            codec, packed = compression.best_codec(frame)
+            packed = frame if codec is None else packed
+        elif codec is not None:
+            packed = compression.compress(frame, codec)
+        info['codec'] = codec
+        if output_format == 'bin':
+            body = packed
+        else:
+            generator = OutputGenerator()
+            text = io.StringIO()
+            if codec is None:
+                generator.write_c_array(frame, text, var_name)
+            else:
+                generator.write_compressed_c_array(packed, text, var_name, codec, len(frame))
+            body = text.getvalue().encode('utf-8')
+    info['seconds'] = time.perf_counter() - start
+    return body, info
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class Metrics:
+    """请求计数、延迟和吞吐量（只在事件循环线程中修改）"""
+
+    def __init__(self, window=1000, rate_seconds=60):
+        """
+        参数:
+            window: 延迟分位数按最近多少个转换请求计算
+            rate_seconds: 吞吐量按最近多少秒计算
+        """
+        self.started = time.time()
+        self.rate_seconds = rate_seconds
+        self.requests = collections.Counter()     # 路径 → 次数
+        self.statuses = collections.Counter()     # 状态码 → 次数
+        self.rejected = 0
+        self.completed = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        # (完成时间, 总延迟秒, 排队秒, 转换秒)
+        self.conversions = collections.deque(maxlen=window)
+
+    def record_conversion(self, latency, queued, convert, bytes_in, bytes_out):
+        self.conversions.append((time.monotonic(), latency, queued, convert))
+        self.completed += 1
+        self.bytes_in += bytes_in
+        self.bytes_out += bytes_out
+
+    def snapshot(self, running, queued, workers, queue_limit):
+        now = time.monotonic()
+        recent = [c for c in self.conversions if now - c[0] <= self.rate_seconds]
+
+        def latency_ms(column):
+            values = sorted(c[column] for c in self.conversions)
+            result = {}
+            for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+                value = _percentile(values, fraction)
+                result[name] = None if value is None else round(value * 1000, 2)
+            result['max'] = round(values[-1] * 1000, 2) if values else None
+            return result
+
+        return {
+            'uptime_s': round(time.time() - self.started, 1),
+            'workers': workers,
+            'queue_limit': queue_limit,
+            'running': running,
+            'queued': queued,
+            'requests': dict(self.requests),
+            'statuses': {str(k): v for k, v in sorted(self.statuses.items())},
+            'rejected': self.rejected,
+            'conversions': self.completed,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'latency_ms': latency_ms(1),
+            'queue_wait_ms': latency_ms(2),
+            'convert_ms': latency_ms(3),
+            # 最近 rate_seconds 秒内完成的转换数 / 秒（刚启动时按已运行时间计算）
+            'throughput_per_s': round(len(recent) / min(self.rate_seconds,
+                                                        max(time.time() - self.started, 1)), 3),
+            'throughput_window_s': self.rate_seconds,
+        }
+
+
+class ConversionServer:
+    def __init__(self, workers=None, queue=None, max_upload=32 * 1024 * 1024, timeout=60.0,
+                 settings=None):
+        """
+        参数:
+            workers: 转换进程数（默认CPU核数）
+            queue: 进程都忙时最多排队的请求数（默认 workers*4），超出返回503
+            max_upload: 上传大小上限（字节），超出返回413
+            timeout: 读取请求、排队、转换各自的超时秒数（超时分别返回408/504/504）
+            settings: 默认转换参数（默认读取 config.py）
+        """
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_limit = self.workers * 4 if queue is None else queue
+        self.max_upload = max_upload
+        self.timeout = timeout
+        self.settings = settings or default_settings()
+        self.metrics = Metrics()
+        self.pool = None
+        self._slots = None      # 限制同时提交给进程池的任务数
+        self._pending = 0       # 正在转换 + 排队 + 正在上传的请求数
+        self._running = 0
+
+    async def start(self, host='127.0.0.1', port=8750):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = asyncio.Semaphore(self.workers)
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader, writer):
+        """处理一个连接（每个连接一个请求，响应后关闭）"""
+        status, headers, body = 500, {}, b''
+        path = method = None
+        try:
+            method, target, request_headers = await asyncio.wait_for(
+                self.read_head(reader), self.timeout)
+            url = urlsplit(target)
+            path = url.path
+            self.metrics.requests[path] += 1
+            status, headers, body = await self.route(
+                method, url, request_headers, reader)
+        except HTTPError as e:
+            status, headers = e.status, e.headers
+            body = self.json_body({'error': str(e)})
+        except asyncio.TimeoutError:
+            status, body = 408, self.json_body({'error': "读取请求超时"})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            return
+        except Exception as e:
+            status, body = 500, self.json_body({'error': f"{type(e).__name__}: {e}"})
+        self.metrics.statuses[status] += 1
+
+        if 'Content-Type' not in headers:
+            headers['Content-Type'] = 'application/json; charset=utf-8'
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}",
+                f"Content-Length: {len(body)}", "Connection: close"]
+        head += [f"{k}: {v}" for k, v in headers.items()]
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+            if method == 'POST' and status >= 400:
+                # 请求体可能还没读（如503、413）：直接关闭时对方会收到RST而读不到响应，
+                # 先关闭写端，再丢弃对方还在发送的数据（不保存）
+                writer.write_eof()
+                await asyncio.wait_for(self.discard(reader), DISCARD_SECONDS)
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def discard(reader):
+        """丢弃对方还在发送的数据（不保存），对方关闭或 DISCARD_IDLE 秒没有新数据时结束"""
+        while await asyncio.wait_for(reader.read(64 * 1024), DISCARD_IDLE):
+            pass
+
+    async def read_head(self, reader):
+        """读取请求行和请求头，返回 (方法, 目标, {小写头名: 值})"""
+        try:
+            raw = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.LimitOverrunError:
+            raise HTTPError(400, "请求头过长")
+        lines = raw.decode('latin-1').split('\r\n')
+        parts = lines[0].split()
+        if len(parts) != 3:
+            raise HTTPError(400, "无效的请求行")
+        headers = {}
+        for line in lines[1:]:
+            if ':' in line:
+                name, value = line.split(':', 1)
+                headers[name.strip().lower()] = value.strip()
+        return parts[0].upper(), parts[1], headers
+
+    async def read_body(self, reader, headers):
+        if 'content-length' not in headers:
+            raise HTTPError(411, "需要 Content-Length（不支持分块上传）")
+        try:
+            length = int(headers['content-length'])
+        except ValueError:
+            raise HTTPError(400, "无效的 Content-Length")
+        if length > self.max_upload:
+            raise HTTPError(413, f"上传过大: {length} 字节，上限 {self.max_upload} 字节")
+        if length <= 0:
+            raise HTTPError(400, "请求体为空")
+        return await asyncio.wait_for(reader.readexactly(length), self.timeout)
+
+    @staticmethod
+    def json_body(obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+    async def route(self, method, url, headers, reader):
+        """返回 (状态码, 响应头, 响应体)"""
+        if url.path == '/convert':
+            if method != 'POST':
+                raise HTTPError(405, "请使用 POST 上传图片", {'Allow': 'POST'})
+            return await self.convert(url, headers, reader)
+        if method != 'GET':
+            raise HTTPError(405, "只支持 GET", {'Allow': 'GET'})
+        if url.path == '/metrics':
+            return 200, {}, self.json_body(self.metrics.snapshot(
+                self._running, self._pending - self._running, self.workers, self.queue_limit))
+        if url.path == '/profiles':
+            return 200, {}, self.json_body({
+                p.name: {'width': p.width, 'height': p.height, 'mode': p.mode,
+                         'layout': p.layout.to_dict(), 'frame_bytes': p.frame_size,
+                         'description': p.description}
+                for p in PANEL_PROFILES.values()})
+        if url.path == '/health':
+            return 200, {}, self.json_body({'ok': True})
+        raise HTTPError(404, f"没有这个接口: {url.path}")
+
+    async def convert(self, url, headers, reader):
+        query = parse_qs(url.query)
+        output_format = query.get('format', ['bin'])[-1]
+        if output_format not in FORMATS:
+            raise HTTPError(400, f"不支持的输出格式: {output_format}，请使用 {' / '.join(FORMATS)}")
+        codec = query.get('codec', [None])[-1]
+        if codec is not None and codec not in ('auto',) + tuple(compression.CODECS):
+            raise HTTPError(400, f"不支持的压缩方式: {codec}")
+        var_name = c_identifier(query.get('var', ['epaper_image'])[-1])
+        try:
+            settings = request_settings(query, self.settings)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+        # 读请求体之前决定是否接收：正在上传的请求也占名额，并发上传不会先全部读进内存
+        if self._pending >= self.workers + self.queue_limit:
+            self.metrics.rejected += 1
+            raise HTTPError(503, f"服务繁忙: {self._running} 个转换进行中，"
+                                 f"{self._pending - self._running} 个上传或排队",
+                            {'Retry-After': '1'})
+
+        self._pending += 1
+        try:
+            body = await self.read_body(reader, headers)
+            data = self.extract_upload(body, headers.get('content-type', ''))
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                raise HTTPError(504, "排队超时")
+            queued = time.perf_counter() - start
+            self._running += 1
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.pool, convert_upload, data, settings, output_format, var_name, codec)
+            # 进程中的转换无法中断：超时后名额要等它真正结束才释放
+            future.add_done_callback(self._conversion_done)
+            try:
+                result, info = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+            except asyncio.TimeoutError:
+                raise HTTPError(504, f"转换超时（超过 {self.timeout:g} 秒）")
+            except Image.DecompressionBombError as e:
+                # 像素数超过 PIL 的安全上限（不是 ValueError/OSError 的子类）
+                raise HTTPError(413, f"图片过大: {e}")
+            except (ValueError, OSError) as e:
+                # 无法识别的图片（PIL 抛 OSError）或参数问题
+                raise HTTPError(400, f"转换失败: {type(e).__name__}: {e}")
+        finally:
+            self._pending -= 1
+
+        latency = time.perf_counter() - start
+        self.metrics.record_conversion(latency, queued, info['seconds'], len(data), len(result))
+        response_headers = {
+            'Content-Type': FORMATS[output_format],
+            'X-Mode': info['mode'],
+            'X-Frame-Bytes': str(info['frame_bytes']),
+            'X-Convert-Ms': f"{info['seconds'] * 1000:.1f}",
+            'X-Queue-Ms': f"{queued * 1000:.1f}",
+        }
+        if info['codec']:
+            response_headers['X-Codec'] = info['codec']
+        return 200, response_headers, result
+
+    def _conversion_done(self, future):
+        self._running -= 1
+        self._slots.release()
+        if not future.cancelled():
+            future.exception()      # 超时后没人等待结果，取出异常避免告警
+
+    @staticmethod
+    def extract_upload(body, content_type):
+        """取出上传的图片字节：multipart 表单取第一个文件字段，否则整个请求体就是图片"""
+        if not content_type.lower().startswith('multipart/form-data'):
+            return body
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+        for part in message.iter_parts():
+            if part.get_filename() is not None:
+                return part.get_payload(decode=True)
+        raise HTTPError(415, "表单中没有文件字段")
+
+
+async def serve(host, port, **options):
+    server = ConversionServer(**options)
+    listener = await server.start(host, port)
+    print("="*50)
+    print(f"转换服务: http://{host}:{port}  (进程 {server.workers}, 排队上限 {server.queue_limit})")
+    print("  POST /convert?format=bin|h|preview&profile=型号   GET /metrics /profiles /health")
+    print("="*50)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-Paper 图片转换HTTP服务（仅本机）")
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="监听地址（默认127.0.0.1，只接受本机连接）")
+    parser.add_argument('--port', type=int, default=8750, help="端口（默认8750）")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="转换进程数（默认CPU核数）")
+    parser.add_argument('--queue', type=int, default=None,
+                        help="进程都忙时最多排队的请求数（默认进程数×4），超出返回503")
+    parser.add_argument('--max-upload', type=float, default=32, help="上传大小上限，单位MB（默认32）")
+    parser.add_argument('--timeout', type=float, default=60, help="读取请求、排队、转换各自的超时秒数（默认60）")
+    args = parser.parse_args(argv)
+
+    if args.host not in ('127.0.0.1', 'localhost', '::1'):
+        print(f"注意: 监听 {args.host}，其他机器也能访问本服务（没有身份验证）")
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, queue=args.queue,
+                          max_upload=int(args.max_upload * 1024 * 1024), timeout=args.timeout))
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,52 @@
+import os
+import tempfile
+from c_array_reader import find_c_arrays, read_c_array
+
+print("="*50)
+print("C数组回读测试")
+print("="*50)
+
+SOURCE = """// Image size: 6 bytes {不是数组}
+const unsigned char flat[4] = {
+    0x0A, 0x0B, 0x0, 0xFF,
+};
+const unsigned char nested[2][3] = {{0x01,0x02,0x03},{0x04,0x05,0x06}};  // 结尾的 }
+const unsigned char commented[][2] = {
+    {0x10, 0x20},  /* 第一行 } */
+    {0x30, 0x40},  // 第二行 {
+};
+const unsigned char wrong[3] = {0x01, 0x02};
+"""
+
+# (变量名, 应读到的数据；None 表示应抛出 ValueError)
+CASES = [
+    ('flat', bytes([0x0A, 0x0B, 0x00, 0xFF])),
+    ('nested', bytes([1, 2, 3, 4, 5, 6])),
+    ('commented', bytes([0x10, 0x20, 0x30, 0x40])),
+    ('wrong', None),
+]
+
+path = os.path.join(tempfile.mkdtemp(), 'arrays.h')
+with open(path, 'w', encoding='utf-8') as f:
+    f.write(SOURCE)
+
+failed = 0
+arrays = find_c_arrays(path)
+expected = [('flat', 4), ('nested', 6), ('commented', None), ('wrong', 3)]
+ok = arrays == expected
+print(f"  {'✓' if ok else '✗'} 找到数组: {arrays}")
+failed += not ok
+for name, data in CASES:
+    try:
+        result = read_c_array(path, name)
+        ok = result == data
+        detail = result.hex(' ')
+    except ValueError as e:
+        ok = data is None
+        detail = str(e)
+    print(f"  {'✓' if ok else '✗'} {name}: {detail}")
+    failed += not ok
+os.remove(path)
+
+print("\n" + "="*50)
+print("全部通过" if not failed else f"{failed} 项未通过")
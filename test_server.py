@@ -0,0 +1,141 @@
+"""转换服务本机冒烟测试：起一个只有1个进程、不排队的服务，依次检查
+/convert 的 bin / h / preview 三种输出、参数错误返回400、超大图片返回413、进程忙时返回503、转换超时返回504
+
+用法:
+    python test_server.py
+"""
+import asyncio
+import io
+import json
+import sys
+from PIL import Image
+from panel_profiles import get_profile
+from server import ConversionServer
+
+
+def make_image(width, height):
+    """生成一张横向渐变的测试图（PNG字节）"""
+    img = Image.linear_gradient('L').resize((width, height)).convert('RGB')
+    buffer = io.BytesIO()
+    img.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+async def request(port, method, target, body=b''):
+    """发一个请求，返回 (状态码, {小写头名: 值}, 响应体)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = [f"{method} {target} HTTP/1.1", "Host: 127.0.0.1", "Connection: close"]
+    if method == 'POST':
+        head.append(f"Content-Length: {len(body)}")
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    # 按 Content-Length 读响应体：进程池的子进程可能继承了连接，不能等对方关闭
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').rstrip('\r\n').split('\r\n')
+    headers = {}
+    for line in lines[1:]:
+        name, value = line.split(':', 1)
+        headers[name.strip().lower()] = value.strip()
+    payload = await reader.readexactly(int(headers.get('content-length', 0)))
+    writer.close()
+    return int(lines[0].split()[1]), headers, payload
+
+
+def check(ok, message):
+    print(f"  {'✓' if ok else '✗'} {message}")
+    return ok
+
+
+async def run_checks():
+    server = ConversionServer(workers=1, queue=0)
+    listener = await server.start('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    profile = get_profile('2.9')
+    image = make_image(800, 600)
+    results = []
+    try:
+        print("\n[1] /convert 三种输出格式...")
+        status, headers, body = await request(port, 'POST', '/convert?profile=2.9&format=bin', image)
+        results.append(check(status == 200 and len(body) == profile.frame_size
+                             and headers.get('x-frame-bytes') == str(profile.frame_size),
+                             f"bin: {status}, {len(body)} 字节（应为 {profile.frame_size}）"))
+
+        status, headers, body = await request(port, 'POST', '/convert?profile=2.9&format=h&var=smoke', image)
+        results.append(check(status == 200 and b'smoke' in body and body.rstrip().endswith(b';'),
+                             f"h: {status}, {len(body)} 字节"))
+
+        status, headers, body = await request(port, 'POST', '/convert?profile=2.9&format=preview', image)
+        size = Image.open(io.BytesIO(body)).size if status == 200 else None
+        results.append(check(size == (profile.width, profile.height),
+                             f"preview: {status}, 尺寸 {size}"))
+
+        print("\n[2] 参数错误返回400、超大图片返回413...")
+        for target in ('/convert?format=gif', '/convert?codec=zip',
+                       '/convert?profile=no-such-panel', '/convert?threshold=abc'):
+            status, _, body = await request(port, 'POST', target, image)
+            error = json.loads(body).get('error', '') if body else ''
+            results.append(check(status == 400, f"{target}: {status} {error}"))
+        status, _, _ = await request(port, 'POST', '/convert', b'not an image')
+        results.append(check(status == 400, f"无法识别的图片: {status}"))
+        # 像素数超过 PIL 上限的图（1bit PNG，文件很小）
+        bomb = io.BytesIO()
+        Image.new('1', (15000, 15000)).save(bomb, 'PNG')
+        status, _, body = await request(port, 'POST', '/convert', bomb.getvalue())
+        results.append(check(status == 413, f"解压炸弹 ({len(bomb.getvalue())} 字节): {status}"))
+
+        print("\n[3] 进程忙时返回503...")
+        slow = asyncio.ensure_future(request(port, 'POST', '/convert?format=bin&dithering=1',
+                                             make_image(4000, 3000)))
+        while server._pending == 0 and not slow.done():
+            await asyncio.sleep(0.01)
+        status, headers, _ = await request(port, 'POST', '/convert?format=bin', image)
+        results.append(check(status == 503 and 'retry-after' in headers,
+                             f"第二个请求: {status}, Retry-After: {headers.get('retry-after')}"))
+        # 大的上传在读请求体之前就被拒绝，客户端仍能完整收到503
+        status, headers, _ = await request(port, 'POST', '/convert?format=bin',
+                                           bytes(24 * 1024 * 1024))
+        results.append(check(status == 503 and headers.get('connection') == 'close',
+                             f"24 MB 上传: {status}, Connection: {headers.get('connection')}"))
+        status, _, _ = await slow
+        results.append(check(status == 200, f"第一个请求: {status}"))
+
+        status, _, body = await request(port, 'GET', '/metrics')
+        metrics = json.loads(body)
+        results.append(check(metrics['rejected'] == 2, f"/metrics 记录拒绝数: {metrics['rejected']}"))
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        server.close()
+
+    print("\n[4] 转换超时返回504...")
+    server = ConversionServer(workers=1, queue=0, timeout=0.2)
+    listener = await server.start('127.0.0.1', 0)
+    port = listener.sockets[0].getsockname()[1]
+    try:
+        status, _, body = await request(port, 'POST', '/convert?format=bin&dithering=1',
+                                        make_image(4000, 3000))
+        results.append(check(status == 504, f"慢的转换: {status} {json.loads(body).get('error')}"))
+        # 超时后进程里的转换仍在进行，名额要等它结束才释放
+        busy = server._running
+        while server._running:
+            await asyncio.sleep(0.05)
+        results.append(check(busy == 1, f"超时后名额保留到转换结束: 进行中 {busy} → 0"))
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        server.close()
+    return all(results)
+
+
+def main():
+    print("="*50)
+    print("转换服务冒烟测试")
+    print("="*50)
+    ok = asyncio.run(run_checks())
+    print("\n" + "="*50)
+    print("全部通过" if ok else "有检查未通过")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
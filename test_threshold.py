@@ -0,0 +1,42 @@
+import numpy as np
+from PIL import Image
+from batch_converter import default_settings
+from image_processor import ImageProcessor
+from pipeline import Pipeline
+from tiled import TiledPipeline
+from tone_curve import histogram, otsu_threshold
+
+print("="*50)
+print("自动阈值（Otsu）纯色图测试")
+print("="*50)
+
+# 只有一种灰度的图：暗的应整体为黑，亮的（>=128）应整体为白
+CASES = {0: 0, 64: 0, 127: 0, 128: 255, 200: 255, 255: 255}
+
+settings = default_settings()
+settings.update(width=64, height=48, grayscale=False, dithering=False, threshold='auto')
+processor = ImageProcessor(64, 48)
+pipeline = Pipeline.from_settings(settings)
+tiled = TiledPipeline.from_settings(settings, band_height=16)
+
+failed = 0
+for level, expected in CASES.items():
+    img = Image.new('L', (64, 48), level)
+    t = otsu_threshold(histogram(np.asarray(img)))
+    results = {
+        'otsu': 255 if level > t else 0,
+        'ImageProcessor': np.asarray(processor.convert_to_bw(
+            img, threshold='auto', use_dithering=False).convert('L')),
+    }
+    pipeline.run(img)
+    results['Pipeline'] = np.asarray(pipeline.preview().convert('L'))
+    tiled.run(img)
+    results['TiledPipeline'] = np.asarray(tiled.preview().convert('L'))
+    bad = [name for name, out in results.items() if not np.all(np.asarray(out) == expected)]
+    mark = '✗' if bad else '✓'
+    print(f"  {mark} 灰度 {level:3d}: 阈值 {t:3d} → {'白' if expected else '黑'}"
+          + (f"  不一致: {', '.join(bad)}" if bad else ""))
+    failed += bool(bad)
+
+print("\n" + "="*50)
+print("全部通过" if not failed else f"{failed} 项未通过")
@@ -0,0 +1,58 @@
+import time
+import numpy as np
+from PIL import Image
+from batch_converter import default_settings, process_image
+from matrix_converter import Layout
+
+print("="*50)
+print("分条带处理与整帧处理一致性测试")
+print("="*50)
+
+# 带纹理和噪声的测试图（覆盖几种常见的源图模式）
+rng = np.random.default_rng(1)
+base = rng.integers(0, 256, (60, 82, 3), dtype=np.uint8)
+smooth = np.asarray(Image.fromarray(base).resize((1300, 900), Image.BILINEAR))
+rgb = Image.fromarray(smooth // 2 + rng.integers(0, 60, smooth.shape, dtype=np.uint8))
+rgba = rgb.convert('RGBA')
+rgba.putalpha(Image.fromarray(rng.integers(0, 256, (900, 1300), dtype=np.uint8)))
+SOURCES = {'RGB': rgb, 'L': rgb.convert('L'), 'RGBA': rgba,
+           'P': rgb.convert('P', palette=Image.ADAPTIVE), 'same': rgb.crop((0, 0, 400, 300))}
+
+# 黑白: 各类抖动和阈值（含需要整图直方图的自动阈值）；灰度: 量化、误差扩散、有序抖动、色调
+SETTINGS = [dict(dithering=True, dither_kernel=k) for k in (None, 'atkinson', 'bayer4', 'blue_noise')]
+SETTINGS += [dict(dithering=False, threshold=t) for t in (128, 'auto')]
+SETTINGS += [dict(grayscale=True, levels=4, gray_dither=d) for d in (None, 'floyd_steinberg', 'bayer8')]
+SETTINGS += [dict(grayscale=True, levels=16, gray_dither='jjn', auto_levels=0.01, gamma=1.3)]
+LAYOUTS = [Layout(), Layout(rotate=90), Layout(rotate=270, scan='column', invert=True),
+           Layout(scan='page', bit_order='lsb')]
+SIZES = [(400, 300), (250, 122)]
+BAND_HEIGHTS = (8, 40)
+
+start = time.perf_counter()
+total = failed = 0
+for name, img in SOURCES.items():
+    for extra in SETTINGS:
+        # 排列、缩放方式、尺寸的全部组合只对 RGB 测，其他源图模式只测两种排列
+        full = name == 'RGB'
+        for resample in ('exact', 'quality') if full else ('exact',):
+            for layout in LAYOUTS if full else LAYOUTS[:2]:
+                for width, height in SIZES if full else SIZES[:1]:
+                    settings = default_settings()
+                    settings.update(extra, resample=resample, width=width, height=height,
+                                    layout=layout.to_dict(), band_height=None)
+                    preview, data, mode = process_image(img, settings)
+                    for band_height in BAND_HEIGHTS:
+                        total += 1
+                        tiled_preview, tiled_data, tiled_mode = process_image(
+                            img, dict(settings, band_height=band_height))
+                        if (tiled_data == data and tiled_mode == mode
+                                and tiled_preview.mode == preview.mode
+                                and np.array_equal(np.asarray(tiled_preview), np.asarray(preview))):
+                            continue
+                        failed += 1
+                        print(f"  ✗ {name} {extra} {resample} {layout.to_dict()} "
+                              f"{width}×{height} 条带{band_height}行")
+
+print(f"\n共 {total} 组，耗时 {time.perf_counter() - start:.1f} s")
+print("="*50)
+print("全部逐位一致" if not failed else f"{failed} 组不一致")
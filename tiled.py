@@ -0,0 +1,332 @@
+"""分条带处理：超大屏幕、超大源图时按水平条带缩放、调色、抖动、打包
+
+整帧处理（pipeline.Pipeline）要同时持有缩放后的整幅图像、灰度缓冲、抖动的浮点缓冲
+和编码数组；屏幕或源图很大时这些中间结果远大于最终数据。这里按输出的水平条带进行：
+
+  1. 缩放：每个条带只对用得到的源图行做 PIL 的水平缩放，垂直方向用 NumPy 按 PIL 的
+     定点系数计算（见 resample_coeffs），结果与 ImageProcessor.resize 逐位一致
+  2. 色调：需要整图统计（对比度、自动色阶、均衡、自动阈值）时先把各条带缩放一遍、
+     只累计直方图，再生成查找表；否则直接查表
+  3. 抖动：见 dithering.BandDither，误差在条带之间接续
+  4. 打包：见 matrix_converter.BandPacker，条带打包后直接写进整帧数据
+
+结果与 batch_converter.process_image 整帧处理逐位一致（'P'、'1' 以及 8 位多通道以外
+的源图模式见 BandResampler）。
+
+注意源图本身仍由 PIL 完整解码在内存中（JPEG 可以用 ImageProcessor.open_image 的
+shrink 按 DCT 缩小解码）；常驻的只有源图、打包好的整帧数据和预览图
+（黑白每像素1位，灰度每像素1字节），其余中间结果只有一个条带。
+
+用法示例:
+    tiled = TiledPipeline.from_settings(settings, band_height=128)
+    data = tiled.run(img)            # img 为未缩放的原图
+    tiled.preview().save('preview.png')
+"""
+import math
+import numpy as np
+from PIL import Image
+from dithering import BandDither
+from image_processor import ImageProcessor, RESAMPLE_MODES
+from instrumentation import stage
+from matrix_converter import MatrixConverter, Layout, mode_to_bpp, mode_for_levels
+from pipeline import Threshold, Quantize
+from tone_curve import ToneCurve, histogram, remap_histogram, otsu_threshold
+
+PRECISION_BITS = 22      # PIL 缩放系数的定点精度（libImaging/Resample.c）
+VERTICAL_CHUNK = 1 << 22  # 垂直缩放时累加数组的上限（字节）
+
+# 按8位多通道直接缩放的源图模式；RGBA/LA 像 PIL 一样先预乘透明度
+DIRECT_MODES = ('L', 'RGB', 'RGBX', 'CMYK', 'YCbCr', 'LAB', 'HSV', 'RGBa', 'La')
+PREMULTIPLIED = {'RGBA': 'RGBa', 'LA': 'La'}
+
+
+def _sinc(x):
+    if x == 0.0:
+        return 1.0
+    x = x * math.pi
+    return math.sin(x) / x
+
+
+def _lanczos(x):
+    if -3.0 <= x < 3.0:
+        return _sinc(x) * _sinc(x / 3)
+    return 0.0
+
+
+def _bilinear(x):
+    x = abs(x)
+    return 1.0 - x if x < 1.0 else 0.0
+
+
+FILTERS = {
+    Image.LANCZOS: (3.0, _lanczos),
+    Image.BILINEAR: (1.0, _bilinear),
+}
+
+
+def resample_coeffs(in_size, in0, in1, out_size, resample, first, last):
+    """PIL 一维缩放中输出第 first..last-1 个像素的定点系数 [(起始输入像素, [系数, ...]), ...]
+
+    照搬 Resample.c 的 precompute_coeffs 和 normalize_coeffs_8bpc；
+    缩放范围 in0..in1 在 PIL 中以 float32 传入，这里先同样舍入
+    """
+    if resample not in FILTERS:
+        raise ValueError(f"不支持的缩放滤波器: {resample}")
+    support, filt = FILTERS[resample]
+    in0, in1 = float(np.float32(in0)), float(np.float32(in1))
+    scale = filterscale = (in1 - in0) / out_size
+    if filterscale < 1.0:
+        filterscale = 1.0
+    support *= filterscale
+    ss = 1.0 / filterscale
+    one = 1 << PRECISION_BITS
+
+    coeffs = []
+    for xx in range(first, last):
+        center = in0 + (xx + 0.5) * scale
+        xmin = max(int(center - support + 0.5), 0)
+        xmax = min(int(center + support + 0.5), in_size) - xmin
+        weights = [filt((x + xmin - center + 0.5) * ss) for x in range(xmax)]
+        total = 0.0
+        for w in weights:
+            total += w
+        if total != 0.0:
+            weights = [w / total for w in weights]
+        coeffs.append((xmin, [int(w * one - 0.5) if w < 0 else int(w * one + 0.5)
+                              for w in weights]))
+    return coeffs
+
+
+class BandResampler:
+    """按输出条带缩放并裁剪源图，结果与 ImageProcessor.resize 后转灰度逐位一致
+
+    PIL 对 'P'、'1' 模式只用最近邻缩放，这里同样按最近邻取源像素（对应关系用一张
+    行号/列号图让 PIL 算出）。16位、浮点等其余模式每个条带直接用 PIL 按小数范围
+    （box）缩放，缩放系数的舍入与整帧不同，灰度可能有±1的差别。
+    """
+
+    def __init__(self, processor, img):
+        self.img = img
+        self.width, self.height = processor.width, processor.height
+        src_w, src_h = img.size
+        self.new_w, self.new_h = processor.cover_size(img.size)
+        self.left = (self.new_w - self.width) // 2
+        self.top = (self.new_h - self.height) // 2
+        self.resample, reducing_gap = RESAMPLE_MODES[processor.resample]
+
+        self.nearest = img.mode in ('1', 'P')
+        self.copy = (self.new_w, self.new_h) == img.size
+        if img.mode in PREMULTIPLIED:
+            # PIL 对 RGBA/LA 转成预乘模式缩放，不走 reducing_gap
+            self.work_mode = PREMULTIPLIED[img.mode]
+            reducing_gap = None
+        elif img.mode in DIRECT_MODES or self.nearest:
+            self.work_mode = img.mode
+        else:
+            self.work_mode = None
+
+        self.factor = (1, 1)
+        if reducing_gap is not None and not self.nearest:
+            self.factor = (int(src_w / self.new_w / reducing_gap) or 1,
+                           int(src_h / self.new_h / reducing_gap) or 1)
+
+        if self.work_mode is None:
+            reducing_gap = None
+        if self.nearest and not self.copy:
+            self.rows = self._nearest_index(src_h, self.new_h, vertical=True)
+            self.cols = self._nearest_index(src_w, self.new_w, vertical=False)
+            self.cols = self.cols[self.left:self.left + self.width]
+
+    @staticmethod
+    def _nearest_index(size, new_size, vertical):
+        """最近邻缩放时每个输出像素取的源像素序号（用 'I' 模式的序号图交给 PIL 缩放）"""
+        index = np.arange(size, dtype=np.int32)
+        probe = Image.fromarray(index[:, None] if vertical else index[None, :])
+        probe = probe.resize((1, new_size) if vertical else (new_size, 1), Image.NEAREST)
+        return np.asarray(probe).ravel()
+
+    def _source_rows(self, r0, r1):
+        """源图第 r0..r1-1 行（工作模式）"""
+        rows = self.img.crop((0, r0, self.img.width, r1))
+        if self.work_mode and rows.mode != self.work_mode:
+            rows = rows.convert(self.work_mode)
+        return rows
+
+    def _to_gray(self, pixels):
+        """工作模式的像素数组转灰度（与整帧路径先转回原模式、再转 'L' 相同）"""
+        if self.work_mode == 'L':
+            return pixels
+        height, width = pixels.shape[:2]
+        band = Image.frombuffer(self.work_mode, (width, height), np.ascontiguousarray(pixels),
+                                'raw', self.work_mode, 0, 1)
+        if self.img.mode in PREMULTIPLIED:
+            band = band.convert(self.img.mode)
+        return np.array(band.convert('L'))
+
+    def _box_gray(self, y0, y1):
+        """其余模式：裁出用得到的源图行，用 PIL 按对应的小数范围缩放（近似）"""
+        src_w, src_h = self.img.size
+        scale = src_h / self.new_h
+        in0, in1 = (self.top + y0) * scale, (self.top + y1) * scale
+        margin = FILTERS[self.resample][0] * max(scale, 1.0) + 1
+        r0, r1 = max(int(in0 - margin), 0), min(math.ceil(in1 + margin), src_h)
+        band = self._source_rows(r0, r1).resize((self.new_w, y1 - y0), self.resample,
+                                                box=(0, in0 - r0, src_w, in1 - r0))
+        band = band.crop((self.left, 0, self.left + self.width, y1 - y0))
+        return np.array(band.convert('L'))
+
+    def gray(self, y0, y1):
+        """输出第 y0..y1-1 行的灰度 (y1-y0, 宽) uint8"""
+        if self.copy:
+            # 尺寸不变时 PIL 直接复制原图（RGBA 也不经过预乘）
+            rows = self.img.crop((0, self.top + y0, self.img.width, self.top + y1)).convert('L')
+            return np.array(np.asarray(rows)[:, self.left:self.left + self.width])
+        if self.nearest:
+            rows = self.rows[self.top + y0:self.top + y1]
+            r0, r1 = int(rows.min()), int(rows.max()) + 1
+            source = np.asarray(self._source_rows(r0, r1).convert('L'))
+            return source[rows - r0][:, self.cols]
+        if self.work_mode is None:
+            return self._box_gray(y0, y1)
+
+        fx, fy = self.factor
+        src_w, src_h = self.img.size
+        reduced_h = -(-src_h // fy)
+        coeffs = resample_coeffs(reduced_h, 0.0, src_h / fy, self.new_h, self.resample,
+                                 self.top + y0, self.top + y1)
+        r0 = min(start for start, _ in coeffs)
+        r1 = max(start + len(k) for start, k in coeffs)
+
+        # 水平方向交给 PIL（与整帧缩放的第一遍相同）
+        if fx > 1 or fy > 1:
+            source = self._source_rows(r0 * fy, min(r1 * fy, src_h)).reduce((fx, fy))
+            horizontal = source.resize((self.new_w, r1 - r0), self.resample,
+                                       box=(0, 0, src_w / fx, r1 - r0))
+        else:
+            horizontal = self._source_rows(r0, r1).resize((self.new_w, r1 - r0), self.resample)
+        horizontal = np.asarray(horizontal)[:, self.left:self.left + self.width]
+        shape = horizontal.shape
+        horizontal = horizontal.reshape(r1 - r0, -1)
+
+        # 垂直方向逐个抽头累加，与 PIL 一样用32位整数（补齐的抽头系数为0）
+        taps = max(len(k) for _, k in coeffs)
+        kernel = np.zeros((y1 - y0, taps), dtype=np.int32)
+        for i, (_, k) in enumerate(coeffs):
+            kernel[i, :len(k)] = k
+        starts = np.array([start - r0 for start, _ in coeffs])
+        sources = [np.minimum(starts + j, r1 - r0 - 1) for j in range(taps)]
+        result = np.empty((y1 - y0, horizontal.shape[1]), dtype=np.uint8)
+        step = max(1, VERTICAL_CHUNK // (4 * (y1 - y0)))
+        for c0 in range(0, horizontal.shape[1], step):
+            block = horizontal[:, c0:c0 + step]
+            acc = np.full((y1 - y0, block.shape[1]), 1 << (PRECISION_BITS - 1), dtype=np.int32)
+            for j, rows in enumerate(sources):
+                acc += kernel[:, j:j + 1] * block[rows]
+            np.right_shift(acc, PRECISION_BITS, out=acc)
+            np.clip(acc, 0, 255, out=acc)
+            result[:, c0:c0 + step] = acc
+        return self._to_gray(result.reshape((y1 - y0,) + shape[1:]))
+
+
+class TiledPipeline:
+    def __init__(self, width, height, mode='1bit', curve=None, threshold=128, levels=2,
+                 dither=True, method=None, layout=None, resample='exact', band_height=256):
+        """
+        参数:
+            mode: 输出模式，见 matrix_converter.MODES
+            curve: 色调曲线（tone_curve.ToneCurve），None 表示不调整
+            threshold: 不抖动时的二值化阈值（'auto' 为 Otsu 法）；None 表示量化到 levels 级
+            dither: 是否抖动到 levels 级，method 为抖动算法（见 dithering.BandDither）
+            layout: 数据排列，见 matrix_converter.Layout
+            resample: 缩放方式，见 image_processor.RESAMPLE_MODES
+            band_height: 条带高度（行），按屏幕方向对齐到8的倍数；误差扩散每个条带
+                         有约“屏幕宽度”步的固定开销，条带太矮会明显变慢
+        """
+        self.width = width
+        self.height = height
+        self.mode = mode
+        self.bpp = mode_to_bpp(mode)
+        self.curve = curve or ToneCurve()
+        self.threshold = threshold
+        self.levels = levels
+        self.dither = dither
+        self.method = method
+        self.band_height = band_height
+        self.processor = ImageProcessor(width, height, resample=resample)
+        self.converter = MatrixConverter(width, height, layout=layout)
+        self.last_threshold = None
+        self._preview = None
+
+    @classmethod
+    def from_settings(cls, settings, band_height=None):
+        """按转换参数（见 batch_converter.default_settings）组装，与 process_image 结果一致
+
+        band_height 不给出时用 settings['band_height']
+        """
+        band_height = band_height or settings.get('band_height') or 256
+        common = dict(curve=ToneCurve.from_settings(settings), layout=Layout(**settings['layout']),
+                      resample=settings['resample'], band_height=band_height)
+        if settings['grayscale']:
+            levels = settings['levels']
+            return cls(settings['width'], settings['height'], mode_for_levels(levels),
+                       threshold=None, levels=levels, dither=settings['gray_dither'] is not None,
+                       method=settings['gray_dither'], **common)
+        return cls(settings['width'], settings['height'], '1bit',
+                   threshold=settings['threshold'], dither=settings['dithering'],
+                   method=settings['dither_kernel'], **common)
+
+    def _quantizer(self, hist, lut):
+        """本次处理用的量化/抖动阶段（抖动要在条带之间传递误差，每次重新创建）"""
+        if self.dither:
+            return BandDither(self.levels, self.method)
+        if self.threshold is None:
+            return Quantize(self.levels)
+        level = self.threshold
+        if level == 'auto':
+            level = otsu_threshold(remap_histogram(hist, lut) if lut is not None else hist)
+        self.last_threshold = level
+        return Threshold(level)
+
+    @stage
+    def run(self, img):
+        """处理一张未缩放的原图，返回点阵数据bytes（预览见 preview）"""
+        resampler = BandResampler(self.processor, img)
+        packer = self.converter.band_packer(self.mode)
+        bands = packer.bands(self.band_height)
+
+        hist = lut = None
+        if self.curve.needs_histogram or (self.threshold == 'auto' and not self.dither):
+            # 整图统计：先把各条带缩放一遍，只累计直方图
+            hist = np.zeros(256, dtype=np.int64)
+            for y0, y1 in bands:
+                hist += histogram(resampler.gray(y0, y1))
+        if not self.curve.identity:
+            lut = self.curve.lut(hist)
+        quantize = self._quantizer(hist, lut)
+
+        if self.bpp == 1:
+            preview = np.empty((self.height, (self.width + 7) // 8), dtype=np.uint8)
+        else:
+            preview = np.empty((self.height, self.width), dtype=np.uint8)
+        for y0, y1 in bands:
+            buf = resampler.gray(y0, y1)
+            if lut is not None:
+                np.take(lut, buf, out=buf, mode='wrap')
+            if isinstance(quantize, BandDither):
+                buf = quantize(buf)
+            else:
+                quantize(buf)
+            # 预览：黑白按位保存（1=白），灰度保存各级的显示灰度
+            preview[y0:y1] = np.packbits(buf != 0, axis=1) if self.bpp == 1 else buf
+            packer.add(y0, buf)
+        self._preview = preview
+        return packer.result()
+
+    def preview(self):
+        """上一次 run() 的预览图（1bit 为 '1' 模式，灰度为 'L' 模式，同 Pipeline.preview）"""
+        if self._preview is None:
+            raise ValueError("还没有处理过图像")
+        size = (self.width, self.height)
+        if self.bpp == 1:
+            return Image.frombytes('1', size, self._preview.tobytes())
+        return Image.fromarray(self._preview)
@@ -0,0 +1,212 @@
+"""色调曲线：自动色阶、直方图均衡、对比度、亮度、Gamma 合成一张256项查找表
+
+原来的黑白模式先后经过 ImageEnhance.Contrast 和 ImageEnhance.Brightness
+两次整图处理，阈值化又是一次逐像素调用Python函数的 point()。这里所有色调
+调整都只依赖灰度值本身（需要统计量的自动色阶、均衡和对比度只用直方图），
+先在256个灰度值上算好查找表，再对图像做一次查表；阈值或量化也可以并进同一张表。
+
+各项调整的顺序: 自动色阶 → 直方图均衡 → 对比度 → 亮度 → Gamma。
+对比度和亮度的计算与 PIL ImageEnhance 逐位一致（float32 混合后截断，
+对比度以平均灰度 int(mean+0.5) 为中心），只用这两项时结果与原来相同。
+
+用法示例:
+    curve = ToneCurve(contrast=0.8, gamma=1.2, auto_levels=0.005)
+    hist = histogram(gray)
+    lut = curve.lut(hist)
+    threshold = otsu_threshold(remap_histogram(hist, lut))
+"""
+import numpy as np
+
+
+def histogram(gray):
+    """灰度直方图（256项），gray 为 uint8 数组或 'L' 模式图像"""
+    if hasattr(gray, 'histogram'):
+        return np.array(gray.histogram()[:256], dtype=np.int64)
+    return np.bincount(gray.ravel(), minlength=256)
+
+
+def remap_histogram(hist, lut):
+    """经过查找表后的直方图（不用重新统计图像）"""
+    return np.bincount(lut, weights=hist, minlength=256).astype(np.int64)
+
+
+def histogram_mean(hist):
+    """平均灰度（整数求和再除，与 ImageStat 相同）"""
+    return int(np.dot(np.arange(256, dtype=np.int64), hist)) / max(int(hist.sum()), 1)
+
+
+def buffer_mean(buf):
+    """uint8 数组的平均灰度（与 histogram_mean 相同，但比统计直方图快得多）"""
+    # uint32 求和在像素数超过 2**24 时才可能溢出
+    total = buf.sum(dtype=np.uint32 if buf.size < (1 << 24) else np.uint64)
+    return int(total) / buf.size
+
+
+def _clip_trunc(values):
+    """float32 → uint8，<=0 为0、>=255 为255，其余截断（与 PIL 的混合相同）"""
+    return np.where(values <= 0, 0, np.where(values >= 255, 255, values)).astype(np.uint8)
+
+
+def contrast_lut(values, factor, mean):
+    """ImageEnhance.Contrast：与平均灰度 int(mean+0.5) 的纯色图按 factor 混合"""
+    pivot = np.float32(int(mean + 0.5))
+    return _clip_trunc(pivot + np.float32(factor) * (values.astype(np.float32) - pivot))
+
+
+def brightness_lut(values, factor):
+    """ImageEnhance.Brightness：与全黑图按 factor 混合"""
+    return _clip_trunc(np.float32(factor) * values.astype(np.float32))
+
+
+def gamma_lut(values, gamma):
+    """Gamma 校正：gamma > 1 提亮中间调，< 1 压暗"""
+    scaled = (values.astype(np.float64) / 255.0) ** (1.0 / gamma)
+    return np.rint(scaled * 255.0).astype(np.uint8)
+
+
+def auto_levels_lut(hist, clip=0.0):
+    """自动色阶：把直方图两端各去掉 clip 比例的像素后，拉伸到 0-255
+
+    图像只有一种灰度时返回 None（不拉伸）
+    """
+    total = int(hist.sum())
+    cdf = np.cumsum(hist)
+    low = int(np.searchsorted(cdf, clip * total, side='right'))
+    high = int(np.searchsorted(cdf, (1.0 - clip) * total, side='left'))
+    high = min(high, 255)
+    if high <= low:
+        return None
+    values = (np.arange(256, dtype=np.float64) - low) * 255.0 / (high - low)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def equalize_lut(hist):
+    """直方图均衡：按累计分布重新分配灰度
+
+    图像只有一种灰度时返回 None（不均衡）
+    """
+    total = int(hist.sum())
+    cdf = np.cumsum(hist)
+    first = int(cdf[np.flatnonzero(hist)[0]]) if total else 0
+    if total <= first:
+        return None
+    values = (cdf - first) * 255.0 / (total - first)
+    return np.clip(np.rint(values), 0, 255).astype(np.uint8)
+
+
+def otsu_threshold(hist):
+    """Otsu 自动阈值：使两类之间方差最大的分界 t（灰度 > t 为白）"""
+    hist = np.asarray(hist, dtype=np.float64)
+    total = hist.sum()
+    if total == 0:
+        return 128
+    levels = np.arange(256, dtype=np.float64)
+    weight = np.cumsum(hist)                 # 暗类像素数
+    weighted = np.cumsum(hist * levels)      # 暗类灰度和
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (weighted[-1] * weight - weighted * total) ** 2 / (weight * (total - weight))
+    between[~np.isfinite(between)] = 0
+    if not between.any():
+        # 只有一种灰度：没有可分的两类，按它在128的哪一侧整体判为白或黑
+        # （灰度 > t 为白，所以亮的一侧要返回 level-1）
+        level = int(np.flatnonzero(hist)[0])
+        return level - 1 if level >= 128 else level
+    return int(np.argmax(between))
+
+
+class ToneCurve:
+    def __init__(self, brightness=1.0, contrast=1.0, gamma=1.0, auto_levels=None, equalize=False):
+        """
+        参数:
+            brightness: 亮度（1.0 不变，越小越暗），同 ImageEnhance.Brightness
+            contrast: 对比度（1.0 不变，小于1降低），同 ImageEnhance.Contrast
+            gamma: Gamma（1.0 不变，大于1提亮中间调）
+            auto_levels: 自动色阶两端各裁掉的像素比例（如0.005），None 表示不做
+            equalize: 是否做直方图均衡
+        """
+        if gamma <= 0:
+            raise ValueError(f"Gamma 必须大于0，不能是{gamma}")
+        if auto_levels is not None and not 0 <= auto_levels < 0.5:
+            raise ValueError(f"自动色阶的裁剪比例必须在0-0.5之间，不能是{auto_levels}")
+        self.brightness = brightness
+        self.contrast = contrast
+        self.gamma = gamma
+        self.auto_levels = auto_levels
+        self.equalize = equalize
+
+    @classmethod
+    def from_settings(cls, settings, grayscale=None):
+        """按转换参数组装（见 batch_converter.default_settings）
+
+        灰度模式使用 gray_brightness / gray_contrast；黑白模式不抖动（阈值化）时
+        与原来一样不做亮度/对比度调整
+        """
+        grayscale = settings['grayscale'] if grayscale is None else grayscale
+        shared = dict(gamma=settings['gamma'], auto_levels=settings['auto_levels'],
+                      equalize=settings['equalize'])
+        if grayscale:
+            return cls(settings['gray_brightness'], settings['gray_contrast'], **shared)
+        if settings['dithering']:
+            return cls(settings['brightness'], settings['contrast'], **shared)
+        return cls(**shared)
+
+    @property
+    def identity(self):
+        """是否不做任何调整"""
+        return (self.brightness == 1.0 and self.contrast == 1.0 and self.gamma == 1.0
+                and self.auto_levels is None and not self.equalize)
+
+    @property
+    def needs_histogram(self):
+        """查找表是否依赖图像的直方图"""
+        return self.contrast != 1.0 or self.auto_levels is not None or self.equalize
+
+    def params(self):
+        return (self.brightness, self.contrast, self.gamma, self.auto_levels, self.equalize)
+
+    def lut(self, hist=None, mean=None):
+        """合成的256项查找表（uint8）
+
+        needs_histogram 时必须给出原图的直方图；只用到对比度时也可以只给原图的平均灰度
+        """
+        histogram_steps = self.auto_levels is not None or self.equalize
+        if self.needs_histogram and hist is None and (histogram_steps or mean is None):
+            raise ValueError("对比度、自动色阶和直方图均衡需要图像的直方图")
+        lut = np.arange(256, dtype=np.uint8)
+
+        def compose(step):
+            # 后一步作用在前一步的输出上: 新表[v] = step[旧表[v]]
+            return lut if step is None else step[lut]
+
+        if self.auto_levels is not None:
+            lut = compose(auto_levels_lut(remap_histogram(hist, lut), self.auto_levels))
+        if self.equalize:
+            lut = compose(equalize_lut(remap_histogram(hist, lut)))
+        if self.contrast != 1.0:
+            if hist is not None:
+                mean = histogram_mean(remap_histogram(hist, lut))
+            lut = compose(contrast_lut(np.arange(256), self.contrast, mean))
+        if self.brightness != 1.0:
+            lut = compose(brightness_lut(np.arange(256), self.brightness))
+        if self.gamma != 1.0:
+            lut = compose(gamma_lut(np.arange(256), self.gamma))
+        return lut
+
+    def apply(self, buf, hist=None):
+        """原地调整 uint8 灰度数组，返回使用的查找表"""
+        mean = None
+        if hist is None and self.needs_histogram:
+            if self.auto_levels is None and not self.equalize:
+                mean = buffer_mean(buf)
+            else:
+                hist = histogram(buf)
+        lut = self.lut(hist, mean)
+        # 索引是 uint8，不会越界；mode='wrap' 省去越界检查
+        np.take(lut, buf, out=buf, mode='wrap')
+        return lut
+
+    def __repr__(self):
+        names = ('brightness', 'contrast', 'gamma', 'auto_levels', 'equalize')
+        defaults = (1.0, 1.0, 1.0, None, False)
+        parts = [f"{n}={v!r}" for n, v, d in zip(names, self.params(), defaults) if v != d]
+        return f"ToneCurve({', '.join(parts)})"
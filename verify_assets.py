@@ -0,0 +1,318 @@
+"""批量验证导出的点阵数据：回读 .h / .bin，与预览图逐位比对，并计算与原图的 PSNR/SSIM
+
+每个数据文件（名称.h / 名称.bin）与 batch_converter 同时写出的 名称_preview.png 配对:
+    1. 读取数据（压缩的 .h 按文件头注释自动解压，压缩的 .bin 用 --codec 指定或自动尝试）
+    2. 按预览图的尺寸和数据大小确定模式，把预览图重新打包，与数据逐字节比对；
+       不一致时统计不同的像素数
+    3. 给出 --sources 时找到同名原图，按该型号转换时的方式解码（同样的 FAST_LOAD
+       缩小解码倍数）和缩放，与回读的图像计算 PSNR、SSIM 和感知相似度（模糊后的SSIM，
+       见 quality_metrics）
+排列和极性按所在子目录的型号名确定（batch_converter --profiles 的输出结构），
+也可以用 --profile 指定。有任何数据不一致或低于给定指标时返回1，可以直接放进CI。
+
+用法示例:
+    python verify_assets.py out/
+    python verify_assets.py out/ --sources photos/ --report report.csv
+    python verify_assets.py out/ --sources photos/ --min-psnr 8 --min-perceptual 0.9
+"""
+import argparse
+import csv
+import glob
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+import compression
+import config
+from batch_converter import IMAGE_EXTENSIONS, default_settings
+from c_array_reader import read_c_array
+from image_processor import ImageProcessor
+from matrix_converter import MODES, Layout, MatrixConverter
+from matrix_decoder import MatrixDecoder
+from panel_profiles import PANEL_PROFILES, get_profile, profile_settings
+from quality_metrics import perceptual_score, psnr, ssim
+
+DATA_EXTENSIONS = ('.h', '.bin')
+PREVIEW_SUFFIX = '_preview.png'
+
+# 压缩的 .h 文件头: // Image size: 15000 bytes, lzss: 14152 bytes (1.1:1)
+COMPRESSED_HEADER_RE = re.compile(rb'//\s*Image size:\s*(\d+)\s*bytes,\s*(\w+):')
+
+# 报告的列
+COLUMNS = ('asset', 'profile', 'mode', 'codec', 'bytes', 'status', 'bit_exact',
+           'diff_pixels', 'psnr', 'ssim', 'perceptual', 'source', 'error')
+
+
+def find_assets(inputs):
+    """收集数据文件（目录递归搜索），返回排序后的路径列表"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for ext in DATA_EXTENSIONS:
+                paths.update(glob.glob(os.path.join(item, '**', '*' + ext), recursive=True))
+        else:
+            paths.update(p for p in glob.glob(item) if p.lower().endswith(DATA_EXTENSIONS))
+    return sorted(paths)
+
+
+def index_sources(directories):
+    """原图目录 → {小写文件名(不含扩展名): 路径}"""
+    index = {}
+    for directory in directories:
+        for path in sorted(glob.glob(os.path.join(directory, '**', '*'), recursive=True)):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            if ext.lower() in IMAGE_EXTENSIONS:
+                index.setdefault(stem.lower(), path)
+    return index
+
+
+def asset_profile(path, profile=None):
+    """数据文件对应的型号：指定的型号，或所在子目录名对应的型号，都没有时为None"""
+    if profile is not None:
+        return profile
+    return PANEL_PROFILES.get(os.path.basename(os.path.dirname(os.path.abspath(path))))
+
+
+def _header_codec(path):
+    """压缩的 .h 文件头中的 (压缩方式, 原始大小)，不是压缩格式时返回None"""
+    with open(path, 'rb') as f:
+        match = COMPRESSED_HEADER_RE.match(f.readline())
+    return (match.group(2).decode(), int(match.group(1))) if match else None
+
+
+def read_asset(path, codec=None, frame_sizes=()):
+    """读取数据文件，返回 (原始点阵数据, 压缩方式或None)
+
+    .h 的压缩方式和原始大小从文件头注释得到；.bin 没有文件头，按以下顺序确定:
+    给出的 codec → 同名 .h 的文件头（--format both 时两者压缩方式相同）→
+    大小正好是一帧（frame_sizes）时不压缩 → 依次尝试各种压缩方式，完整解压后
+    正好一帧才算（解压垃圾数据几乎不可能恰好得到这个长度）
+    """
+    if path.lower().endswith('.h'):
+        data = read_c_array(path)
+        header = _header_codec(path)
+        if header:
+            return compression.decompress(data, header[0], header[1]), header[0]
+        return data, None
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    if codec is None:
+        sibling = os.path.splitext(path)[0] + '.h'
+        header = _header_codec(sibling) if os.path.exists(sibling) else None
+        codec = header[0] if header else None
+    if codec is not None:
+        return compression.decompress(data, codec), codec
+    if len(data) in frame_sizes:
+        return data, None
+    for name in compression.CODECS:
+        raw = compression.decompress(data, name)
+        if len(raw) in frame_sizes:
+            return raw, name
+    return data, None
+
+
+def preview_codes(preview, mode, layout):
+    """把预览图重新打包成点阵数据（与转换时的打包相同）"""
+    return MatrixConverter(preview.size[0], preview.size[1], layout=layout).convert(preview, mode)
+
+
+def verify_asset(path, profile=None, sources=None, settings=None, codec=None):
+    """验证一个数据文件，返回报告行（字典，键见 COLUMNS），出错时不抛异常
+
+    status: 'ok' / 'mismatch'（与预览不一致）/ 'no_preview' / 'error'
+    settings 为转换时的参数（默认 batch_converter.default_settings），原图按其中的
+    FAST_LOAD 和缩放方式、以该型号的尺寸解码和缩放，与转换时用的是同一张参考图
+    """
+    row = dict.fromkeys(COLUMNS)
+    row['asset'] = path
+    try:
+        profile = asset_profile(path, profile)
+        row['profile'] = profile.name if profile else None
+        layout = profile.layout if profile else Layout()
+        base = os.path.splitext(path)[0]
+        preview_path = base + PREVIEW_SUFFIX
+        preview = Image.open(preview_path) if os.path.exists(preview_path) else None
+        if preview is not None:
+            width, height = preview.size
+        elif profile is not None:
+            width, height = profile.width, profile.height
+        else:
+            width, height = config.EPAPER_WIDTH, config.EPAPER_HEIGHT
+
+        decoder = MatrixDecoder(width, height, layout=layout)
+        if preview is not None and preview.mode == '1':
+            candidates = ['1bit']
+        else:
+            candidates = [m for m in MODES if m != '1bit' or preview is None]
+        data, row['codec'] = read_asset(path, codec, [decoder.frame_size(m) for m in candidates])
+        row['bytes'] = len(data)
+        mode = next((m for m in candidates if decoder.frame_size(m) == len(data)), None)
+        if mode is None:
+            expected = ' / '.join(f"{decoder.frame_size(m)}({m})" for m in candidates)
+            raise ValueError(f"数据大小 {len(data)} 字节与 {width}×{height} 不符，应为 {expected}")
+        row['mode'] = mode
+
+        restored = decoder.decode(data, mode)
+        if preview is None:
+            row['status'] = 'no_preview'
+        else:
+            expected = preview_codes(preview, mode, layout)
+            row['bit_exact'] = expected == data
+            if row['bit_exact']:
+                row['diff_pixels'] = 0
+            else:
+                # 在像素上统计差异（排列不同的字节不好直接解读）
+                diff = decoder.unpack(data, mode) != decoder.unpack(expected, mode)
+                row['diff_pixels'] = int(np.count_nonzero(diff))
+            row['status'] = 'ok' if row['bit_exact'] else 'mismatch'
+
+        source = (sources or {}).get(_source_stem(base))
+        if source is not None:
+            row['source'] = source
+            # 与 batch_converter.convert_file 中该目标的解码相同：按型号套用参数，
+            # 用目标自己的 ImageProcessor（同样的缩小解码倍数和缩放方式）打开、缩放原图
+            target = dict(settings or default_settings(), width=width, height=height)
+            if profile is not None:
+                target = profile_settings(profile, target)
+            processor = ImageProcessor(target['width'], target['height'],
+                                       resample=target['resample'])
+            img = processor.open_image(source, shrink=target['fast_load'])
+            reference = np.asarray(processor.resize(img).convert('L'))
+            row['psnr'] = round(psnr(restored, reference), 3)
+            row['ssim'] = round(ssim(restored, reference), 5)
+            row['perceptual'] = round(perceptual_score(restored, reference), 5)
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _source_stem(base):
+    """数据文件名 → 原图名（小写，不含扩展名）"""
+    return os.path.basename(base).lower()
+
+
+def failures(rows, min_psnr=None, min_perceptual=None):
+    """不合格的行及原因: [(行, 原因), ...]"""
+    result = []
+    for row in rows:
+        if row['status'] == 'error':
+            result.append((row, row['error']))
+        elif row['status'] == 'mismatch':
+            result.append((row, f"与预览不一致（{row['diff_pixels']} 个像素不同）"))
+        elif min_psnr is not None and row['psnr'] is not None and row['psnr'] < min_psnr:
+            result.append((row, f"PSNR {row['psnr']:.2f} dB 低于 {min_psnr}"))
+        elif (min_perceptual is not None and row['perceptual'] is not None
+              and row['perceptual'] < min_perceptual):
+            result.append((row, f"感知相似度 {row['perceptual']:.4f} 低于 {min_perceptual}"))
+    return result
+
+
+def write_report(rows, path):
+    """按扩展名写出 CSV 或 JSON 报告"""
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+def describe_row(row):
+    """一行报告的说明文字"""
+    if row['status'] == 'error':
+        return row['error']
+    text = f"{row['mode']} {row['bytes']} 字节"
+    if row['codec']:
+        text += f" ({row['codec']})"
+    if row['status'] == 'no_preview':
+        text += ", 无预览图"
+    elif row['bit_exact']:
+        text += ", 与预览一致"
+    else:
+        text += f", 与预览不一致（{row['diff_pixels']} 个像素）"
+    if row['psnr'] is not None:
+        text += f", PSNR {row['psnr']:.2f} dB, SSIM {row['ssim']:.4f}, 感知 {row['perceptual']:.4f}"
+    return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="E-Paper 点阵数据批量验证")
+    parser.add_argument('inputs', nargs='+', help="数据文件（.h/.bin）、目录或通配符")
+    parser.add_argument('--sources', action='append', default=[],
+                        help="原图目录（按文件名匹配），给出时计算 PSNR/SSIM；可以多次指定")
+    parser.add_argument('--profile', help="屏幕型号（默认按子目录名判断，否则为默认排列）")
+    parser.add_argument('--codec', choices=tuple(compression.CODECS),
+                        help=".bin 的压缩方式（默认按大小自动判断）")
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help="工作进程数（默认CPU核数）")
+    parser.add_argument('--report', help="报告文件（.csv 或 .json）")
+    parser.add_argument('--min-psnr', type=float, help="PSNR 低于该值（dB）算不合格")
+    parser.add_argument('--min-perceptual', type=float,
+                        help="感知相似度（模糊后的SSIM）低于该值算不合格")
+    parser.add_argument('--require-preview', action='store_true',
+                        help="没有预览图的数据文件也算不合格")
+    args = parser.parse_args(argv)
+
+    try:
+        profile = get_profile(args.profile) if args.profile else None
+    except ValueError as e:
+        print(f"✗ {e}")
+        return 1
+    paths = find_assets(args.inputs)
+    if not paths:
+        print("✗ 没有找到数据文件")
+        return 1
+    sources = index_sources(args.sources)
+
+    print("="*50)
+    print(f"验证 {len(paths)} 个数据文件" + (f"（原图 {len(sources)} 张）" if args.sources else ""))
+    print("="*50)
+    start = time.perf_counter()
+    jobs = (paths, [profile] * len(paths), [sources] * len(paths),
+            [None] * len(paths), [args.codec] * len(paths))
+    if len(paths) < 4 or args.workers == 1:
+        rows = list(map(verify_asset, *jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            rows = list(pool.map(verify_asset, *jobs, chunksize=8))
+    elapsed = time.perf_counter() - start
+
+    failed = failures(rows, args.min_psnr, args.min_perceptual)
+    if args.require_preview:
+        failed += [(row, "没有预览图") for row in rows if row['status'] == 'no_preview']
+    failed_assets = {row['asset'] for row, _ in failed}
+    for i, row in enumerate(rows, 1):
+        mark = '✗' if row['asset'] in failed_assets else '✓'
+        print(f"[{i}/{len(rows)}] {mark} {row['asset']}: {describe_row(row)}")
+
+    print("\n" + "="*50)
+    print(f"通过: {len(rows) - len(failed_assets)}  不合格: {len(failed_assets)}  "
+          f"耗时: {elapsed:.2f} s")
+    measured = [row for row in rows if row['psnr'] is not None]
+    if measured:
+        # 完全相同的图 PSNR 为 inf，不计入平均
+        finite = [r['psnr'] for r in measured if np.isfinite(r['psnr'])]
+        print(f"平均 PSNR {np.mean(finite) if finite else float('inf'):.2f} dB, "
+              f"SSIM {np.mean([r['ssim'] for r in measured]):.4f}, "
+              f"感知 {np.mean([r['perceptual'] for r in measured]):.4f} ({len(measured)} 个有原图)")
+    if failed:
+        print("\n不合格:")
+        for row, reason in failed:
+            print(f"  {row['asset']}: {reason}")
+    print("="*50)
+    if args.report:
+        write_report(rows, args.report)
+        print(f"报告已写入 {args.report}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())